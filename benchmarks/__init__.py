@@ -0,0 +1,10 @@
+"""
+    Benchmarks for Logitrack's performance sensitive code paths.
+
+    Each benchmark module can be run from the project root, for example:
+
+        python3 -m benchmarks.bench_shipment_close
+
+    Benchmarks run against a throwaway test database, created & destroyed
+    the same way as for `python3 manage.py test`.
+"""
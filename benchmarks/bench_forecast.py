@@ -0,0 +1,86 @@
+"""
+    Measures how long the demand forecasts take for a company with many
+    items (see inventory/forecasting.py).
+
+    The forecasting functions are first timed on a synthetic demand array of
+    --skus items by --days days, without a database. forecast_company is then
+    timed end to end (loading the shipment history, forecasting and saving
+    the reorder suggestions) against a warehouse of --db-items items seeded
+    in a throwaway test database.
+
+    Usage:
+        python3 -m benchmarks.bench_forecast [--skus 100000] [--days 730] [--db-items 2000]
+"""
+import argparse
+
+from benchmarks.utils import setup_django, benchmark_database, timer
+
+
+def time_arrays(skus, days, seed):
+    """ Times each forecasting step over a random (skus x days) demand array """
+    import numpy as np
+    from inventory.forecasting import exponential_smoothing, moving_average, reorder_points
+
+    results = {}
+    rng = np.random.default_rng(seed)
+    with timer(results, 'generate'):
+        quantities = rng.poisson(0.5, size=(skus, days)).astype(np.float32)
+
+    with timer(results, 'moving_average'):
+        moving_average(quantities, 28)
+    with timer(results, 'exponential_smoothing'):
+        daily_demand = exponential_smoothing(quantities, 0.2)
+    with timer(results, 'demand_std'):
+        demand_std = quantities[:, -28:].std(axis=1)
+    with timer(results, 'reorder_points'):
+        reorder_points(daily_demand, demand_std, 7, 0.95)
+
+    print("Forecasting %s items x %s days (%.0f MB):" % (skus, days, quantities.nbytes / 2 ** 20))
+    for key in ('moving_average', 'exponential_smoothing', 'demand_std', 'reorder_points'):
+        print("  %-22s %8.3fs" % (key, results[key]))
+
+
+def time_database(items, shipments, seed):
+    """ Times forecast_company against a seeded warehouse """
+    from inventory.forecasting import forecast_company
+    from inventory.models import Company
+    from inventory.seeding import WarehouseSeeder
+
+    WarehouseSeeder(
+        companies=1,
+        items_per_company=items,
+        shipments_per_company=shipments,
+        lines_per_shipment=20,
+        shipped_ratio=0.9,
+        seed=seed,
+    ).run()
+    company = Company.objects.get()
+
+    results = {}
+    with timer(results, 'forecast_company'):
+        suggestions = forecast_company(company)
+
+    print("forecast_company: %s items, %s shipments: %.3fs, %s to reorder" % (
+        items, shipments, results['forecast_company'],
+        sum(1 for suggestion in suggestions if suggestion.suggested_quantity),
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--skus', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--db-items', type=int, default=2000)
+    parser.add_argument('--db-shipments', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    time_arrays(args.skus, args.days, args.seed)
+
+    with benchmark_database():
+        time_database(args.db_items, args.db_shipments, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+    Measures the packing quality of the packing planner (see
+    inventory/packing.py) against its running time, on random shipments of
+    increasing size.
+
+    Each shipment is packed with first-fit decreasing & downsizing (the
+    planner's default), first-fit decreasing alone, and plain first-fit. For
+    each, the time, the containers used and their fill rate are reported,
+    along with a lower bound of the number of containers (the units' total
+    volume or weight over the largest container's). The time of a cached
+    plan (plan_shipment) is then measured against a test database.
+
+    Usage:
+        python3 -m benchmarks.bench_packing [--units 10 100 1000] [--skus 20] [--seed 0]
+"""
+import argparse
+import math
+import random
+
+from benchmarks.utils import setup_django, benchmark_database, timer
+
+
+STRATEGIES = [
+    ('ffd+downsize', {'decreasing': True, 'downsize': True}),
+    ('ffd', {'decreasing': True, 'downsize': False}),
+    ('first-fit', {'decreasing': False, 'downsize': False}),
+]
+
+
+def random_skus(rand, count):
+    """ Returns (dimensions in m, weight in kg) pairs, from small parts to bulky items """
+    return [
+        (
+            (rand.uniform(0.02, 0.6), rand.uniform(0.02, 0.5), rand.uniform(0.02, 0.4)),
+            rand.uniform(0.05, 8),
+        )
+        for i in range(count)
+    ]
+
+
+def lower_bound(unit_list, container_types):
+    """ The fewest containers the units could fit in, by volume & weight alone """
+    largest_volume = max(container_type.volume for container_type in container_types)
+    largest_weight = max(container_type.max_weight for container_type in container_types)
+    return max(
+        math.ceil(sum(unit.volume for unit in unit_list) / largest_volume),
+        math.ceil(sum(unit.weight for unit in unit_list) / largest_weight),
+    )
+
+
+def compare_strategies(sizes, sku_count, seed):
+    from inventory.packing import Unit, get_container_types, pack
+
+    container_types = get_container_types()
+    rand = random.Random(seed)
+    skus = [Unit("SKU-%s" % i, dimensions, weight) for i, (dimensions, weight) in enumerate(random_skus(rand, sku_count))]
+
+    print("%8s  %-14s %10s %11s %7s %12s" % ('units', 'strategy', 'time (ms)', 'containers', 'fill', 'lower bound'))
+    for size in sizes:
+        unit_list = [rand.choice(skus) for i in range(size)]
+        bound = lower_bound(unit_list, container_types)
+        for name, options in STRATEGIES:
+            plan = pack(unit_list, container_types, **options)
+            print("%8s  %-14s %10.1f %11s %6.1f%% %12s" % (
+                size, name, plan.duration * 1000, len(plan.containers), plan.fill_rate * 100, bound
+            ))
+
+
+def time_cached_plan(size, sku_count, seed):
+    """ Times plan_shipment on a shipment of size units, uncached then cached """
+    from django.core.cache import cache
+    from django.utils import timezone
+    from inventory.models import Company, Item, Shipment, ShipmentItem
+    from inventory.packing import plan_shipment
+
+    rand = random.Random(seed)
+    company = Company.objects.create(name="Packing benchmark")
+    items = Item.objects.bulk_create([
+        Item(
+            sku="PACK-%s" % i,
+            company=company,
+            product_name="Packing item %s" % i,
+            quantity_available=size,
+            weight_value=weight,
+            dimension_x_value=dimensions[0],
+            dimension_y_value=dimensions[1],
+            dimension_z_value=dimensions[2],
+        )
+        for i, (dimensions, weight) in enumerate(random_skus(rand, sku_count))
+    ])
+    shipment = Shipment.objects.create(
+        company=company, to_address="Benchmark address", date_promised=timezone.now(), direction='OUT'
+    )
+    quantities = [0] * len(items)
+    for i in range(size):
+        quantities[rand.randrange(len(items))] += 1
+    ShipmentItem.objects.bulk_create([
+        ShipmentItem(shipment=shipment, item=item, quantity=quantity)
+        for item, quantity in zip(items, quantities) if quantity
+    ])
+
+    cache.clear()
+    results = {}
+    # Timed past the LOGITRACK_PACKING_MAX_UNITS limit of the ship page too
+    with timer(results, 'uncached'):
+        plan_shipment(shipment, max_units=size)
+    with timer(results, 'cached'):
+        plan_shipment(shipment, max_units=size)
+    print("plan_shipment, %s units: %.1fms uncached, %.1fms cached" % (
+        size, results['uncached'] * 1000, results['cached'] * 1000
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--units', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--skus', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    compare_strategies(args.units, args.skus, args.seed)
+
+    with benchmark_database():
+        time_cached_plan(max(args.units), args.skus, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+    Measures the latency of the cached pages (see inventory/caching.py) on a
+    seeded warehouse (see inventory/seeding.py): the item list, an item's
+    page, the company list and a company's shipment list.
+
+    Each page is requested --repeat times with an empty cache (the pages are
+    invalidated before each request), then --repeat times from the cache.
+    The median latency and query count of both are reported, along with the
+    hit rate counted by the page cache. Pages with an ETag (see
+    inventory/conditional.py) are then revalidated --repeat times, as a
+    polling client would, which returns a 304 without rendering the page.
+
+    Usage:
+        python3 -m benchmarks.bench_page_cache [--companies 5] [--items 1000] [--repeat 20] [--seed 0]
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.utils import setup_django, benchmark_database
+
+
+def time_requests(client, url, repeat, before=None, status_code=200, **headers):
+    """ Requests url repeat times, and returns the median time (in milliseconds) and the queries of the last request """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    for i in range(repeat):
+        if before is not None:
+            before()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(url, **headers)
+            timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != status_code:
+            raise RuntimeError("GET %s returned %s" % (url, response.status_code))
+    return statistics.median(timings), len(queries)
+
+
+def run(companies, items, repeat, seed):
+    from django.test import Client
+    from django.urls import reverse
+    from inventory import caching
+    from inventory.models import Company, Item
+    from inventory.seeding import WarehouseSeeder
+
+    WarehouseSeeder(
+        companies=companies,
+        items_per_company=items,
+        shipments_per_company=items // 2,
+        seed=seed,
+    ).run()
+    company = Company.objects.order_by('pk').first()
+    item = Item.objects.filter(company=company).order_by('pk').first()
+
+    pages = [
+        ('item-list', reverse('view_all_items')),
+        ('item-detail', reverse('view-item', args=[item.pk])),
+        ('company-list', reverse('view-all-companies')),
+        ('shipment-list', reverse('view-all-shipments', kwargs={'company': company.pk})),
+    ]
+
+    client = Client()
+    caching.get_page_cache().clear()
+    print("%-15s %12s %8s %12s %8s %9s %10s" % ('page', 'cold (ms)', 'queries', 'warm (ms)', 'queries', 'speedup', '304 (ms)'))
+    for name, url in pages:
+        cold, cold_queries = time_requests(client, url, repeat, before=lambda: caching.invalidate_companies([company.pk]))
+        warm, warm_queries = time_requests(client, url, repeat)
+
+        etag = client.get(url).get('ETag')
+        revalidated = '-'
+        if etag:
+            revalidated = "%.2f" % time_requests(client, url, repeat, status_code=304, HTTP_IF_NONE_MATCH=etag)[0]
+        print("%-15s %12.2f %8s %12.2f %8s %8.1fx %10s" % (name, cold, cold_queries, warm, warm_queries, cold / warm, revalidated))
+
+    print("\n%-15s %8s %8s %9s" % ('page', 'hits', 'misses', 'hit rate'))
+    for name, stats in caching.page_cache_stats().items():
+        print("%-15s %8s %8s %8.0f%%" % (name, stats['hits'], stats['misses'], stats['hit_rate'] * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--companies', type=int, default=5)
+    parser.add_argument('--items', type=int, default=1000, help="Items per company")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.companies, args.items, args.repeat, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+    Times the item search (see inventory/search.py) against a test database
+    of --items items spread over --companies companies, with product names
+    made of random words, e.g. "Navy Wool Jacket XL 123".
+
+    Each query is run --repeat times, unscoped and within a single company,
+    and its median time and number of results are reported. SKU prefixes,
+    whole names and names with typos are covered.
+
+    Usage:
+        python3 -m benchmarks.bench_search [--items 1000000] [--companies 100] [--repeat 20]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.utils import setup_django, benchmark_database
+
+
+COLORS = ['Black', 'Blue', 'Brown', 'Green', 'Grey', 'Navy', 'Olive', 'Orange', 'Pink', 'Red', 'Teal', 'White', 'Yellow']
+MATERIALS = ['Canvas', 'Cotton', 'Denim', 'Fleece', 'Leather', 'Linen', 'Nylon', 'Silk', 'Steel', 'Wool']
+PRODUCTS = [
+    'Backpack', 'Belt', 'Boot', 'Bracket', 'Cable', 'Cap', 'Charger', 'Coat', 'Fan', 'Filter', 'Gasket',
+    'Glove', 'Hinge', 'Hoodie', 'Jacket', 'Lamp', 'Mount', 'Panel', 'Pump', 'Scarf', 'Sensor', 'Shirt',
+    'Sock', 'Spring', 'Sweater', 'Switch', 'Valve', 'Vest', 'Wallet', 'Watch',
+]
+SIZES = ['XS', 'S', 'M', 'L', 'XL']
+
+QUERIES = [
+    ('exact SKU', 'SRCH-0-42'),
+    ('SKU prefix', 'SRCH-0-4'),
+    ('one word', 'jacket'),
+    ('two words', 'wool jacket'),
+    ('three words', 'navy wool jacket'),
+    ('typo', 'leathr jaket'),
+]
+
+
+def seed_items(item_count, company_count, seed):
+    from inventory import search
+    from inventory.models import Company, Item
+
+    rand = random.Random(seed)
+    companies = [Company.objects.create(name="Search benchmark %s" % i) for i in range(company_count)]
+
+    batch_size = 10000
+    for start in range(0, item_count, batch_size):
+        items = [
+            Item(
+                sku="SRCH-%s-%s" % (i % company_count, i // company_count),
+                company=companies[i % company_count],
+                product_name="%s %s %s %s %s" % (
+                    rand.choice(COLORS), rand.choice(MATERIALS), rand.choice(PRODUCTS),
+                    rand.choice(SIZES), rand.randint(1, 999)
+                ),
+                weight_value=1,
+                dimension_x_value=1,
+                dimension_y_value=1,
+                dimension_z_value=1,
+            )
+            for i in range(start, min(start + batch_size, item_count))
+        ]
+        Item.objects.bulk_create(items)
+        search.index_items(items, replace=False)
+    return companies
+
+
+def time_queries(company, repeat, item_count):
+    from inventory.search import get_backend, search_items
+
+    print("%s items, %s search backend" % (item_count, get_backend()))
+    print("%-14s %-20s %-8s %12s %8s" % ('query', 'text', 'scope', 'median (ms)', 'results'))
+    for name, query in QUERIES:
+        for scope, scope_company in [('all', None), ('company', company)]:
+            timings = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                results = search_items(query, company=scope_company)
+                timings.append((time.perf_counter() - start) * 1000)
+            print("%-14s %-20s %-8s %12.2f %8s" % (name, query, scope, statistics.median(timings), len(results)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--companies', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        start = time.perf_counter()
+        companies = seed_items(args.items, args.companies, args.seed)
+        print("Seeded & indexed in %.1fs" % (time.perf_counter() - start))
+        time_queries(companies[0], args.repeat, args.items)
+
+
+if __name__ == '__main__':
+    main()
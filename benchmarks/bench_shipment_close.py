@@ -0,0 +1,115 @@
+"""
+    Measures how long it takes to ship an outbound shipment as the number of
+    lines on the shipment grows.
+
+    Shipment.save closes all of a shipment's lines with a fixed number of
+    statements, so its timings should stay roughly flat. The --per-line option
+    also times closing every line through ShipmentItem.save, one at a time, for
+    comparison.
+
+    Usage:
+        python3 -m benchmarks.bench_shipment_close [--sizes 10 100 1000 2000] [--per-line]
+"""
+import argparse
+
+from benchmarks.utils import setup_django, benchmark_database, timer
+
+
+def create_outbound_shipment(company, line_count, label):
+    """
+        Creates an outbound shipment with line_count lines, each for a
+        different item. Rows are inserted with bulk_create, so the items'
+        allocated totals are set directly to match the lines.
+    """
+    from django.utils import timezone
+    from inventory.models import Item, Shipment, ShipmentItem
+
+    prefix = "%s%s" % (label, company.pk)
+    Item.objects.bulk_create([
+        Item(
+            sku="%s-%s" % (prefix, i),
+            company=company,
+            product_name="Benchmark item %s" % i,
+            quantity_available=100,
+            quantity_allocated_total=5,
+            is_shippable=True,
+            weight_value=1,
+            dimension_x_value=1,
+            dimension_y_value=1,
+            dimension_z_value=1,
+        )
+        for i in range(line_count)
+    ])
+    items = Item.objects.filter(sku__startswith=prefix + "-")
+
+    shipment = Shipment.objects.create(
+        company=company,
+        to_address="Benchmark address",
+        date_promised=timezone.now(),
+        direction='OUT',
+    )
+    ShipmentItem.objects.bulk_create([
+        ShipmentItem(shipment=shipment, item=item, quantity=5)
+        for item in items
+    ])
+    return shipment
+
+
+def close_per_line(shipment):
+    """ Closes a shipment's lines one at a time, through ShipmentItem.save """
+    from django.db import transaction
+    from inventory.models import ShipmentItem
+
+    with transaction.atomic():
+        for shipment_item in ShipmentItem.objects.filter(shipment=shipment):
+            shipment_item.is_open = False
+            shipment_item.save()
+
+
+def run(sizes, per_line=False):
+    from django.utils import timezone
+    from inventory.models import Company
+
+    results = []
+    for line_count in sizes:
+        company = Company.objects.create(name="Benchmark company %s" % line_count)
+        row = {'lines': line_count}
+
+        shipment = create_outbound_shipment(company, line_count, 'B')
+        shipment.is_shipped = True
+        shipment.date_shipped = timezone.now()
+        with timer(row, 'shipment_save_s'):
+            shipment.save()
+
+        if per_line:
+            shipment = create_outbound_shipment(company, line_count, 'L')
+            with timer(row, 'per_line_s'):
+                close_per_line(shipment)
+
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500, 1000, 2000])
+    parser.add_argument('--per-line', action='store_true', help="Also time the line-by-line close")
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = run(args.sizes, per_line=args.per_line)
+
+    header = "%8s %18s" % ('lines', 'Shipment.save (ms)')
+    if args.per_line:
+        header += " %18s" % 'per-line (ms)'
+    print(header)
+    for row in results:
+        line = "%8s %18.1f" % (row['lines'], row['shipment_save_s'] * 1000)
+        if args.per_line:
+            line += " %18.1f" % (row['per_line_s'] * 1000)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+    Times Logitrack's main pages and model write paths against synthetic
+    warehouses of several sizes, generated with the same seed on every run
+    (see inventory/seeding.py).
+
+    For each size, the database is emptied and seeded with --companies
+    companies, each with <size> items and <size> / 2 shipments. Each page and
+    write path is then timed --repeat times, and its min/median/mean times
+    and query count are reported. Pages are rendered on every request, as
+    the page cache is disabled (see bench_page_cache). With --output, the
+    results are written to a JSON file along with the current git commit, so
+    that runs can be compared between commits with --compare.
+
+    Usage:
+        python3 -m benchmarks.bench_suite [--sizes 100 1000] [--output results.json] [--compare previous.json]
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+from benchmarks.utils import setup_django, benchmark_database
+
+
+def git_commit():
+    """ Returns the hash of the checked out git commit, if there is one """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(function, repeat):
+    """
+        Calls function repeat times, and returns its timings (in milliseconds)
+        and the number of queries of its last call.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    for i in range(repeat):
+        # The query log has a maximum length, past which nothing is counted
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function(i)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': len(queries),
+    }
+
+
+def get_url(client, url):
+    """ Returns a function that requests url, reading the whole response """
+    def request(i):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError("GET %s returned %s" % (url, response.status_code))
+        if response.streaming:
+            for chunk in response.streaming_content:
+                pass
+    return request
+
+
+def page_benchmarks(company, item, shipment):
+    """ Returns the (name, url) pairs of the pages to time """
+    from django.urls import reverse
+
+    shipment_kwargs = {'company': company.pk, 'shipmentid': shipment.pk}
+    return [
+        ('landing_page', reverse('landing_page')),
+        ('view_all_items', reverse('view_all_items')),
+        ('view_all_items_with_total', reverse('view_all_items') + '?totals=1'),
+        ('view_item', reverse('view-item', args=[item.pk])),
+        ('edit_item', reverse('edit-item', args=[item.pk])),
+        ('view_all_companies', reverse('view-all-companies')),
+        ('view_company', reverse('view-company', kwargs={'company': company.pk})),
+        ('view_all_shipments', reverse('view-all-shipments', kwargs={'company': company.pk})),
+        ('edit_shipment', reverse('edit-shipment', kwargs=shipment_kwargs)),
+        ('ship_shipment', reverse('ship-shipment', kwargs=shipment_kwargs)),
+        ('export_items_csv', reverse('export-data', kwargs={'dataset': 'items', 'file_format': 'csv'})),
+        ('export_shipment_lines_ndjson', reverse('export-data', kwargs={'dataset': 'shipment_lines', 'file_format': 'ndjson'})),
+    ]
+
+
+def write_benchmarks(company, repeat, lines_per_shipment=10):
+    """
+        Returns the (name, function) pairs of the model write paths to time.
+        The outbound shipments they write to are created here, with
+        lines_per_shipment lines each.
+    """
+    from django.utils import timezone
+    from inventory.models import Item, Shipment, ShipmentItem
+
+    # Every item gets one unit allocated per shipment, plus one for the lines
+    # added by the ShipmentItem.save benchmark
+    items = list(
+        Item.objects.filter(company=company, quantity_available__gte=repeat + 1).order_by('pk')[:max(repeat, lines_per_shipment)]
+    )
+    if len(items) < max(repeat, lines_per_shipment):
+        raise RuntimeError("The dataset doesn't have enough items in stock to run the write benchmarks")
+
+    shipments = []
+    for i in range(repeat):
+        shipment = Shipment.objects.create(
+            company=company,
+            to_address="Benchmark address",
+            date_promised=timezone.now(),
+            direction='OUT',
+        )
+        for item in items[:lines_per_shipment]:
+            ShipmentItem(shipment=shipment, item=item, quantity=1).save()
+        shipments.append(shipment)
+
+    def add_shipment_line(i):
+        ShipmentItem(shipment=shipments[0], item=items[i], quantity=1).save()
+
+    def ship_shipment(i):
+        shipment = shipments[i]
+        shipment.is_shipped = True
+        shipment.date_shipped = timezone.now()
+        shipment.save()
+
+    return [
+        ('shipment_item_save', add_shipment_line),
+        ('shipment_save_shipping', ship_shipment),
+    ]
+
+
+def run(sizes, companies=5, repeat=5, seed=0):
+    from django.core.management import call_command
+    from django.test import Client, override_settings
+    from inventory.models import Company, Item, Shipment
+    from inventory.seeding import WarehouseSeeder
+
+    client = Client()
+    results = []
+    for size in sizes:
+        call_command('flush', interactive=False, verbosity=0)
+        seeded = WarehouseSeeder(
+            companies=companies,
+            items_per_company=size,
+            shipments_per_company=size // 2,
+            seed=seed,
+        ).run()
+
+        company = Company.objects.order_by('pk').first()
+        item = Item.objects.filter(company=company).order_by('pk').first()
+        shipment = Shipment.objects.filter(company=company, is_shipped=False).order_by('pk').first()
+
+        timings = {}
+        with override_settings(LOGITRACK_PAGE_CACHE=None):
+            for name, url in page_benchmarks(company, item, shipment):
+                timings[name] = measure(get_url(client, url), repeat)
+        for name, function in write_benchmarks(company, repeat):
+            timings[name] = measure(function, repeat)
+
+        results.append({
+            'items_per_company': size,
+            'rows': {
+                'companies': seeded.companies,
+                'items': seeded.items,
+                'shipments': seeded.shipments,
+                'shipment_lines': seeded.shipment_lines,
+            },
+            'timings': timings,
+        })
+    return results
+
+
+def print_results(results, previous=None):
+    """ Prints the median timings, and their change since a previous run """
+    previous_timings = {}
+    for row in (previous or {}).get('results', []):
+        previous_timings[row['items_per_company']] = row['timings']
+
+    for row in results:
+        print("\n%s items per company (%s items, %s shipment lines)" % (
+            row['items_per_company'], row['rows']['items'], row['rows']['shipment_lines']
+        ))
+        print("%-30s %12s %8s %10s" % ('benchmark', 'median (ms)', 'queries', 'change'))
+        before = previous_timings.get(row['items_per_company'], {})
+        for name, timing in row['timings'].items():
+            change = ''
+            if name in before and before[name]['median_ms']:
+                change = "%+.0f%%" % ((timing['median_ms'] / before[name]['median_ms'] - 1) * 100)
+            print("%-30s %12.1f %8s %10s" % (name, timing['median_ms'], timing['queries'], change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000], help="Items per company")
+    parser.add_argument('--companies', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5, help="Number of times each benchmark is run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Path of a JSON file to write the results to")
+    parser.add_argument('--compare', help="Path of the JSON results of a previous run to compare against")
+    args = parser.parse_args()
+
+    setup_django()
+    from django import get_version
+    from django.db import connection
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+
+    with benchmark_database():
+        results = run(args.sizes, companies=args.companies, repeat=args.repeat, seed=args.seed)
+        database = connection.vendor
+
+    report = {
+        'commit': git_commit(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': get_version(),
+        'database': database,
+        'seed': args.seed,
+        'companies': args.companies,
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        print("\nResults written to %s" % args.output)
+
+
+if __name__ == '__main__':
+    main()
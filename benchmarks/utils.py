@@ -0,0 +1,42 @@
+"""
+    Helpers shared by the benchmark modules.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup_django():
+    """ Configures Django with the project settings, if not already done """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'logitrack.settings')
+    django.setup()
+
+
+@contextmanager
+def benchmark_database():
+    """
+        Creates the test database(s) for the duration of the block, so that
+        benchmarks never touch the development database.
+    """
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from django.test.utils import setup_databases, teardown_databases
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def timer(results, key):
+    """ Stores the wall-clock duration of the block, in seconds, in results[key] """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[key] = time.perf_counter() - start
@@ -1,7 +1,12 @@
 from django.contrib import admin
-from inventory.models import Item, Company, Shipment, ShipmentItem
+from inventory.models import Item, Company, CompanyInventorySummary, InventoryMovement, InventorySnapshot, ReorderSuggestion, Shipment, ShipmentItem, SKUFormat
 # Register your models here.
 admin.site.register(Item)
 admin.site.register(Company)
+admin.site.register(CompanyInventorySummary)
 admin.site.register(ShipmentItem)
 admin.site.register(Shipment)
+admin.site.register(InventoryMovement)
+admin.site.register(InventorySnapshot)
+admin.site.register(ReorderSuggestion)
+admin.site.register(SKUFormat)
@@ -0,0 +1,510 @@
+"""
+    The following module implements Logitrack's JSON API, used by systems
+    integrating with Logitrack (such as a client's WMS) rather than the HTML
+    views.
+
+    Each model is exposed through a Resource, which defines the fields that
+    are returned and the fields that can be written. Records are created and
+    updated through the models' own validation (full_clean & save), so the API
+    enforces the same rules as the HTML forms. Errors are returned as
+    {"errors": ...} with a 400 status.
+
+    Lists are paginated with the same keyset cursors as the HTML lists (see
+    inventory/pagination.py), and read with select_related so that they run
+    a fixed number of queries regardless of the page size. Every endpoint
+    accepts a fields query parameter (?fields=id,sku) to return only some of
+    the fields.
+"""
+import json
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from .models import Company, Item, Shipment, ShipmentItem
+from .pagination import KeysetPaginator, get_page_size
+from . import search, shipping
+
+
+class APIError(Exception):
+    """ Raised to return a 400 response with the given errors """
+    def __init__(self, errors, status=400):
+        super().__init__(errors)
+        self.errors = errors
+        self.status = status
+
+
+def error_response(errors, status=400):
+    return JsonResponse({'errors': errors}, status=status)
+
+
+def validation_errors(error):
+    """ Returns the errors of a ValidationError as a dictionary or list """
+    if hasattr(error, 'error_dict'):
+        return error.message_dict
+    return error.messages
+
+
+def read_json(request):
+    """ Returns the decoded JSON body of a request """
+    try:
+        return json.loads(request.body or b'null')
+    except ValueError:
+        raise APIError(["The request body is not valid JSON"])
+
+
+def api_view(methods):
+    """
+        Decorates an API view: the view is exempt from CSRF checks (API
+        clients don't have a CSRF token), only accepts the given methods, and
+        APIErrors & Http404s raised by the view are returned as JSON errors.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @require_http_methods(methods)
+        def wrapper(request, *args, **kwargs):
+            try:
+                return view(request, *args, **kwargs)
+            except APIError as error:
+                return error_response(error.errors, error.status)
+            except Http404:
+                return error_response(["Not found"], 404)
+        wrapper.__name__ = view.__name__
+        wrapper.__doc__ = view.__doc__
+        return wrapper
+    return decorator
+
+
+class Resource:
+    """
+        Defines how a model is read & written through the API.
+
+            fields: the fields returned, as a name -> function(instance) map
+            create_fields: the fields that can be set on creation
+            update_fields: the fields that can be changed afterwards
+            filters: the list's query parameters, as a name -> lookup map
+    """
+    model = None
+    fields = {}
+    create_fields = []
+    update_fields = []
+    filters = {}
+    select_related = []
+    sort_fields = ['id']
+    default_sort = 'id'
+
+    def get_queryset(self):
+        return self.model.objects.select_related(*self.select_related)
+
+    def filter_queryset(self, queryset, params):
+        for name, lookup in self.filters.items():
+            value = params.get(name)
+            if value not in (None, ''):
+                queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+    def get_object(self, pk):
+        return get_object_or_404(self.get_queryset(), pk=pk)
+
+    def selected_fields(self, params):
+        """ Returns the names of the fields requested with the fields query parameter """
+        requested = params.get('fields')
+        if not requested:
+            return list(self.fields)
+
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise APIError({'fields': ["Unknown fields: %s" % ', '.join(unknown)]})
+        return names
+
+    def serialize(self, instance, field_names):
+        return {name: self.fields[name](instance) for name in field_names}
+
+    def assign(self, instance, data, allowed_fields):
+        """ Sets the allowed fields of instance from a dictionary of JSON data """
+        if not isinstance(data, dict):
+            raise APIError(["Expected a JSON object"])
+
+        unknown = [name for name in data if name not in allowed_fields]
+        if unknown:
+            raise APIError({name: ["This field can't be set"] for name in unknown})
+
+        for name, value in data.items():
+            field = self.model._meta.get_field(name)
+            setattr(instance, field.attname, value)
+
+    def validate_fields(self, instance):
+        """
+            Raises a ValidationError if any field of instance is invalid, along
+            with the errors of the unique checks of its valid fields. The
+            model's clean() compares the fields' values (the raw JSON values
+            until clean_fields converts them), so it only runs once they're
+            valid.
+        """
+        try:
+            instance.clean_fields()
+        except ValidationError as error:
+            errors = error.update_error_dict({})
+            try:
+                instance.validate_unique(exclude=list(errors))
+            except ValidationError as unique_error:
+                errors = unique_error.update_error_dict(errors)
+            raise ValidationError(errors)
+
+    def save(self, instance):
+        """ Validates and saves an instance, raising a ValidationError if it's invalid """
+        self.validate_fields(instance)
+        instance.full_clean()
+        instance.save()
+
+    def create(self, data):
+        instance = self.model()
+        self.assign(instance, data, self.create_fields)
+        self.save(instance)
+        return instance
+
+    def update(self, instance, data):
+        self.assign(instance, data, self.update_fields)
+        self.save(instance)
+        return instance
+
+
+def field(name):
+    """ Returns a function reading an attribute, for Resource.fields """
+    return lambda instance: getattr(instance, name)
+
+
+class CompanyResource(Resource):
+    model = Company
+    fields = {
+        'id': field('id'),
+        'name': field('name'),
+    }
+    create_fields = ['name']
+    update_fields = ['name']
+    sort_fields = ['id', 'name']
+
+
+class ItemResource(Resource):
+    model = Item
+    fields = {
+        'id': field('id'),
+        'sku': field('sku'),
+        'company': field('company_id'),
+        'company_name': lambda item: item.company.name,
+        'product_name': field('product_name'),
+        'quantity_available': field('quantity_available'),
+        'quantity_inbound': field('quantity_inbound_total'),
+        'quantity_allocated': field('quantity_allocated_total'),
+        'is_shippable': field('is_shippable'),
+        'weight_value': field('weight_value'),
+        'weight_unit': field('weight_unit'),
+        'dimension_x_value': field('dimension_x_value'),
+        'dimension_y_value': field('dimension_y_value'),
+        'dimension_z_value': field('dimension_z_value'),
+        'dimension_unit': field('dimension_unit'),
+        'date_created': field('date_created'),
+        'date_last_modified': field('date_last_modified'),
+    }
+    create_fields = [
+        'sku', 'company', 'product_name', 'quantity_available', 'is_shippable',
+        'weight_value', 'weight_unit', 'dimension_x_value', 'dimension_y_value',
+        'dimension_z_value', 'dimension_unit',
+    ]
+    update_fields = create_fields
+    filters = {'company': 'company', 'sku': 'sku', 'is_shippable': 'is_shippable'}
+    select_related = ['company']
+    sort_fields = ['id', 'sku', 'product_name', 'quantity_available', 'date_created', 'date_last_modified']
+
+    def save(self, instance):
+        # Item.save validates the item itself
+        self.validate_fields(instance)
+        instance.save()
+
+
+class ShipmentResource(Resource):
+    model = Shipment
+    fields = {
+        'id': field('id'),
+        'company': field('company_id'),
+        'company_name': lambda shipment: shipment.company.name,
+        'direction': field('direction'),
+        'status': lambda shipment: shipment.get_status(),
+        'to_address': field('to_address'),
+        'is_shipped': field('is_shipped'),
+        'date_created': field('date_created'),
+        'date_promised': field('date_promised'),
+        'date_shipped': field('date_shipped'),
+    }
+    create_fields = ['company', 'to_address', 'date_promised', 'direction']
+    # Shipments are shipped & received through the ship endpoint
+    update_fields = ['to_address', 'date_promised']
+    filters = {'company': 'company', 'direction': 'direction', 'is_shipped': 'is_shipped'}
+    select_related = ['company']
+    sort_fields = ['id', 'date_created', 'date_promised']
+    default_sort = '-date_created'
+
+
+class ShipmentItemResource(Resource):
+    model = ShipmentItem
+    fields = {
+        'id': field('id'),
+        'shipment': field('shipment_id'),
+        'item': field('item_id'),
+        'sku': lambda line: line.item.sku,
+        'quantity': field('quantity'),
+        'is_open': field('is_open'),
+    }
+    create_fields = ['item', 'quantity']
+    update_fields = ['quantity']
+    filters = {'item': 'item', 'is_open': 'is_open'}
+    select_related = ['shipment', 'item']
+
+    def save(self, instance):
+        # ShipmentItem.save validates the line and adjusts the item's inventory
+        self.validate_fields(instance)
+        instance.save()
+
+
+def parse_filters(resource, params):
+    """ Converts the boolean filters of the query string ('true'/'false') """
+    params = params.copy()
+    for name in resource.filters:
+        if params.get(name) in ('true', 'false'):
+            params[name] = params[name] == 'true'
+    return params
+
+
+def list_response(request, resource, queryset):
+    """ Returns a page of a queryset, filtered by the request's query parameters """
+    params = request.GET
+    field_names = resource.selected_fields(params)
+
+    try:
+        queryset = resource.filter_queryset(queryset, parse_filters(resource, params))
+        paginator = KeysetPaginator(
+            queryset,
+            resource.sort_fields,
+            resource.default_sort,
+            sort=params.get('sort'),
+            page_size=get_page_size(params.get('page_size')),
+        )
+        page = paginator.get_page(cursor=params.get('cursor'))
+    except ValidationError as error:
+        raise APIError({'filters': validation_errors(error)})
+    except (ValueError, TypeError):
+        raise APIError({'filters': ["Invalid filter value"]})
+
+    return JsonResponse({
+        'results': [resource.serialize(instance, field_names) for instance in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def collection(resource):
+    """ Returns the view listing (GET) and creating (POST) the records of a resource """
+    @api_view(['GET', 'POST'])
+    def view(request):
+        if request.method == 'GET':
+            return list_response(request, resource, resource.get_queryset())
+
+        field_names = resource.selected_fields(request.GET)
+        try:
+            instance = resource.create(read_json(request))
+        except ValidationError as error:
+            return error_response(validation_errors(error))
+        return JsonResponse(resource.serialize(instance, field_names), status=201)
+
+    view.__name__ = '%s_collection' % resource.model._meta.model_name
+    return view
+
+
+def detail(resource):
+    """ Returns the view reading (GET) and updating (PATCH) a record of a resource """
+    @api_view(['GET', 'PATCH'])
+    def view(request, pk):
+        field_names = resource.selected_fields(request.GET)
+        instance = resource.get_object(pk)
+
+        if request.method == 'PATCH':
+            try:
+                resource.update(instance, read_json(request))
+            except ValidationError as error:
+                return error_response(validation_errors(error))
+            instance = resource.get_object(pk)
+
+        return JsonResponse(resource.serialize(instance, field_names))
+
+    view.__name__ = '%s_detail' % resource.model._meta.model_name
+    return view
+
+
+companies = collection(CompanyResource())
+company_detail = detail(CompanyResource())
+items = collection(ItemResource())
+item_detail = detail(ItemResource())
+shipments = collection(ShipmentResource())
+shipment_detail = detail(ShipmentResource())
+shipment_line_detail = detail(ShipmentItemResource())
+
+
+@api_view(['GET'])
+def item_search(request):
+    """
+        Searches items by SKU prefix & product name (see inventory/search.py),
+        with the q, company (id) and limit query parameters. Returns the
+        items best match first, each with a match field: "sku" for a SKU
+        prefix match, "name" for a product name containing the query, or
+        "fuzzy" for a similar product name.
+    """
+    resource = ItemResource()
+    field_names = resource.selected_fields(request.GET)
+
+    company = request.GET.get('company') or None
+    try:
+        company = int(company) if company is not None else None
+    except ValueError:
+        raise APIError({'company': ["Expected a company id"]})
+    try:
+        limit = int(request.GET.get('limit') or search.DEFAULT_LIMIT)
+    except ValueError:
+        raise APIError({'limit': ["Expected a number"]})
+
+    results = search.search_items(request.GET.get('q', ''), company=company, limit=limit)
+    return JsonResponse({
+        'results': [
+            dict(resource.serialize(item, field_names), match=item.search_match)
+            for item in results
+        ],
+    })
+
+
+def max_batch_size():
+    return getattr(settings, 'LOGITRACK_API_MAX_BATCH_SIZE', 1000)
+
+
+def read_batch(data, key):
+    """
+        Returns the list of records of a batch request, sent either as a JSON
+        list or as a JSON object with a list under key.
+    """
+    if isinstance(data, dict) and key in data:
+        data = data[key]
+    if not isinstance(data, list):
+        raise APIError(["Expected a JSON list, or an object with a list of %s" % key])
+    if len(data) > max_batch_size():
+        raise APIError(["At most %s %s can be sent per request" % (max_batch_size(), key)])
+    return data
+
+
+@api_view(['GET', 'POST'])
+def shipment_lines(request, pk):
+    """
+        Lists the lines of a shipment (GET), or adds lines to it (POST). A
+        single line can be sent as a JSON object, or many lines as a list (or
+        {"lines": [...]}).
+
+        Lines are added in a single transaction: if any line is invalid, none
+        are added, and the errors are returned by position in the list.
+    """
+    resource = ShipmentItemResource()
+    shipment = get_object_or_404(Shipment.objects.select_related('company'), pk=pk)
+
+    if request.method == 'GET':
+        return list_response(request, resource, resource.get_queryset().filter(shipment=shipment))
+
+    field_names = resource.selected_fields(request.GET)
+    data = read_json(request)
+    single = isinstance(data, dict) and 'lines' not in data
+    data = [data] if single else read_batch(data, 'lines')
+
+    errors = {}
+    positions = []
+    lines = []
+    for index, line_data in enumerate(data):
+        try:
+            line = ShipmentItem(shipment=shipment)
+            resource.assign(line, line_data, resource.create_fields)
+        except APIError as error:
+            errors[index] = error.errors
+        else:
+            positions.append(index)
+            lines.append((line.item_id, line.quantity))
+
+    # The lines are validated & added as a batch, with a fixed number of
+    # queries whatever the number of lines (see ShipmentItemQuerySet.bulk_add)
+    with transaction.atomic():
+        created, line_errors = ShipmentItem.objects.bulk_add(shipment, lines)
+        for position, error in line_errors.items():
+            errors[positions[position]] = validation_errors(error)
+
+        if errors:
+            transaction.set_rollback(True)
+
+    if errors:
+        return error_response(errors[0] if single else errors)
+
+    if single:
+        return JsonResponse(resource.serialize(created[0], field_names), status=201)
+    return JsonResponse({'results': [resource.serialize(line, field_names) for line in created]}, status=201)
+
+
+def parse_datetime_value(data, name):
+    """ Returns the datetime (or date) sent as data[name], or None """
+    value = data.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return forms.DateTimeField().clean(value)
+    except ValidationError as error:
+        raise APIError({name: error.messages})
+
+
+@api_view(['POST'])
+def ship_shipments(request):
+    """
+        Ships (or receives, for inbound shipments) many shipments at once
+        (see inventory/shipping.py). The body is either:
+            {"shipments": [ids]}
+        or, to ship all of a company's open shipments promised on or before
+        a cutoff date:
+            {"company": id, "cutoff": date, "direction": "OUT"}
+        with an optional date_shipped, and require_all to ship nothing if any
+        shipment can't be shipped. Returns the result of each shipment.
+    """
+    data = read_json(request)
+    if isinstance(data, dict) and 'shipments' not in data:
+        if not isinstance(data.get('company'), int):
+            raise APIError({'company': ["A company id is required when no shipments are listed"]})
+        shipment_ids = None
+    else:
+        shipment_ids = read_batch(data, 'shipments')
+        invalid = {
+            index: ["Expected a shipment id"]
+            for index, pk in enumerate(shipment_ids) if not isinstance(pk, int) or isinstance(pk, bool)
+        }
+        if invalid:
+            raise APIError({'shipments': invalid})
+        data = data if isinstance(data, dict) else {}
+
+    direction = data.get('direction')
+    if direction not in (None, 'IN', 'OUT'):
+        raise APIError({'direction': ["Expected IN or OUT"]})
+
+    result = shipping.ship_shipments(
+        shipment_ids,
+        company=data.get('company'),
+        cutoff=parse_datetime_value(data, 'cutoff'),
+        direction=direction,
+        date_shipped=parse_datetime_value(data, 'date_shipped'),
+        require_all=bool(data.get('require_all')),
+    )
+
+    return JsonResponse({'results': result.results})
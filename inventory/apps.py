@@ -1,7 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
-    
+
+    def ready(self):
+        # Foreign keys to these models are looked up in the request's
+        # identity map, when one is active (see logitrack/identity.py)
+        from logitrack import identity
+        identity.install(getattr(settings, 'LOGITRACK_IDENTITY_MAP_MODELS', []))
+
+        # Saving & deleting items, shipments & companies invalidates the
+        # cached pages displaying them (see inventory/caching.py)
+        from . import caching
+        caching.install()
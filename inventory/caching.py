@@ -0,0 +1,273 @@
+"""
+    The following module implements the page cache of Logitrack's most read
+    pages: the item list, the item detail pages, the company list and the
+    shipment lists.
+
+    Rendered pages are kept in the cache set by the LOGITRACK_PAGE_CACHE
+    setting (an alias of settings.CACHES, or None to disable the page cache),
+    which can use any of Django's cache backends: local memory, files, or a
+    Redis server. Pages are keyed on their full path (query string included),
+    and versioned with the data they display:
+        - the pages of a single company (its shipment list, the detail pages
+          of its items) with the company's version,
+        - the pages listing every company (the item list, the company list)
+          with the version of 'all' companies,
+        - every page with an epoch, bumped to invalidate the whole cache.
+
+    Saving or deleting an item, a shipment, a shipment line or a company bumps
+    the versions of its company and of 'all' companies (see the signal
+    receivers below), so the next request renders the pages again, and the
+    old pages expire from the cache. Bulk operations, which don't send
+    signals, call invalidate_companies (or invalidate_all) themselves.
+
+    Versions are bumped when the change is made, and again once the
+    transaction commits, so that a page rendered by another request from the
+    data before the commit isn't kept.
+
+    The hits & misses of each page are counted in the cache as well (see
+    page_cache_stats), and reported by the query instrumentation middleware.
+"""
+import functools
+import hashlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+
+
+ALL_COMPANIES = 'all'
+EPOCH = 'epoch'
+
+PAGE_NAMES = ['item-list', 'item-detail', 'company-list', 'shipment-list']
+
+
+def get_page_cache():
+    """ Returns the cache of the pages, or None if the page cache is disabled """
+    alias = getattr(settings, 'LOGITRACK_PAGE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def version_key(scope):
+    return 'logitrack:version:%s' % scope
+
+
+def item_company_key(item_id):
+    return 'logitrack:item-company:%s' % item_id
+
+
+def stats_key(name, outcome):
+    return 'logitrack:page-stats:%s:%s' % (name, outcome)
+
+
+def get_version(cache, scopes):
+    """
+        Returns the version of the pages of the given scopes (company ids or
+        ALL_COMPANIES), with a single read from the cache. A missing version
+        (never set, or evicted from the cache) starts from the current time,
+        so that it never matches the version of a page cached before.
+    """
+    keys = [version_key(scope) for scope in [EPOCH] + list(scopes)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def bump_versions(scopes):
+    cache = get_page_cache()
+    if cache is None:
+        return
+    for scope in scopes:
+        key = version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def invalidate_companies(company_ids):
+    """
+        Invalidates the cached pages of the given companies, and the pages
+        listing every company.
+    """
+    scopes = [company_id for company_id in set(company_ids) if company_id is not None] + [ALL_COMPANIES]
+    bump_versions(scopes)
+    transaction.on_commit(lambda: bump_versions(scopes))
+
+
+def invalidate_all():
+    """ Invalidates every cached page """
+    bump_versions([EPOCH])
+    transaction.on_commit(lambda: bump_versions([EPOCH]))
+
+
+def count(cache, name, outcome):
+    key = stats_key(name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def page_cache_stats(reset=False):
+    """
+        Returns the number of hits & misses, and the hit rate, of each cached
+        page since the counters were last reset.
+    """
+    cache = get_page_cache()
+    if cache is None:
+        return {}
+
+    keys = [stats_key(name, outcome) for name in PAGE_NAMES for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    stats = {}
+    for name in PAGE_NAMES:
+        hits = values.get(stats_key(name, 'hits'), 0)
+        misses = values.get(stats_key(name, 'misses'), 0)
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else None,
+        }
+
+    if reset:
+        cache.delete_many(keys)
+    return stats
+
+
+def cached_page(name, scope):
+    """
+        Decorates a view with the page cache. scope(request, **kwargs)
+        returns the company ids the page depends on (or [ALL_COMPANIES]),
+        or None when they aren't known before rendering the page, in which
+        case the page is rendered without being cached. Only successful GET
+        & HEAD requests are cached.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            cache = get_page_cache()
+            if cache is None or request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            scopes = scope(request, **kwargs)
+            if scopes is None:
+                count(cache, name, 'misses')
+                request.page_cache = 'miss'
+                return view(request, *args, **kwargs)
+
+            # The version is read before rendering the page, so a page
+            # rendered while its data changes is stored under the old version
+            version = get_version(cache, scopes)
+            key = 'logitrack:page:%s:%s' % (name, hashlib.sha1(request.get_full_path().encode('utf-8')).hexdigest())
+
+            cached = cache.get(key, version=version)
+            if cached is not None:
+                count(cache, name, 'hits')
+                request.page_cache = 'hit'
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            count(cache, name, 'misses')
+            request.page_cache = 'miss'
+            response = view(request, *args, **kwargs)
+
+            def store(response):
+                if response.status_code == 200 and not response.streaming:
+                    timeout = getattr(settings, 'LOGITRACK_PAGE_CACHE_TIMEOUT', 300)
+                    cache.set(key, (response.content, response['Content-Type']), timeout, version=version)
+
+            if hasattr(response, 'render') and callable(response.render):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+            return response
+        return wrapper
+    return decorator
+
+
+def fragment_cache_context():
+    """
+        The cache & timeout of the row fragments of the item & shipment lists
+        (see their templates), which are keyed on the version of their row
+        rather than invalidated.
+    """
+    return {
+        'fragment_cache': getattr(settings, 'LOGITRACK_PAGE_CACHE', None) or 'default',
+        'fragment_cache_timeout': getattr(settings, 'LOGITRACK_FRAGMENT_CACHE_TIMEOUT', 60 * 60),
+    }
+
+
+def all_companies(request, **kwargs):
+    return [ALL_COMPANIES]
+
+
+def url_company(request, company, **kwargs):
+    return [company]
+
+
+def item_company(request, id, **kwargs):
+    """
+        The company of the item of a detail page, as remembered by the cache
+        when the item was saved or its page rendered. Unknown until then.
+    """
+    company_id = get_page_cache().get(item_company_key(id))
+    return None if company_id is None else [company_id]
+
+
+def remember_item_company(item):
+    """ Keeps the company of an item, so that its detail page can be cached """
+    cache = get_page_cache()
+    if cache is not None:
+        cache.set(item_company_key(item.pk), item.company_id, timeout=None)
+
+
+def invalidate_item(sender, instance, **kwargs):
+    invalidate_companies([instance.company_id])
+    if 'created' in kwargs:
+        # The item may have moved to another company
+        remember_item_company(instance)
+
+
+def invalidate_shipment(sender, instance, **kwargs):
+    invalidate_companies([instance.company_id])
+
+
+def invalidate_shipment_item(sender, instance, **kwargs):
+    # The line's shipment is loaded by ShipmentItem.save & delete already,
+    # but not when the lines are deleted along with their item
+    shipment_field = sender._meta.get_field('shipment')
+    if shipment_field.is_cached(instance):
+        invalidate_companies([instance.shipment.company_id])
+    else:
+        shipments = shipment_field.related_model.objects.filter(pk=instance.shipment_id)
+        invalidate_companies(shipments.values_list('company_id', flat=True))
+
+
+def invalidate_company(sender, instance, **kwargs):
+    invalidate_companies([instance.pk])
+
+
+def install():
+    """
+        Connects the signal receivers invalidating the cached pages when an
+        item, shipment, shipment line or company is saved or deleted. Called
+        once the models are loaded (see InventoryConfig.ready).
+    """
+    receivers = {
+        'inventory.Item': invalidate_item,
+        'inventory.Shipment': invalidate_shipment,
+        'inventory.ShipmentItem': invalidate_shipment_item,
+        'inventory.Company': invalidate_company,
+    }
+    for label, handler in receivers.items():
+        model = apps.get_model(label)
+        post_save.connect(handler, sender=model, dispatch_uid='page_cache_save_%s' % label)
+        post_delete.connect(handler, sender=model, dispatch_uid='page_cache_delete_%s' % label)
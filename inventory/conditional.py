@@ -0,0 +1,98 @@
+"""
+    The following module implements the conditional GETs of the item list and
+    the shipment lists, which dashboards poll every few seconds.
+
+    Before a list is rendered, a single query reads when the data it displays
+    last changed:
+        - for the item list, the latest date_last_modified of each company's
+          items, and the companies' inventory summaries, which change when
+          items are added or deleted (and when a company is renamed),
+        - for a company's shipment list, the latest date_last_modified of the
+          company's shipments & items, and its number of shipments.
+
+    Each latest date is read from a (company, date_last_modified) index, one
+    company at a time. The page's ETag is a hash of these values, and its
+    Last-Modified the latest date. A client whose copy is still current (see
+    If-None-Match & If-Modified-Since) gets a 304 response, without the page
+    being rendered. The responses ask clients to revalidate their copy on
+    every request (Cache-Control: no-cache).
+"""
+import functools
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+
+from .models import Company, CompanyInventorySummary, Item, Shipment
+
+
+def latest_modified(queryset):
+    """ A subquery of the latest date_last_modified of the queryset (filtered on an OuterRef) """
+    return Subquery(queryset.order_by('-date_last_modified').values('date_last_modified')[:1])
+
+
+def validators(state, dates):
+    """ Returns the ETag of the given state, and the latest of the dates """
+    etag = quote_etag(hashlib.sha1(repr(sorted(state.items())).encode('utf-8')).hexdigest())
+    last_modified = max((date for date in dates if date is not None), default=None)
+    return etag, last_modified
+
+
+def item_list_validators(request, **kwargs):
+    state = CompanyInventorySummary.objects.annotate(
+        item_modified=latest_modified(Item.objects.filter(company=OuterRef('company'))),
+    ).aggregate(
+        items_modified=Max('item_modified'),
+        summaries_modified=Max('date_last_modified'),
+        sku_count=Sum('sku_count'),
+    )
+    return validators(state, [state['items_modified'], state['summaries_modified']])
+
+
+def shipment_list_validators(request, company, **kwargs):
+    shipments = Shipment.objects.filter(company=OuterRef('pk'))
+    state = Company.objects.filter(pk=company).annotate(
+        shipments_modified=latest_modified(shipments),
+        shipment_count=Subquery(shipments.order_by().values('company').annotate(count=Count('pk')).values('count')),
+        items_modified=latest_modified(Item.objects.filter(company=OuterRef('pk'))),
+    ).values('shipments_modified', 'shipment_count', 'items_modified').first()
+
+    if state is None:
+        # Unknown company, which the view turns into a 404
+        return None
+    return validators(state, [state['shipments_modified'], state['items_modified']])
+
+
+def conditional_page(get_validators):
+    """
+        Decorates a view with conditional GETs. get_validators(request,
+        **kwargs) returns the page's (ETag, Last-Modified date), or None to
+        render the page unconditionally.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            found = get_validators(request, **kwargs)
+            if found is None:
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = found
+            timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+
+            if response.status_code in (200, 304):
+                if not response.has_header('ETag'):
+                    response.headers['ETag'] = etag
+                if timestamp is not None and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(timestamp)
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
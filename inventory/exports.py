@@ -0,0 +1,184 @@
+"""
+    The following module implements the streaming export of items, shipments
+    and shipment lines, used by the export views and the export management
+    command.
+
+    Rows are read with values_list() and QuerySet.iterator(), so no model
+    instances are created and only chunk_size rows are held in memory at a
+    time, no matter how many rows are exported.
+"""
+import csv
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Item, Shipment, ShipmentItem
+
+
+EXPORT_FORMATS = ['csv', 'ndjson']
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# For each dataset, the model being exported, the (header, lookup) pairs of
+# its columns, and the lookup prefix used to reach the Shipment for date filters
+EXPORT_DATASETS = {
+    'items': {
+        'model': Item,
+        'columns': [
+            ('id', 'id'),
+            ('sku', 'sku'),
+            ('company', 'company__name'),
+            ('product_name', 'product_name'),
+            ('quantity_available', 'quantity_available'),
+            ('quantity_inbound', 'quantity_inbound_total'),
+            ('quantity_allocated', 'quantity_allocated_total'),
+            ('is_shippable', 'is_shippable'),
+            ('weight_value', 'weight_value'),
+            ('weight_unit', 'weight_unit'),
+            ('dimension_x_value', 'dimension_x_value'),
+            ('dimension_y_value', 'dimension_y_value'),
+            ('dimension_z_value', 'dimension_z_value'),
+            ('dimension_unit', 'dimension_unit'),
+            ('date_created', 'date_created'),
+            ('date_last_modified', 'date_last_modified'),
+        ],
+        'company_lookup': 'company',
+        'shipment_prefix': None,
+    },
+    'shipments': {
+        'model': Shipment,
+        'columns': [
+            ('id', 'id'),
+            ('company', 'company__name'),
+            ('direction', 'direction'),
+            ('to_address', 'to_address'),
+            ('is_shipped', 'is_shipped'),
+            ('date_created', 'date_created'),
+            ('date_promised', 'date_promised'),
+            ('date_shipped', 'date_shipped'),
+        ],
+        'company_lookup': 'company',
+        'shipment_prefix': '',
+    },
+    'shipment_lines': {
+        'model': ShipmentItem,
+        'columns': [
+            ('id', 'id'),
+            ('shipment_id', 'shipment_id'),
+            ('company', 'shipment__company__name'),
+            ('direction', 'shipment__direction'),
+            ('item_id', 'item_id'),
+            ('sku', 'item__sku'),
+            ('quantity', 'quantity'),
+            ('is_open', 'is_open'),
+            ('shipment_date_created', 'shipment__date_created'),
+            ('shipment_date_shipped', 'shipment__date_shipped'),
+        ],
+        'company_lookup': 'shipment__company',
+        'shipment_prefix': 'shipment__',
+    },
+}
+
+# The supported date filters, and the Shipment field & lookup they apply to
+DATE_FILTERS = {
+    'created_after': ('date_created', 'gte'),
+    'created_before': ('date_created', 'lt'),
+    'shipped_after': ('date_shipped', 'gte'),
+    'shipped_before': ('date_shipped', 'lt'),
+}
+
+
+class ExportError(ValueError):
+    """ Raised when an export is requested with invalid parameters """
+    pass
+
+
+def parse_filter_datetime(value):
+    """
+        Parses a date (2022-01-31) or datetime (2022-01-31T12:00:00) filter
+        value into an aware datetime.
+    """
+    try:
+        parsed = parse_datetime(value)
+        parsed_date = parse_date(value) if parsed is None else None
+    except ValueError:
+        # Well formatted, but not a valid date (2022-02-30)
+        raise ExportError("Invalid date: %s" % value)
+
+    if parsed is None:
+        if parsed_date is None:
+            raise ExportError("Invalid date: %s" % value)
+        parsed = datetime.datetime.combine(parsed_date, datetime.time.min)
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def build_export_queryset(dataset, company=None, **date_filters):
+    """
+        Returns the values_list queryset for a dataset, filtered by company id
+        and by any of the DATE_FILTERS (given as strings).
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ExportError("Unknown dataset: %s" % dataset)
+    export = EXPORT_DATASETS[dataset]
+
+    queryset = export['model'].objects.all()
+
+    if company:
+        try:
+            company = int(company)
+        except (TypeError, ValueError):
+            raise ExportError("Invalid company id: %s" % company)
+        queryset = queryset.filter(**{export['company_lookup']: company})
+
+    for name, value in date_filters.items():
+        if name not in DATE_FILTERS:
+            raise ExportError("Unknown filter: %s" % name)
+        if not value:
+            continue
+        if export['shipment_prefix'] is None:
+            raise ExportError("The %s export can't be filtered by shipment dates" % dataset)
+
+        field_name, lookup = DATE_FILTERS[name]
+        queryset = queryset.filter(**{
+            "%s%s__%s" % (export['shipment_prefix'], field_name, lookup): parse_filter_datetime(value)
+        })
+
+    lookups = [lookup for header, lookup in export['columns']]
+    return queryset.values_list(*lookups).order_by('pk')
+
+
+class Echo:
+    """ A file-like object that returns what is written to it, for csv.writer """
+    def write(self, value):
+        return value
+
+
+def export_rows(dataset, queryset, file_format, chunk_size=2000):
+    """
+        Yields the export of queryset as lines of CSV (starting with a header
+        row) or NDJSON text.
+    """
+    headers = [header for header, lookup in EXPORT_DATASETS[dataset]['columns']]
+    rows = queryset.iterator(chunk_size=chunk_size)
+
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+
+    elif file_format == 'ndjson':
+        encoder = DjangoJSONEncoder()
+        for row in rows:
+            yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+    else:
+        raise ExportError("Unsupported export format: %s" % file_format)
@@ -0,0 +1,201 @@
+"""
+    The following module implements the demand forecasts of a company's
+    items, and the reorder suggestions derived from them (see the
+    ReorderSuggestion model and the forecast_demand management command).
+
+    The demand of an item is the quantity shipped on its outbound shipments,
+    by day of Shipment.date_shipped. The daily demand of all of a company's
+    items is loaded into a single NumPy array, with one row per item and one
+    column per day, so that every item is forecast at once with array
+    operations rather than with a Python loop per item. The array holds
+    32-bit floats, so that 100,000 items over two years take under 300MB.
+"""
+import datetime
+import math
+from statistics import NormalDist
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import caching
+from .models import Item, ReorderSuggestion, ShipmentItem
+
+
+class DemandHistory:
+    """
+        The daily demand of a set of items: quantities[i, d] is the quantity
+        of item item_ids[i] shipped on day start + d. The items are sorted by
+        id, and the position of each item (its quantity_available, which
+        already counts the quantity on open inbound lines) is held in
+        positions.
+    """
+    def __init__(self, item_ids, positions, start, quantities):
+        self.item_ids = item_ids
+        self.positions = positions
+        self.start = start
+        self.quantities = quantities
+
+    @property
+    def days(self):
+        return self.quantities.shape[1]
+
+    @classmethod
+    def load(cls, company, days=730, end=None):
+        """
+            Loads the daily demand of all of a company's items over the days
+            days ending on end (a date, defaults to today), with one query for
+            the items and one for the shipped quantities, summed by item &
+            day by the database.
+        """
+        end = end or timezone.localdate()
+        start = end - datetime.timedelta(days=days - 1)
+
+        items = list(
+            Item.objects.filter(company=company).order_by('pk')
+            .values_list('pk', 'quantity_available')
+        )
+        item_ids = np.array([item[0] for item in items], dtype=np.int64)
+        positions = np.array([item[1] for item in items], dtype=np.int64)
+        quantities = np.zeros((len(items), days), dtype=np.float32)
+
+        shipped = (
+            ShipmentItem.objects.filter(
+                shipment__company=company,
+                shipment__direction='OUT',
+                shipment__is_shipped=True,
+                shipment__date_shipped__gte=day_start(start),
+                shipment__date_shipped__lt=day_start(end + datetime.timedelta(days=1)),
+            )
+            .annotate(day=TruncDate('shipment__date_shipped'))
+            .values('item', 'day')
+            .annotate(total=Sum('quantity'))
+            .values_list('item', 'day', 'total')
+            .order_by()
+        )
+
+        rows = list(shipped)
+        if rows and len(item_ids):
+            line_items, line_days, totals = zip(*rows)
+            line_items = np.array(line_items, dtype=np.int64)
+            row_index = np.searchsorted(item_ids, line_items).clip(max=len(item_ids) - 1)
+            day_index = (np.array(line_days, dtype='datetime64[D]') - np.datetime64(start, 'D')).astype(np.int64)
+
+            # Every (item, day) pair appears once, as the rows are grouped by
+            # the database. Items moved to another company since are left out.
+            known = item_ids[row_index] == line_items
+            quantities[row_index[known], day_index[known]] = np.array(totals, dtype=np.float32)[known]
+
+        return cls(item_ids, positions, start, quantities)
+
+
+def day_start(date):
+    """ Returns the aware datetime at which date starts, in the current time zone """
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+def moving_average(quantities, window):
+    """ Returns the mean daily demand of each row over its last window days """
+    window = max(1, min(window, quantities.shape[1]))
+    return quantities[:, -window:].mean(axis=1)
+
+
+def exponential_smoothing(quantities, alpha):
+    """
+        Returns the simple exponential smoothing level of each row after its
+        last day, starting from the row's first day, with smoothing factor
+        alpha (0 < alpha <= 1).
+
+        The level after n days is a weighted sum of the days, with weight
+        alpha * (1 - alpha) ** age for each day but the first, which keeps
+        the remaining (1 - alpha) ** (n - 1). The levels of all rows are
+        computed with a single matrix-vector product.
+    """
+    if not 0 < alpha <= 1:
+        raise ValueError("alpha must be between 0 (excluded) and 1")
+
+    days = quantities.shape[1]
+    if days == 0:
+        return np.zeros(quantities.shape[0])
+
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1, dtype=np.float64)
+    weights[0] = (1 - alpha) ** (days - 1)
+    return quantities @ weights.astype(quantities.dtype)
+
+
+def reorder_points(daily_demand, demand_std, lead_time_days, service_level):
+    """
+        Returns the reorder point of each item: its demand over the lead time,
+        plus the safety stock covering the demand's variability at the
+        service level (the probability of not running out during the lead
+        time, e.g. 0.95).
+    """
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = z * demand_std * math.sqrt(lead_time_days)
+    return np.ceil(daily_demand * lead_time_days + np.maximum(safety_stock, 0))
+
+
+def forecast_company(company, method=ReorderSuggestion.Method.EXPONENTIAL_SMOOTHING, days=730,
+                     window=28, alpha=0.2, lead_time_days=7, review_days=14,
+                     service_level=0.95, end=None, save=True):
+    """
+        Forecasts the daily demand of all of a company's items, from the
+        shipped quantities of the last days days, either with the moving
+        average of the last window days (method 'sma'), or by exponential
+        smoothing (method 'ses'). Returns the ReorderSuggestion of each item,
+        which replace the company's previous suggestions when save is True.
+
+        Items at or below their reorder point are suggested an order bringing
+        their position up to the reorder point plus the forecast demand over
+        review_days.
+    """
+    history = DemandHistory.load(company, days=days, end=end)
+    quantities = history.quantities
+
+    if method == ReorderSuggestion.Method.MOVING_AVERAGE:
+        daily_demand = moving_average(quantities, window)
+    elif method == ReorderSuggestion.Method.EXPONENTIAL_SMOOTHING:
+        daily_demand = exponential_smoothing(quantities, alpha)
+    else:
+        raise ValueError("Unknown forecasting method: %s" % method)
+
+    demand_std = quantities[:, -max(1, min(window, history.days)):].std(axis=1)
+    reorder_point = reorder_points(daily_demand, demand_std, lead_time_days, service_level)
+
+    order_up_to = reorder_point + np.ceil(daily_demand * review_days)
+    suggested_quantity = np.where(
+        history.positions <= reorder_point,
+        np.maximum(order_up_to - history.positions, 0),
+        0
+    )
+
+    now = timezone.now()
+    suggestions = [
+        ReorderSuggestion(
+            item_id=item_id,
+            method=method,
+            daily_demand=demand,
+            demand_std=std,
+            reorder_point=point,
+            suggested_quantity=quantity,
+            date_computed=now,
+        )
+        for item_id, demand, std, point, quantity in zip(
+            history.item_ids.tolist(),
+            daily_demand.tolist(),
+            demand_std.tolist(),
+            reorder_point.astype(np.int64).tolist(),
+            suggested_quantity.astype(np.int64).tolist(),
+        )
+    ]
+
+    if save:
+        with transaction.atomic():
+            ReorderSuggestion.objects.filter(item__company=company).delete()
+            ReorderSuggestion.objects.bulk_create(suggestions, batch_size=1000)
+            # The suggestions are shown on the item pages
+            caching.invalidate_companies([company.pk])
+
+    return suggestions
@@ -1,13 +1,15 @@
 from django import forms
 from .models import Item, Shipment, ShipmentItem, Company
-from django.forms.models import inlineformset_factory, BaseInlineFormSet
+from .imports import IMPORT_FORMATS
+from django.forms.models import inlineformset_factory, BaseInlineFormSet, ModelChoiceIteratorValue
+from django.utils.functional import cached_property
 
 """
     The following classes override the default Django ModelForms
     behavior for the different classes within Logitrack.
 
-    The ShipmentItemCreateFormSet is the only class within this file,
-    at the time of writing, that overrides any default methods.
+    The ShipmentItemCreateFormSet overrides the default methods of the
+    inline formset, so that its forms share the items they can select.
 
 """
 class ItemCreateForm(forms.ModelForm):
@@ -21,6 +23,29 @@ class ItemCreateForm(forms.ModelForm):
 
 
 
+class ItemImportForm(forms.Form):
+    import_file = forms.FileField(label='CSV or NDJSON file')
+    file_format = forms.ChoiceField(
+        choices=[('', 'Guess from the file name')] + [(name, name.upper()) for name in IMPORT_FORMATS],
+        required=False
+    )
+
+
+
+class ItemSearchForm(forms.Form):
+    """
+        The following form searches items by SKU prefix or product name,
+        optionally within a single company (see inventory/search.py).
+    """
+    q = forms.CharField(label='SKU or product name', max_length=200, required=False)
+    company = forms.ModelChoiceField(
+        queryset=Company.objects.order_by('name'),
+        empty_label='All companies',
+        required=False
+    )
+
+
+
 class CompanyCreateForm(forms.ModelForm):
     class Meta:
         model = Company
@@ -43,6 +68,45 @@ class ShipmentShipForm(forms.ModelForm):
 
 
 
+class ShipmentBatchShipForm(forms.Form):
+    """
+        The following form selects the shipments of a company to be shipped
+        or received in a single batch: either the shipments ticked in the
+        list, or all of the open shipments promised on or before the cutoff.
+    """
+    direction = forms.ChoiceField(choices=[
+        ('OUT', 'Ship outbound shipments'),
+        ('IN', 'Receive inbound shipments'),
+    ])
+    shipments = forms.ModelMultipleChoiceField(
+        queryset=Shipment.objects.none(),
+        widget=forms.CheckboxSelectMultiple,
+        required=False
+    )
+    cutoff = forms.DateTimeField(
+        label='Or all shipments promised on or before',
+        required=False
+    )
+    date_shipped = forms.DateTimeField(label='Ship/Receive Date')
+
+    def __init__(self, *args, company=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['shipments'].queryset = Shipment.objects.filter(
+            company=company, is_shipped=False
+        ).with_totals().order_by('date_promised', 'pk')
+        self.fields['shipments'].label_from_instance = lambda shipment: "%s - %s - promised %s - %s - %.2f kg, %.3f m³" % (
+            shipment.id, shipment.get_status(), shipment.date_promised.date(), shipment.to_address,
+            shipment.total_weight_kg, shipment.total_volume_m3
+        )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('shipments') and not cleaned_data.get('cutoff'):
+            raise forms.ValidationError("Select shipments, or a cutoff date")
+        return cleaned_data
+
+
+
 class ShipmentCreateForm(forms.ModelForm):
     class Meta:
         model = Shipment
@@ -51,11 +115,50 @@ class ShipmentCreateForm(forms.ModelForm):
         ]
 
 
+class SharedModelChoiceField(forms.ModelChoiceField):
+    """
+        A ModelChoiceField that can be given its objects, already read from
+        the database, rather than querying them itself. The forms of a
+        formset can then share a single query for the options of their
+        <select> and the validation of the selected object.
+    """
+    objects = None
+
+    def share_objects(self, objects, choices=None):
+        """
+            Sets the objects that can be selected, as a dictionary of objects
+            by primary key, and the choices rendering them (see
+            ShipmentItemCreateFormSet.item_choices). Fields rendered as
+            hidden inputs need no choices.
+        """
+        self.objects = objects
+        if choices is not None:
+            empty_choice = [('', self.empty_label)] if self.empty_label is not None else []
+            self.choices = empty_choice + choices
+
+    def to_python(self, value):
+        if self.objects is None or value in self.empty_values:
+            return super().to_python(value)
+
+        try:
+            return self.objects[self.queryset.model._meta.pk.to_python(value)]
+        except (KeyError, TypeError, ValueError, forms.ValidationError):
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+
+
+
 class ShipmentItemCreateFormSet(BaseInlineFormSet):
     """
         The following formset is used to allow users to add multiple
         ShipmentItems to a Shipment at a time.
 
+        The items that can be selected are read once, and shared by all of
+        the forms, and the existing lines are read along with their item, so
+        that the formset runs the same number of queries for 1 line or 300.
     """
     class Meta:
         model = ShipmentItem
@@ -63,21 +166,56 @@ class ShipmentItemCreateFormSet(BaseInlineFormSet):
 
     def __init__(self, *args, **kwargs):
         """
-            This method overrides the __init__ method in order to
-            restrict the Select field options to items that are both
-            shippable, and belonging to this company.
-            The company is passed as a keyword argument to the
+            This method overrides the __init__ method in order to read the
+            existing lines of the shipment along with their item.
+            The shipment is passed as the instance keyword argument by the
             view leveraging this formset.
         """
-        company_id = kwargs['instance'].company.id
-        # TODO: check direction of shipment to ensure shippable items
-        # are only excluded from outbound shipments.
+        if kwargs.get('queryset') is None:
+            kwargs['queryset'] = ShipmentItem.objects.select_related('item')
         super(ShipmentItemCreateFormSet, self).__init__(*args, **kwargs)
 
-        # Update each choice field to prevent selection of an item from a
-        # different company.
-        for form in self.forms:
-            form.fields['item'].queryset = Item.objects.filter(company=company_id, is_shippable=True)
+    @cached_property
+    def items(self):
+        """
+            The items that can be selected on the shipment, by primary key:
+            the shippable items belonging to the shipment's company, which
+            prevents the selection of an item from a different company.
+        """
+        # TODO: check direction of shipment to ensure shippable items
+        # are only excluded from outbound shipments.
+        items = Item.objects.filter(
+            company=self.instance.company_id, is_shippable=True
+        ).select_related('company')
+        return {item.pk: item for item in items}
+
+    @cached_property
+    def lines(self):
+        """ The existing lines of the shipment, by primary key """
+        return {line.pk: line for line in self.get_queryset()}
+
+    @cached_property
+    def item_choices(self):
+        """ The options of the item <select>, shared by all of the forms """
+        return [(ModelChoiceIteratorValue(pk, item), str(item)) for pk, item in self.items.items()]
+
+    def add_fields(self, form, index):
+        """
+            This method overrides the add_fields method in order to restrict
+            the Select field options of every form, including the empty form,
+            to the items of the shipment.
+        """
+        super(ShipmentItemCreateFormSet, self).add_fields(form, index)
+        form.fields['item'].queryset = Item.objects.filter(company=self.instance.company_id, is_shippable=True)
+        form.fields['item'].share_objects(self.items, self.item_choices)
+
+        # The hidden id of each existing line is looked up among the lines
+        # already read by the formset, rather than with a query per form
+        id_field = form.fields[self._pk_field.name]
+        form.fields[self._pk_field.name] = SharedModelChoiceField(
+            id_field.queryset, initial=id_field.initial, required=False, widget=id_field.widget
+        )
+        form.fields[self._pk_field.name].share_objects(self.lines)
 
     def save(self, commit=True, *args, **kwargs):
         super(ShipmentItemCreateFormSet, self).save(*args, **kwargs)
@@ -87,4 +225,7 @@ class ShipmentItemCreateFormSet(BaseInlineFormSet):
 
 
 
-ShipmentItemFormset = inlineformset_factory(Shipment, ShipmentItem, formset=ShipmentItemCreateFormSet, fields=('item', 'quantity'))
+ShipmentItemFormset = inlineformset_factory(
+    Shipment, ShipmentItem, formset=ShipmentItemCreateFormSet, fields=('item', 'quantity'),
+    field_classes={'item': SharedModelChoiceField}
+)
@@ -0,0 +1,246 @@
+"""
+    The following module implements the bulk import of items into Logitrack,
+    used by the import_items management command and the item import view.
+
+    Rows are read one at a time from a CSV or NDJSON (one JSON object per
+    line) file, validated, and inserted with bulk_create in batches, so that
+    files with hundreds of thousands of SKUs can be imported without holding
+    them in memory or saving them one at a time.
+"""
+import csv
+import io
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from . import caching, search
+from .models import Company, CompanyInventorySummary, InventoryMovement, Item, SKUFormat
+
+
+# The columns read from each row of an import file. sku, company, and
+# product_name are required, the others fall back to the Item model defaults.
+IMPORT_COLUMNS = [
+    'sku', 'company', 'product_name', 'quantity_available', 'is_shippable',
+    'weight_value', 'weight_unit', 'dimension_x_value', 'dimension_y_value',
+    'dimension_z_value', 'dimension_unit',
+]
+
+IMPORT_FORMATS = ['csv', 'ndjson']
+
+# The errors raised while reading a file that isn't valid CSV or text in
+# the expected encoding, which end the import at the row they occur
+READ_ERRORS = (UnicodeDecodeError, csv.Error)
+
+TRUE_VALUES = {'1', 't', 'true', 'y', 'yes'}
+FALSE_VALUES = {'0', 'f', 'false', 'n', 'no', ''}
+
+
+def guess_format(file_name):
+    """ Returns the import format matching a file's extension """
+    if file_name.lower().endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return 'csv'
+
+
+def read_rows(text_file, file_format):
+    """
+        Yields (row_number, row) tuples from an open text file, where row is a
+        dictionary of column names to values. Rows are read lazily, so that
+        the whole file is never held in memory.
+    """
+    if file_format == 'csv':
+        # Row 1 is the header
+        for row_number, row in enumerate(csv.DictReader(text_file), start=2):
+            yield row_number, row
+
+    elif file_format == 'ndjson':
+        for row_number, line in enumerate(text_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = error
+            yield row_number, row
+
+    else:
+        raise ValueError("Unsupported import format: %s" % file_format)
+
+
+def format_validation_error(error):
+    """ Flattens a ValidationError into a single line, prefixed by field names """
+    if hasattr(error, 'error_dict'):
+        return '; '.join(
+            "%s: %s" % (field, ' '.join(messages))
+            for field, messages in error.message_dict.items()
+        )
+    return '; '.join(error.messages)
+
+
+def open_uploaded_file(uploaded_file, encoding='utf-8'):
+    """ Wraps a binary file (such as an UploadedFile) to be read as text """
+    return io.TextIOWrapper(uploaded_file, encoding=encoding, newline='')
+
+
+class ImportResult:
+    """
+        Keeps track of the outcome of an import: the number of rows read and
+        created, and the errors for each row that was rejected.
+    """
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_created = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def add_error(self, row_number, message):
+        self.errors.append((row_number, message))
+
+    def read_error_message(self, error):
+        """ Describes a READ_ERRORS error that ended the import """
+        return "The file could not be read after row %s: %s. %s rows were imported before the error." % (
+            self.rows_read, error, self.rows_created
+        )
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows_read / self.elapsed if self.elapsed else 0
+
+
+class ItemImporter:
+    """
+        Validates rows of item data and inserts them in batches.
+
+        Company names are resolved through a single name -> id map loaded
+        when the importer is created. SKUs are checked for uniqueness within
+        their company (see ItemQuerySet.validate_unique_batch) and against the
+        companies' SKU formats once per batch, and each batch is inserted in
+        its own transaction, so invalid rows are reported without aborting
+        the rest of the import.
+    """
+    def __init__(self, batch_size=500, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.company_ids = dict(Company.objects.values_list('name', 'id'))
+
+    def run(self, rows, result=None):
+        """
+            Imports the (row_number, row) tuples yielded by rows, and returns
+            an ImportResult. The result may be given, so that the rows
+            imported so far are known if reading the rows fails (see
+            READ_ERRORS); the batches inserted by then are kept.
+        """
+        result = result if result is not None else ImportResult()
+        # The (company id, SKU) pairs read so far
+        seen_skus = set()
+        batch = []
+
+        for row_number, row in rows:
+            result.rows_read += 1
+            try:
+                item = self.build_item(row)
+            except ValidationError as error:
+                result.add_error(row_number, format_validation_error(error))
+                continue
+
+            if (item.company_id, item.sku) in seen_skus:
+                result.add_error(row_number, "SKU %s appears more than once in the file for this company" % item.sku)
+                continue
+            seen_skus.add((item.company_id, item.sku))
+
+            batch.append((row_number, item))
+            if len(batch) >= self.batch_size:
+                self.insert_batch(batch, result)
+                batch = []
+
+        if batch:
+            self.insert_batch(batch, result)
+
+        return result
+
+    def build_item(self, row):
+        """
+            Builds an unsaved Item from a row, raising a ValidationError if the
+            row is invalid.
+        """
+        if not isinstance(row, dict):
+            raise ValidationError("The row could not be read: %(error)s", params={'error': row})
+
+        values = {
+            column: row[column] for column in IMPORT_COLUMNS
+            if row.get(column) not in (None, '')
+        }
+
+        missing = [column for column in ('sku', 'company', 'product_name') if column not in values]
+        if missing:
+            raise ValidationError("Missing required columns: %(columns)s", params={'columns': ', '.join(missing)})
+
+        company_name = str(values.pop('company')).strip()
+        company_id = self.company_ids.get(company_name)
+        if company_id is None:
+            raise ValidationError("Unknown company: %(company)s", params={'company': company_name})
+
+        if 'is_shippable' in values:
+            values['is_shippable'] = self.parse_boolean(values['is_shippable'])
+
+        values['sku'] = str(values['sku']).strip()
+        item = Item(company_id=company_id, **values)
+
+        # The company was validated through the lookup map above, and SKU
+        # uniqueness is validated against the database for the whole batch
+        item.clean_fields(exclude=['company'])
+        return item
+
+    def parse_boolean(self, value):
+        if isinstance(value, bool):
+            return value
+        value = str(value).strip().lower()
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        raise ValidationError("Invalid value for is_shippable: %(value)s", params={'value': value})
+
+    def insert_batch(self, batch, result):
+        """
+            Inserts a batch of (row_number, item) tuples, skipping & reporting
+            the items whose SKU already exists in their company or doesn't
+            match the company's SKU format.
+        """
+        duplicates = Item.objects.validate_unique_batch([item for row_number, item in batch])
+        invalid_skus = {
+            id(item): sku_format.error_message(item.sku)
+            for item, sku_format in SKUFormat.objects.invalid_skus([item for row_number, item in batch])
+        }
+
+        new_items = []
+        for index, (row_number, item) in enumerate(batch):
+            if id(item) in invalid_skus:
+                result.add_error(row_number, invalid_skus[id(item)])
+            elif index in duplicates:
+                result.add_error(row_number, "An item with SKU %s already exists for this company" % item.sku)
+            else:
+                new_items.append((row_number, item))
+
+        try:
+            with transaction.atomic():
+                Item.objects.bulk_create([item for row_number, item in new_items])
+                CompanyInventorySummary.objects.apply_item_deltas(added=[item for row_number, item in new_items])
+                InventoryMovement.objects.record_items([item for row_number, item in new_items], InventoryMovement.Kind.ADJUST)
+                search.index_items([item for row_number, item in new_items], replace=False)
+                caching.invalidate_companies(item.company_id for row_number, item in new_items)
+        except IntegrityError as error:
+            # Another process created one of the SKUs since the check above
+            for row_number, item in new_items:
+                result.add_error(row_number, "The batch containing this row could not be saved: %s" % error)
+        else:
+            result.rows_created += len(new_items)
+
+        if self.progress is not None:
+            self.progress(result)
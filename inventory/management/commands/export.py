@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.exports import EXPORT_DATASETS, EXPORT_FORMATS, ExportError, build_export_queryset, export_rows
+
+
+class Command(BaseCommand):
+    """
+        The following command exports items, shipments or shipment lines as
+        CSV or NDJSON, to a file or to standard output. Rows are streamed from
+        the database, so memory use does not grow with the number of rows.
+    """
+    help = "Export items, shipments or shipment lines as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORT_DATASETS))
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help="File to write the export to. Defaults to standard output")
+        parser.add_argument('--company', type=int, help="Only export rows for this company id")
+        parser.add_argument('--created-after', help="Only export shipments created on or after this date")
+        parser.add_argument('--created-before', help="Only export shipments created before this date")
+        parser.add_argument('--shipped-after', help="Only export shipments shipped on or after this date")
+        parser.add_argument('--shipped-before', help="Only export shipments shipped before this date")
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help="Number of rows read from the database at a time",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            queryset = build_export_queryset(
+                options['dataset'],
+                company=options['company'],
+                created_after=options['created_after'],
+                created_before=options['created_before'],
+                shipped_after=options['shipped_after'],
+                shipped_before=options['shipped_before'],
+            )
+        except ExportError as error:
+            raise CommandError(error)
+
+        lines = export_rows(options['dataset'], queryset, options['format'], chunk_size=options['chunk_size'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.forecasting import forecast_company
+from inventory.models import Company, ReorderSuggestion
+
+
+class Command(BaseCommand):
+    """
+        The following command forecasts the daily demand of all of the items
+        of one or all companies from their shipment history, and replaces
+        their reorder suggestions. See inventory/forecasting.py.
+    """
+    help = "Forecast item demand and compute reorder suggestions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help="Only forecast the items of this company (id)")
+        parser.add_argument(
+            '--method',
+            choices=ReorderSuggestion.Method.values,
+            default=ReorderSuggestion.Method.EXPONENTIAL_SMOOTHING,
+            help="Moving average (sma) or exponential smoothing (ses)",
+        )
+        parser.add_argument('--days', type=int, default=730, help="Number of days of shipment history to read")
+        parser.add_argument('--window', type=int, default=28, help="Number of days averaged by the moving average, and used for the demand's variability")
+        parser.add_argument('--alpha', type=float, default=0.2, help="Smoothing factor of the exponential smoothing")
+        parser.add_argument('--lead-time', type=int, default=7, help="Days between ordering and receiving an item")
+        parser.add_argument('--review-days', type=int, default=14, help="Days of demand covered by a suggested order")
+        parser.add_argument('--service-level', type=float, default=0.95, help="Probability of not running out during the lead time")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1 or options['window'] < 1:
+            raise CommandError("--days and --window must be at least 1")
+        if not 0 < options['alpha'] <= 1:
+            raise CommandError("--alpha must be between 0 (excluded) and 1")
+        if not 0 < options['service_level'] < 1:
+            raise CommandError("--service-level must be between 0 and 1 (excluded)")
+
+        companies = Company.objects.order_by('pk')
+        if options['company'] is not None:
+            companies = companies.filter(pk=options['company'])
+            if not companies:
+                raise CommandError("Unknown company: %s" % options['company'])
+
+        for company in companies:
+            start = time.perf_counter()
+            suggestions = forecast_company(
+                company,
+                method=options['method'],
+                days=options['days'],
+                window=options['window'],
+                alpha=options['alpha'],
+                lead_time_days=options['lead_time'],
+                review_days=options['review_days'],
+                service_level=options['service_level'],
+            )
+            to_order = sum(1 for suggestion in suggestions if suggestion.suggested_quantity)
+            self.stdout.write(
+                "%s: forecast %s items in %.2fs, %s to reorder"
+                % (company.name, len(suggestions), time.perf_counter() - start, to_order)
+            )
+        self.stdout.write(self.style.SUCCESS("Reorder suggestions updated"))
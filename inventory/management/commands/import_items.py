@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.imports import IMPORT_FORMATS, READ_ERRORS, ImportResult, ItemImporter, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    """
+        The following command imports items from a CSV or NDJSON file. See
+        inventory/imports.py for the supported columns.
+
+        Rows that fail validation are reported and skipped, without aborting
+        the import of the other rows.
+    """
+    help = "Import items in bulk from a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to the file to import")
+        parser.add_argument(
+            '--format',
+            choices=IMPORT_FORMATS,
+            help="Format of the file. Guessed from the file extension by default",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Number of items validated & inserted per transaction",
+        )
+        parser.add_argument('--encoding', default='utf-8')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or guess_format(options['path'])
+
+        def progress(result):
+            self.stdout.write(
+                "%s rows read, %s created, %s errors (%.0f rows/s)"
+                % (result.rows_read, result.rows_created, len(result.errors), result.rows_per_second)
+            )
+
+        importer = ItemImporter(batch_size=options['batch_size'], progress=progress)
+        result = ImportResult()
+
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as import_file:
+                importer.run(read_rows(import_file, file_format), result)
+        except OSError as error:
+            raise CommandError("Could not read %s: %s" % (options['path'], error))
+        except READ_ERRORS as error:
+            raise CommandError(result.read_error_message(error))
+
+        for row_number, message in result.errors:
+            self.stderr.write("Row %s: %s" % (row_number, message))
+
+        self.stdout.write(self.style.SUCCESS(
+            "Imported %s of %s rows in %.1fs (%.0f rows/s)"
+            % (result.rows_created, result.rows_read, result.elapsed, result.rows_per_second)
+        ))
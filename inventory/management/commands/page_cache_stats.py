@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.caching import get_page_cache, page_cache_stats
+
+
+class Command(BaseCommand):
+    """
+        The following command reports the hits, misses & hit rate of each
+        cached page (see inventory/caching.py) since the counters were last
+        reset, which they are with --reset.
+    """
+    help = "Report the hit rate of the page cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters once reported")
+
+    def handle(self, *args, **options):
+        if get_page_cache() is None:
+            raise CommandError("The page cache is disabled (LOGITRACK_PAGE_CACHE)")
+
+        self.stdout.write("%-15s %8s %8s %9s" % ('page', 'hits', 'misses', 'hit rate'))
+        for name, stats in page_cache_stats(reset=options['reset']).items():
+            hit_rate = '-' if stats['hit_rate'] is None else "%.1f%%" % (stats['hit_rate'] * 100)
+            self.stdout.write("%-15s %8s %8s %9s" % (name, stats['hits'], stats['misses'], hit_rate))
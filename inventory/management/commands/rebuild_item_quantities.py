@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inventory import caching
+from inventory.models import CompanyInventorySummary, InventoryMovement, Item
+
+
+class Command(BaseCommand):
+    """
+        The following command recomputes each item's inbound & allocated
+        totals from the open shipment lines, and compares them against the
+        totals stored on the Item model. The companies' inventory summaries
+        are then recomputed from the items, and compared in the same way.
+
+        By default, any mismatched totals are corrected. With --check, the
+        mismatches are only reported and the command exits with an error if
+        any are found.
+    """
+    help = "Rebuild & verify the stored inbound/allocated totals of items and the company inventory summaries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only report mismatched totals, without correcting them",
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help="Number of items read from the database at a time",
+        )
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+
+        with transaction.atomic():
+            items = Item.objects.with_shipment_quantities().values_list(
+                'pk', 'sku',
+                'quantity_inbound_total', 'quantity_allocated_total',
+                'open_quantity_inbound', 'open_quantity_allocated',
+            ).order_by('pk')
+
+            checked = 0
+            mismatches = []
+            for pk, sku, inbound, allocated, open_inbound, open_allocated in items.iterator(chunk_size=options['chunk_size']):
+                checked += 1
+                if inbound == open_inbound and allocated == open_allocated:
+                    continue
+
+                self.stdout.write(
+                    "Item %s (%s): inbound %s, expected %s - allocated %s, expected %s"
+                    % (pk, sku, inbound, open_inbound, allocated, open_allocated)
+                )
+                mismatches.append((pk, inbound, allocated, open_inbound, open_allocated))
+
+            if not check_only:
+                for pk, inbound, allocated, open_inbound, open_allocated in mismatches:
+                    Item.objects.filter(pk=pk).update(
+                        quantity_inbound_total=open_inbound,
+                        quantity_allocated_total=open_allocated,
+                    )
+                    # Keep the inventory ledger in line with the corrected totals
+                    InventoryMovement.objects.record(
+                        pk,
+                        InventoryMovement.Kind.CORRECTION,
+                        inbound_delta=open_inbound - inbound,
+                        allocated_delta=open_allocated - allocated,
+                    )
+
+            summary_mismatches = CompanyInventorySummary.objects.rebuild(save=not check_only)
+
+            if not check_only and (mismatches or summary_mismatches):
+                caching.invalidate_all()
+
+        if check_only and (mismatches or summary_mismatches):
+            raise CommandError(
+                "%s of %s items have mismatched totals, %s company inventory summaries are out of date"
+                % (len(mismatches), checked, summary_mismatches)
+            )
+
+        action = "found" if check_only else "corrected"
+        self.stdout.write(self.style.SUCCESS(
+            "Checked %s items, %s %s mismatched totals and %s out of date company inventory summaries"
+            % (checked, action, len(mismatches), summary_mismatches)
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory import search
+
+
+class Command(BaseCommand):
+    """
+        The following command rebuilds the item search index from the items
+        table (see inventory/search.py). On SQLite, the index is an FTS5 table
+        kept up to date by Item.save & Item.delete and the bulk imports, and
+        this command repairs it after items were changed some other way (raw
+        SQL, queryset updates of product names, ...). On PostgreSQL, the
+        index is maintained by the database and there is nothing to rebuild.
+    """
+    help = "Rebuild the item search index"
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        if backend != 'fts5':
+            self.stdout.write("The %s search backend has no index to rebuild" % backend)
+            return
+
+        with transaction.atomic():
+            indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Indexed %s items" % indexed))
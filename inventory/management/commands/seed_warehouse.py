@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from inventory.seeding import WarehouseSeeder
+
+
+class Command(BaseCommand):
+    """
+        The following command fills the database with a synthetic warehouse:
+        companies, their items, and inbound & outbound shipments with lines.
+        See inventory/seeding.py for how the data is generated.
+
+        The same --seed always generates the same data, so that benchmarks
+        and manual tests can be repeated against identical datasets.
+    """
+    help = "Generate companies, items and shipments with lines, for benchmarking & testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=5, help="Number of companies to create")
+        parser.add_argument('--items', type=int, default=200, help="Number of items per company")
+        parser.add_argument('--shipments', type=int, default=50, help="Number of shipments per company")
+        parser.add_argument('--lines', type=int, default=10, help="Maximum number of lines per shipment")
+        parser.add_argument(
+            '--shipped-ratio',
+            type=float,
+            default=0.7,
+            help="Share of the shipments that are already shipped or received",
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random number generator")
+        parser.add_argument(
+            '--label',
+            default='SEED',
+            help="Prefix of the generated company names & SKUs. Use a different label to seed the same database twice",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of rows per INSERT")
+
+    def handle(self, *args, **options):
+        for option in ('companies', 'items', 'shipments', 'lines'):
+            if options[option] < 0:
+                raise CommandError("--%s can't be negative" % option)
+
+        if not 0 <= options['shipped_ratio'] <= 1:
+            raise CommandError("--shipped-ratio must be between 0 and 1")
+
+        seeder = WarehouseSeeder(
+            companies=options['companies'],
+            items_per_company=options['items'],
+            shipments_per_company=options['shipments'],
+            lines_per_shipment=options['lines'],
+            shipped_ratio=options['shipped_ratio'],
+            seed=options['seed'],
+            label=options['label'],
+            batch_size=options['batch_size'],
+        )
+
+        try:
+            result = seeder.run()
+        except IntegrityError as error:
+            raise CommandError(
+                "Could not seed the warehouse (%s). Is there already data with the label %s?"
+                % (error, options['label'])
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            "Created %s companies, %s items, %s shipments and %s shipment lines"
+            % (result.companies, result.items, result.shipments, result.shipment_lines)
+        ))
@@ -0,0 +1,71 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import Company
+from inventory.shipping import ship_shipments
+
+
+def parse_datetime(value):
+    """ Parses a date (2022-01-31) or datetime (2022-01-31 17:00) argument """
+    try:
+        return forms.DateTimeField().clean(value)
+    except ValidationError:
+        raise CommandError("Invalid date: %s" % value)
+
+
+class Command(BaseCommand):
+    """
+        The following command ships outbound shipments and receives inbound
+        shipments in a single batch, either by id, or all of a company's open
+        shipments promised on or before a cutoff date. See
+        inventory/shipping.py.
+
+        Shipments that can't be shipped (unknown, already shipped, ...) are
+        reported, and the others are shipped unless --require-all is given.
+    """
+    help = "Ship or receive many shipments at once"
+
+    def add_arguments(self, parser):
+        parser.add_argument('shipments', nargs='*', type=int, help="Ids of the shipments to ship or receive")
+        parser.add_argument('--company', type=int, help="Ship the open shipments of this company (id)")
+        parser.add_argument('--cutoff', help="With --company, only ship the shipments promised on or before this date")
+        parser.add_argument('--direction', choices=['IN', 'OUT'], help="Only ship outbound (OUT) or receive inbound (IN) shipments")
+        parser.add_argument('--date-shipped', help="The ship/receive date. Defaults to now")
+        parser.add_argument(
+            '--require-all',
+            action='store_true',
+            help="Ship nothing if any of the shipments can't be shipped",
+        )
+
+    def handle(self, *args, **options):
+        if not options['shipments'] and options['company'] is None:
+            raise CommandError("Provide shipment ids, or a company with --company")
+        if options['shipments'] and options['cutoff']:
+            raise CommandError("--cutoff can only be used with --company, without shipment ids")
+
+        company = None
+        if options['company'] is not None:
+            company = Company.objects.filter(pk=options['company']).first()
+            if company is None:
+                raise CommandError("Unknown company: %s" % options['company'])
+
+        result = ship_shipments(
+            options['shipments'] or None,
+            company=company,
+            cutoff=parse_datetime(options['cutoff']) if options['cutoff'] else None,
+            direction=options['direction'],
+            date_shipped=parse_datetime(options['date_shipped']) if options['date_shipped'] else None,
+            require_all=options['require_all'],
+        )
+
+        for shipment in result.results:
+            if shipment['status'] == 'error':
+                self.stderr.write("Shipment %s: %s" % (shipment['id'], ' '.join(shipment['errors'])))
+            else:
+                self.stdout.write("Shipment %s: %s, %s lines closed" % (shipment['id'], shipment['status'], shipment['lines_closed']))
+
+        summary = "%s shipments shipped or received, %s errors" % (len(result.shipped), len(result.errors))
+        if result.errors and (options['require_all'] or not result.shipped):
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
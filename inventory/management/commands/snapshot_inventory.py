@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.management.commands.ship_shipments import parse_datetime
+from inventory.models import Company, InventorySnapshot, Item
+
+
+class Command(BaseCommand):
+    """
+        The following command snapshots the quantities of the items that have
+        moved since their latest snapshot, as computed from the inventory
+        ledger (see InventoryMovement & InventorySnapshot).
+
+        It is meant to be run periodically (e.g. nightly), so that reading an
+        item's quantities on a past date only reads the movements of one
+        period. Snapshots can be taken as of a past date with --at.
+    """
+    help = "Snapshot the item quantities from the inventory ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', help="Take the snapshots as of this date (2022-01-31 or 2022-01-31 17:00). Defaults to now")
+        parser.add_argument('--company', type=int, help="Only snapshot the items of this company (id)")
+
+    def handle(self, *args, **options):
+        at = parse_datetime(options['at']) if options['at'] else timezone.now()
+        if at > timezone.now():
+            raise CommandError("Snapshots can't be taken as of a future date")
+
+        items = Item.objects.all()
+        if options['company'] is not None:
+            if not Company.objects.filter(pk=options['company']).exists():
+                raise CommandError("Unknown company: %s" % options['company'])
+            items = items.filter(company=options['company'])
+
+        taken = InventorySnapshot.objects.take(at, items=items)
+        self.stdout.write(self.style.SUCCESS("Took %s snapshots as of %s" % (taken, at)))
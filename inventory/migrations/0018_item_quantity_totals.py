@@ -0,0 +1,46 @@
+# Generated by Django 4.0.1 on 2026-10-18 05:40
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_quantity_totals(apps, schema_editor):
+    """
+    Computes the initial inbound & allocated totals from the open shipment
+    lines already in the database.
+    """
+    Item = apps.get_model('inventory', 'Item')
+    ShipmentItem = apps.get_model('inventory', 'ShipmentItem')
+
+    field_names = {'IN': 'quantity_inbound_total', 'OUT': 'quantity_allocated_total'}
+    open_quantities = (
+        ShipmentItem.objects
+        .filter(is_open=True, shipment__is_shipped=False)
+        .values('item_id', 'shipment__direction')
+        .annotate(total=Sum('quantity'))
+    )
+    for row in open_quantities:
+        Item.objects.filter(pk=row['item_id']).update(
+            **{field_names[row['shipment__direction']]: row['total']}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_alter_shipmentitem_shipment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='quantity_allocated_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='quantity_inbound_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_quantity_totals, migrations.RunPython.noop),
+    ]
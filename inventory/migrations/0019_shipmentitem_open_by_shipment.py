@@ -0,0 +1,17 @@
+# Generated by Django 4.0.1 on 2026-10-18 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_item_quantity_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shipmentitem',
+            index=models.Index(condition=models.Q(('is_open', True)), fields=['shipment', 'item'], name='shipmentitem_open_by_shipment'),
+        ),
+    ]
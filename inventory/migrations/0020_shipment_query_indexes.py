@@ -0,0 +1,25 @@
+# Generated by Django 4.0.1 on 2026-10-18 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_shipmentitem_open_by_shipment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(condition=models.Q(('is_shipped', False)), fields=['company', 'direction'], name='shipment_company_open'),
+        ),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['company', 'date_created', 'id'], name='shipment_company_created'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentitem',
+            index=models.Index(condition=models.Q(('is_open', True)), fields=['item', 'shipment', 'quantity'], name='shipmentitem_open_by_item'),
+        ),
+    ]
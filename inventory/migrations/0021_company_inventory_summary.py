@@ -0,0 +1,52 @@
+# Generated by Django 4.0.1 on 2026-10-18 06:01
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def populate_summaries(apps, schema_editor):
+    """
+    Computes the inventory summary of each company from the items already in
+    the database.
+    """
+    Company = apps.get_model('inventory', 'Company')
+    CompanyInventorySummary = apps.get_model('inventory', 'CompanyInventorySummary')
+
+    totals = Company.objects.annotate(
+        sku_count=Count('item_company'),
+        units_available=Coalesce(Sum('item_company__quantity_available'), 0),
+        units_inbound=Coalesce(Sum('item_company__quantity_inbound_total'), 0),
+        units_allocated=Coalesce(Sum('item_company__quantity_allocated_total'), 0),
+    ).values('pk', 'sku_count', 'units_available', 'units_inbound', 'units_allocated')
+
+    CompanyInventorySummary.objects.bulk_create([
+        CompanyInventorySummary(
+            company_id=row.pop('pk'),
+            **row
+        )
+        for row in totals
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0020_shipment_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyInventorySummary',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inventory_summary', serialize=False, to='inventory.company')),
+                ('sku_count', models.PositiveIntegerField(default=0)),
+                ('units_available', models.BigIntegerField(default=0)),
+                ('units_inbound', models.BigIntegerField(default=0)),
+                ('units_allocated', models.BigIntegerField(default=0)),
+                ('date_last_modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
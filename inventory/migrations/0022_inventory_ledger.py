@@ -0,0 +1,71 @@
+# Generated by Django 4.0.1 on 2026-10-18 06:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def take_baseline_snapshots(apps, schema_editor):
+    """
+    Snapshots the current quantities of the items already in the database,
+    as the starting point of their history in the inventory ledger.
+    """
+    Item = apps.get_model('inventory', 'Item')
+    InventorySnapshot = apps.get_model('inventory', 'InventorySnapshot')
+
+    now = django.utils.timezone.now()
+    items = Item.objects.values_list('pk', 'quantity_available', 'quantity_inbound_total', 'quantity_allocated_total')
+    InventorySnapshot.objects.bulk_create([
+        InventorySnapshot(
+            item_id=pk,
+            date=now,
+            quantity_available=available,
+            quantity_inbound_total=inbound,
+            quantity_allocated_total=allocated,
+        )
+        for pk, available, inbound, allocated in items
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0021_company_inventory_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('quantity_available', models.IntegerField(default=0)),
+                ('quantity_inbound_total', models.IntegerField(default=0)),
+                ('quantity_allocated_total', models.IntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='inventory.item')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shipment_item_id', models.BigIntegerField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('create', 'Shipment line created'), ('edit', 'Shipment line edited'), ('delete', 'Shipment line deleted'), ('close', 'Shipment line closed'), ('adjust', 'Item quantity adjusted'), ('correction', 'Totals corrected')], max_length=10)),
+                ('available_delta', models.IntegerField(default=0)),
+                ('inbound_delta', models.IntegerField(default=0)),
+                ('allocated_delta', models.IntegerField(default=0)),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_movements', to='inventory.item')),
+                ('shipment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.shipment')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='inventorysnapshot',
+            constraint=models.UniqueConstraint(fields=('item', 'date'), name='snapshot_unique_item_date'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovement',
+            index=models.Index(fields=['item', 'date_created'], name='movement_by_item_date'),
+        ),
+        migrations.RunPython(take_baseline_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.0.1 on 2026-10-18 06:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0022_inventory_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reorder_suggestion', serialize=False, to='inventory.item')),
+                ('method', models.CharField(choices=[('sma', 'Moving average'), ('ses', 'Exponential smoothing')], max_length=3)),
+                ('daily_demand', models.FloatField()),
+                ('demand_std', models.FloatField()),
+                ('reorder_point', models.PositiveIntegerField()),
+                ('suggested_quantity', models.PositiveIntegerField()),
+                ('date_computed', models.DateTimeField()),
+            ],
+        ),
+    ]
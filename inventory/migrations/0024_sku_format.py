@@ -0,0 +1,32 @@
+# Generated by Django 4.0.1 on 2026-10-18 06:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """
+    Replaces the empty SKUFormat placeholder, which had no fields and so no
+    data to keep, with the per-company SKU formats.
+    """
+
+    dependencies = [
+        ('inventory', '0023_reorder_suggestion'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='SKUFormat',
+        ),
+        migrations.CreateModel(
+            name='SKUFormat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('syntax', models.CharField(choices=[('template', 'Template (A = letter, 9 = digit, X = letter or digit, * = one or more)'), ('regex', 'Regular expression')], default='template', max_length=8)),
+                ('pattern', models.CharField(max_length=200)),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('date_last_modified', models.DateTimeField(auto_now=True)),
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sku_format', to='inventory.company')),
+            ],
+        ),
+    ]
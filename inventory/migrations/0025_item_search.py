@@ -0,0 +1,63 @@
+# Generated by Django 4.0.1 on 2026-10-18 07:10
+
+import sqlite3
+
+from django.db import migrations, models
+
+
+def sqlite_trigram_available():
+    """ Whether the SQLite library supports FTS5 tables with the trigram tokenizer """
+    try:
+        memory = sqlite3.connect(':memory:')
+        try:
+            memory.execute("CREATE VIRTUAL TABLE test USING fts5(name, tokenize='trigram')")
+        finally:
+            memory.close()
+    except sqlite3.Error:
+        return False
+    return True
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Creates the trigram index of the items' product names (see
+    inventory/search.py): a pg_trgm GIN index on PostgreSQL, or an FTS5 table
+    filled from the items table on SQLite. Other databases have no index.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX inventory_item_product_name_trgm ON inventory_item USING gin (product_name gin_trgm_ops)"
+        )
+    elif vendor == 'sqlite' and sqlite_trigram_available():
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE inventory_item_search USING fts5(product_name, company, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            "INSERT INTO inventory_item_search (rowid, product_name, company) "
+            "SELECT id, product_name, '~' || company_id || '~' FROM inventory_item"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS inventory_item_product_name_trgm")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS inventory_item_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0024_sku_format'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['company', 'sku'], name='item_company_sku'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
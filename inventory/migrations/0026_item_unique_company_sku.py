@@ -0,0 +1,118 @@
+# Generated by Django 4.0.1 on 2026-10-18 07:40
+
+from django.db import migrations, models, transaction
+
+
+UNIQUE_COMPANY_SKU = models.UniqueConstraint(fields=['company', 'sku'], name='item_unique_company_sku')
+COMPANY_SKU_INDEX = models.Index(fields=['company', 'sku'], name='item_company_sku')
+
+
+def sku_fields(Item):
+    """ Returns the globally unique sku field of the old state, and the indexed field replacing it """
+    old_field = Item._meta.get_field('sku')
+    new_field = models.CharField(max_length=16, db_index=True)
+    new_field.set_attributes_from_name('sku')
+    new_field.model = Item
+    return old_field, new_field
+
+
+def replace_sku_index(apps, schema_editor):
+    """
+    Replaces the unique index of Item.sku with a (company, sku) unique
+    constraint, and a plain index on sku.
+
+    On PostgreSQL, the new indexes are built with CREATE INDEX CONCURRENTLY,
+    which doesn't block writes to the items table while the index is built,
+    and the unique index is then turned into the constraint. The existing
+    (company, sku) index of the item search is dropped once the constraint
+    can take its place.
+
+    On other databases, the schema editor alters the field and adds the
+    constraint. On SQLite, that means copying the table once to drop the
+    inline UNIQUE, and creating the constraint as a unique index rather than
+    copying the table a second time.
+    """
+    Item = apps.get_model('inventory', 'Item')
+    connection = schema_editor.connection
+    table = Item._meta.db_table
+    old_field, new_field = sku_fields(Item)
+
+    if connection.vendor == 'postgresql':
+        quote_name = schema_editor.quote_name
+        unique_names = schema_editor._constraint_names(Item, [old_field.column], unique=True, primary_key=False)
+        sku_index = schema_editor._create_index_name(table, [new_field.column])
+
+        schema_editor.execute("CREATE UNIQUE INDEX CONCURRENTLY %s ON %s (%s, %s)" % (
+            quote_name(UNIQUE_COMPANY_SKU.name), quote_name(table), quote_name('company_id'), quote_name('sku')
+        ))
+        schema_editor.execute("CREATE INDEX CONCURRENTLY %s ON %s (%s)" % (
+            quote_name(sku_index), quote_name(table), quote_name('sku')
+        ))
+        schema_editor.execute("ALTER TABLE %s ADD CONSTRAINT %s UNIQUE USING INDEX %s" % (
+            quote_name(table), quote_name(UNIQUE_COMPANY_SKU.name), quote_name(UNIQUE_COMPANY_SKU.name)
+        ))
+        for name in unique_names:
+            schema_editor.execute("ALTER TABLE %s DROP CONSTRAINT %s" % (quote_name(table), quote_name(name)))
+        # The varchar_pattern_ops index of sku (used by LIKE 'ABC%') is kept
+        schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS %s" % quote_name(COMPANY_SKU_INDEX.name))
+        return
+
+    with transaction.atomic(using=connection.alias):
+        # The model of the old state still has the (company, sku) index, so
+        # the copied table gets it back, and it's dropped afterwards
+        schema_editor.alter_field(Item, old_field, new_field)
+        schema_editor.remove_index(Item, COMPANY_SKU_INDEX)
+        schema_editor.execute(UNIQUE_COMPANY_SKU.create_sql(Item, schema_editor))
+
+
+def restore_sku_index(apps, schema_editor):
+    """
+    Restores the global uniqueness of Item.sku, which fails if two companies
+    share a SKU.
+    """
+    Item = apps.get_model('inventory', 'Item')
+    connection = schema_editor.connection
+    old_field, new_field = sku_fields(Item)
+
+    with transaction.atomic(using=connection.alias):
+        schema_editor.execute(UNIQUE_COMPANY_SKU.remove_sql(Item, schema_editor))
+        schema_editor.alter_field(Item, new_field, old_field)
+
+        # Unless the table was copied (SQLite), with the index of the old state
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Item._meta.db_table)
+        if COMPANY_SKU_INDEX.name not in constraints:
+            schema_editor.add_index(Item, COMPANY_SKU_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    # Not atomic, so that the indexes can be built concurrently on PostgreSQL
+    atomic = False
+
+    dependencies = [
+        ('inventory', '0025_item_search'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='item',
+                    name='item_company_sku',
+                ),
+                migrations.AlterField(
+                    model_name='item',
+                    name='sku',
+                    field=models.CharField(db_index=True, max_length=16),
+                ),
+                migrations.AddConstraint(
+                    model_name='item',
+                    constraint=UNIQUE_COMPANY_SKU,
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(replace_sku_index, restore_sku_index),
+            ],
+        ),
+    ]
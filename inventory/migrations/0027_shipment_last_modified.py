@@ -0,0 +1,26 @@
+# Generated by Django 4.0.1 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0026_item_unique_company_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipment',
+            name='date_last_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['company', 'date_last_modified'], name='item_company_modified'),
+        ),
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['company', 'date_last_modified'], name='shipment_company_modified'),
+        ),
+    ]
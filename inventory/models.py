@@ -1,12 +1,130 @@
-from django.db import models
+import datetime
+import functools
+import re
+
+from django.db import connections, models, transaction
 from django.urls import reverse
-from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db.models import Case, Count, Sum, Q, F, OuterRef, Subquery, Exists, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import caching, search, units
 
-import datetime
+
+# The date the inventory ledger starts from, for items without snapshots
+LEDGER_START = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
 
 # Create your models here.
 
+class ItemQuerySet(models.QuerySet):
+    '''
+        Custom queryset for the Item model.
+
+        The inbound and allocated quantities of an item are stored on the Item
+        itself (see Item.quantity_inbound_total and quantity_allocated_total).
+        The methods below compute those same quantities from the shipment
+        lines, and are used to rebuild & verify the stored totals.
+    '''
+
+    def with_shipment_quantities(self):
+        """
+        Annotates each item with the total quantity on open inbound shipments
+        (open_quantity_inbound) and on open outbound shipments
+        (open_quantity_allocated), computed from the ShipmentItem table in a
+        single query.
+        """
+        open_lines = Q(
+            shipmentitem_item__is_open=True,
+            shipmentitem_item__shipment__is_shipped=False
+        )
+
+        return self.annotate(
+            open_quantity_inbound=Coalesce(
+                Sum(
+                    'shipmentitem_item__quantity',
+                    filter=open_lines & Q(shipmentitem_item__shipment__direction='IN')
+                ),
+                0
+            ),
+            open_quantity_allocated=Coalesce(
+                Sum(
+                    'shipmentitem_item__quantity',
+                    filter=open_lines & Q(shipmentitem_item__shipment__direction='OUT')
+                ),
+                0
+            ),
+        )
+
+    def validate_unique_batch(self, items):
+        """
+        Checks the (company, SKU) uniqueness of many items at once, as
+        full_clean would for each item, but with a single query on the
+        (company, sku) unique index for the whole batch rather than one query
+        per item. Items sharing a SKU within the batch are reported as well.
+        Returns a dictionary of ValidationErrors, by the item's position in
+        items.
+        """
+        keys = {(item.company_id, item.sku) for item in items if item.company_id is not None}
+        taken = {}
+        if keys:
+            existing = self.filter(
+                company_id__in={company_id for company_id, sku in keys},
+                sku__in={sku for company_id, sku in keys}
+            ).values_list('company_id', 'sku', 'pk')
+            for company_id, sku, pk in existing:
+                if (company_id, sku) in keys:
+                    taken[(company_id, sku)] = pk
+
+        errors = {}
+        for index, item in enumerate(items):
+            key = (item.company_id, item.sku)
+            if key not in keys:
+                continue
+            if taken.get(key, item.pk) != item.pk:
+                errors[index] = ValidationError({'sku': item.unique_error_message(Item, ('company', 'sku'))})
+            else:
+                # The first item of the batch with this SKU claims it
+                taken[key] = item.pk if item.pk is not None else id(item)
+        return errors
+
+    def with_measures(self):
+        """
+        Annotates each item with its weight in kilograms (weight_kg) and its
+        volume in cubic meters (volume_m3), converted by the database from
+        the item's own units (see inventory/units.py).
+        """
+        return self.annotate(weight_kg=units.weight_kg(), volume_m3=units.volume_m3())
+
+    def with_quantities_at(self, at):
+        """
+        Annotates each item with its quantities as of the date at
+        (quantity_available_at, quantity_inbound_total_at and
+        quantity_allocated_total_at), computed from its latest snapshot on or
+        before at plus its movements since the snapshot, and with the date of
+        that snapshot (snapshot_date).
+        """
+        snapshots = InventorySnapshot.objects.filter(item=OuterRef('pk'), date__lte=at).order_by('-date')
+        movements = InventoryMovement.objects.filter(
+            item=OuterRef('pk'),
+            date_created__gt=OuterRef('snapshot_date'),
+            date_created__lte=at,
+        ).values('item')
+
+        annotations = {
+            'snapshot_date': Coalesce(
+                Subquery(snapshots.values('date')[:1]),
+                Value(LEDGER_START, output_field=models.DateTimeField())
+            ),
+        }
+        for item_field, movement_field in InventoryMovement.QUANTITY_FIELDS.items():
+            annotations['%s_at' % item_field] = (
+                Coalesce(Subquery(snapshots.values(item_field)[:1]), 0) +
+                Coalesce(Subquery(movements.annotate(total=Sum(movement_field)).values('total')), 0)
+            )
+        return self.annotate(**annotations)
+
+
 class Item(models.Model):
     '''
         The following class model represents the items held in the logistic
@@ -29,10 +147,10 @@ class Item(models.Model):
 
     # The identifier used to differentiate between different items. Included
     # on the printing labels in the warehouse to help with picking for shipments.
-    # At the time of writing, SKUs must be unique across all companies. It is
-    # planned to enforce uniqueness only across items within a company, and not
-    # global uniqueness as currently implemented.
-    sku = models.CharField(max_length=16, unique=True)
+    # SKUs are unique within a company (see Meta.constraints), so two companies
+    # may use the same SKU. The index on the SKU alone serves lookups across
+    # companies, such as the item search.
+    sku = models.CharField(max_length=16, db_index=True)
 
 
     company = models.ForeignKey (
@@ -47,6 +165,13 @@ class Item(models.Model):
     # This field tracks the quantity available to be assigned to a shipment
     quantity_available = models.PositiveIntegerField(default=0)
 
+    # Running totals of the quantity of this item on open inbound and outbound
+    # shipment lines. They are maintained by the ShipmentItem and Shipment
+    # models and should never be modified directly. The rebuild_item_quantities
+    # management command recomputes them from the shipment lines.
+    quantity_inbound_total = models.PositiveIntegerField(default=0, editable=False)
+    quantity_allocated_total = models.PositiveIntegerField(default=0, editable=False)
+
     # The date_create and date_last_modified fields are currently for display
     # purposes, but will eventually be used for reporting & forecasting
     date_created = models.DateTimeField(auto_now_add=True)
@@ -78,18 +203,34 @@ class Item(models.Model):
         default=DimensionUnit.M
     )
 
+    objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Also used to look up a company's SKUs, e.g. by prefix in the
+            # item search, or for a whole batch in validate_unique_batch
+            models.UniqueConstraint(fields=['company', 'sku'], name='item_unique_company_sku'),
+        ]
+        indexes = [
+            # Used to find when a company's items last changed, for the
+            # conditional GETs of the item & shipment lists (see caching.py)
+            models.Index(fields=['company', 'date_last_modified'], name='item_company_modified'),
+        ]
+
+    # The fields maintained by the ShipmentItem & Shipment models
+    SHIPMENT_QUANTITY_FIELDS = ['quantity_inbound_total', 'quantity_allocated_total']
 
 
     def can_calculate_volume(self):
         """ A helper method to determine whether an item's volume can be calculated """
-        return not (self.dimension_x_value is None or self.dimension_y_value is None or self.dimension_x_value is None)
+        return not (self.dimension_x_value is None or self.dimension_y_value is None or self.dimension_z_value is None)
 
     def total_volume_unit(self):
         """ A helper method to return the units for an item's volume """
         if not self.can_calculate_volume():
             return None
         else:
-            return "%(dimension_unit)s ^ 3" % self.dimension_unit
+            return "%s ^ 3" % self.dimension_unit
 
     def total_volume_value(self):
         """ A helper method to calculate an item's total volume """
@@ -98,41 +239,44 @@ class Item(models.Model):
         else:
             return self.dimension_x_value * self.dimension_y_value * self.dimension_z_value
 
+    def volume_m3(self):
+        """ A helper method to return the item's volume in cubic meters """
+        if not self.can_calculate_volume() or self.dimension_unit not in units.METERS:
+            return None
+        return self.total_volume_value() * units.METERS[self.dimension_unit] ** 3
+
+    def weight_kg(self):
+        """ A helper method to return the item's weight in kilograms """
+        if self.weight_value is None or self.weight_unit not in units.KILOGRAMS:
+            return None
+        return self.weight_value * units.KILOGRAMS[self.weight_unit]
+
     def quantity_inbound(self):
         """
-        A helper method to calculate the total quantity of the item on all
+        A helper method to return the total quantity of the item on all
         inbound shipments. Used primarily to improve user experience across the
         different views & forms within Logitrack
         """
-        query = ShipmentItem.objects.filter(
-            item=self,
-            shipment__is_shipped=False,
-            shipment__direction='IN',
-            is_open=True
-        ).all().aggregate(Sum('quantity'))
-
-        result = query['quantity__sum'] if query['quantity__sum'] is not None else 0
-        return result
+        return self.quantity_inbound_total
 
     def quantity_allocated(self):
         """
-        A helper method to calculate the total quantity of the item on
+        A helper method to return the total quantity of the item on
         outbound shipments for the item. Used primarily to improve user
         experience across the different views & forms within Logitrack
         """
-
         # Allocated quantity is the sum of the quantities of all of the
         # Shipment items that have not been shipped yet
-        query = ShipmentItem.objects.filter(
-            item_id=self.id,
-            shipment__is_shipped=False,
-            shipment__direction='OUT',
-            is_open=True
-        ).all().aggregate(Sum('quantity'))
+        return self.quantity_allocated_total
 
-        # Check for None before returning the result
-        result = query['quantity__sum'] if query['quantity__sum'] is not None else 0
-        return result
+    def refresh_shipment_quantities(self):
+        """
+        Reloads the inbound & allocated totals from the database. They are
+        updated by other model instances, so the values held by this instance
+        may be out of date.
+        """
+        if self.pk is not None:
+            self.refresh_from_db(fields=self.SHIPMENT_QUANTITY_FIELDS)
 
     def can_have_shipping_disabled(self):
         return self.quantity_allocated() == 0 and self.quantity_inbound() == 0
@@ -180,6 +324,7 @@ class Item(models.Model):
         return '|'.join(fields_to_display)
 
     def delete(self):
+        self.refresh_shipment_quantities()
         qty_inbound = self.quantity_inbound()
         qty_allocated = self.quantity_allocated()
         if qty_inbound > 0 or qty_allocated > 0:
@@ -189,15 +334,120 @@ class Item(models.Model):
                 code="item_on_shipment"
             )
         else:
-            super(Item, self).delete()
+            with transaction.atomic():
+                stored = self.stored_quantities()
+                search.unindex_items([self.pk])
+                super(Item, self).delete()
+                if stored is not None:
+                    CompanyInventorySummary.objects.apply_item_deltas(removed=[stored])
+
+    def quantities_at(self, at):
+        """
+        Returns the item's quantities as of the date at, as a dictionary of
+        Item quantity fields, from the item's latest snapshot on or before at
+        and the movements since, in two queries.
+        """
+        fields = list(InventoryMovement.QUANTITY_FIELDS)
+        snapshot = self.inventory_snapshots.filter(date__lte=at).order_by('-date').values('date', *fields).first()
+
+        movements = self.inventory_movements.filter(date_created__lte=at)
+        if snapshot is not None:
+            movements = movements.filter(date_created__gt=snapshot['date'])
+        totals = movements.aggregate(**{
+            item_field: Coalesce(Sum(movement_field), 0)
+            for item_field, movement_field in InventoryMovement.QUANTITY_FIELDS.items()
+        })
+
+        return {
+            item_field: totals[item_field] + (snapshot[item_field] if snapshot is not None else 0)
+            for item_field in fields
+        }
+
+    def stored_quantities(self):
+        """
+        Reads (and within a transaction, locks) the item's company and
+        quantities as stored in the database, to keep the company's inventory
+        summary up to date when the item is changed.
+        """
+        items = Item.objects.filter(pk=self.pk)
+        if transaction.get_connection().in_atomic_block:
+            items = items.select_for_update()
+        return items.values(*CompanyInventorySummary.ITEM_FIELDS).first()
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        super(Item, self).save(*args, **kwargs)
+
+        # The shipment totals are only ever written by the ShipmentItem and
+        # Shipment models. Leave them out of updates so that a stale instance
+        # can't overwrite them.
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.SHIPMENT_QUANTITY_FIELDS
+            ]
+
+        with transaction.atomic():
+            adding = self._state.adding
+            stored = None if adding else self.stored_quantities()
+            super(Item, self).save(*args, **kwargs)
+            search.index_items([self], replace=not adding)
+
+            # Move the item's quantities in the company inventory summaries
+            # from their stored values to the values that were just saved
+            saved = {}
+            update_fields = kwargs.get('update_fields')
+            for name in CompanyInventorySummary.ITEM_FIELDS:
+                field_name = self._meta.get_field(name).name
+                not_saved = update_fields is not None and field_name not in update_fields
+                if stored is not None and not_saved:
+                    saved[name] = stored[name]
+                else:
+                    saved[name] = getattr(self, name)
+
+            if saved != stored:
+                CompanyInventorySummary.objects.apply_item_deltas(
+                    added=[saved],
+                    removed=[stored] if stored is not None else []
+                )
+
+                InventoryMovement.objects.record(self.pk, InventoryMovement.Kind.ADJUST, **{
+                    movement_field: saved[item_field] - (stored[item_field] if stored is not None else 0)
+                    for item_field, movement_field in InventoryMovement.QUANTITY_FIELDS.items()
+                })
+
+    def validate_unique(self, exclude=None):
+        """
+        Reports a SKU already used within the company as an error of the sku
+        field, rather than of the whole item, as it's the SKU that has to
+        change.
+        """
+        try:
+            super(Item, self).validate_unique(exclude=exclude)
+        except ValidationError as error:
+            errors = error.update_error_dict({})
+            for unique_error in list(errors.get(NON_FIELD_ERRORS, [])):
+                if unique_error.code == 'unique_together' and (unique_error.params or {}).get('unique_check') == ('company', 'sku'):
+                    errors[NON_FIELD_ERRORS].remove(unique_error)
+                    errors.setdefault('sku', []).append(unique_error)
+            if not errors.get(NON_FIELD_ERRORS, True):
+                del errors[NON_FIELD_ERRORS]
+            raise ValidationError(errors)
 
     def clean(self):
         super(Item, self).clean()
 
+        # Unless the company failed validation (clean runs after clean_fields
+        # either way), in which case the error is left to the field
+        if isinstance(self.company_id, int):
+            sku_format = SKUFormat.objects.filter(company_id=self.company_id).first()
+            if sku_format is not None and not sku_format.matches(self.sku):
+                raise ValidationError({'sku': ValidationError(
+                    sku_format.error_message(self.sku),
+                    code="invalid_sku_format"
+                )})
+
+        self.refresh_shipment_quantities()
+
         if not self.can_have_shipping_disabled() and not self.is_shippable:
             raise ValidationError(
                 "You cannot set an item to be non-shippable when it is on shipments",
@@ -221,9 +471,171 @@ class Company(models.Model):
         """ Returns the string representation of Company instances """
         return self.name
 
+    def save(self, *args, **kwargs):
+        """
+        Creates the company's (empty) inventory summary with the company, or
+        marks it as modified, as the company's name is shown with its items
+        """
+        adding = self._state.adding
+        with transaction.atomic():
+            super(Company, self).save(*args, **kwargs)
+            if adding:
+                CompanyInventorySummary.objects.create(company=self)
+            else:
+                CompanyInventorySummary.objects.filter(company=self).update(date_last_modified=timezone.now())
+
+
+class CompanyInventorySummaryQuerySet(models.QuerySet):
+    '''
+        Custom queryset for the CompanyInventorySummary model.
+    '''
+
+    def apply_delta(self, company_id, **deltas):
+        """
+        Adds the given deltas (sku_count=1, units_available=-5, ...) to a
+        company's summary with a single UPDATE. If the company has no summary
+        yet, it is computed from the company's items instead.
+        """
+        updates = {
+            field_name: F(field_name) + delta
+            for field_name, delta in deltas.items() if delta
+        }
+        if not updates:
+            return
+
+        updates['date_last_modified'] = timezone.now()
+        if self.filter(company_id=company_id).update(**updates) == 0:
+            self.rebuild([company_id])
+
+    def apply_item_deltas(self, added=(), removed=()):
+        """
+        Adds the added items to, and removes the removed items from, their
+        companies' summaries, with at most one UPDATE per company. Each item
+        is either an Item, or a dictionary of CompanyInventorySummary.ITEM_FIELDS.
+        """
+        deltas = {}
+        for items, sign in ((added, 1), (removed, -1)):
+            for item in items:
+                if not isinstance(item, dict):
+                    item = {name: getattr(item, name) for name in CompanyInventorySummary.ITEM_FIELDS}
+
+                company_deltas = deltas.setdefault(item['company_id'], {'sku_count': 0})
+                company_deltas['sku_count'] += sign
+                for item_field, summary_field in CompanyInventorySummary.QUANTITY_FIELDS.items():
+                    company_deltas[summary_field] = company_deltas.get(summary_field, 0) + sign * item[item_field]
+
+        for company_id, company_deltas in deltas.items():
+            self.apply_delta(company_id, **company_deltas)
+
+    def rebuild(self, company_ids=None, save=True):
+        """
+        Recomputes the summaries of the given companies (or all companies)
+        from their items, creating any missing summaries. Returns the number
+        of summaries that were out of date (or missing). With save=False, the
+        summaries are only checked, without being corrected.
+        """
+        companies = Company.objects.all()
+        if company_ids is not None:
+            companies = companies.filter(pk__in=company_ids)
+
+        totals = companies.annotate(
+            sku_count=Count('item_company'),
+            **{
+                summary_field: Coalesce(Sum('item_company__%s' % item_field), 0)
+                for item_field, summary_field in CompanyInventorySummary.QUANTITY_FIELDS.items()
+            }
+        ).values_list('pk', 'sku_count', *CompanyInventorySummary.QUANTITY_FIELDS.values())
+
+        fields = ['sku_count'] + list(CompanyInventorySummary.QUANTITY_FIELDS.values())
+        summaries = self.in_bulk([row[0] for row in totals])
+
+        outdated = []
+        missing = []
+        for company_id, *values in totals:
+            summary = summaries.get(company_id)
+            if summary is None:
+                missing.append(CompanyInventorySummary(company_id=company_id, **dict(zip(fields, values))))
+            elif [getattr(summary, name) for name in fields] != values:
+                for name, value in zip(fields, values):
+                    setattr(summary, name, value)
+                summary.date_last_modified = timezone.now()
+                outdated.append(summary)
+
+        if save:
+            self.bulk_update(outdated, fields + ['date_last_modified'])
+            self.bulk_create(missing)
+        return len(outdated) + len(missing)
+
+
+class CompanyInventorySummary(models.Model):
+    '''
+        The following model holds the inventory totals of a company: the
+        number of SKUs and the units available, inbound & allocated across
+        all of its items.
+
+        The totals are maintained incrementally, by the same transactions
+        that change the items' quantities (see Item.save,
+        ShipmentItem.adjust_item_quantities and ShipmentItemQuerySet.close),
+        so that reading them costs a single row, however many items the
+        company has. They can be recomputed with the rebuild_item_quantities
+        management command.
+    '''
+    company = models.OneToOneField(
+        'Company',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='inventory_summary'
+    )
+
+    sku_count = models.PositiveIntegerField(default=0)
+    units_available = models.BigIntegerField(default=0)
+    units_inbound = models.BigIntegerField(default=0)
+    units_allocated = models.BigIntegerField(default=0)
+
+    date_last_modified = models.DateTimeField(auto_now=True)
+
+    objects = CompanyInventorySummaryQuerySet.as_manager()
+
+    # The Item fields summed into each summary field
+    QUANTITY_FIELDS = {
+        'quantity_available': 'units_available',
+        'quantity_inbound_total': 'units_inbound',
+        'quantity_allocated_total': 'units_allocated',
+    }
+
+    # The Item fields read to update the summaries when an item changes
+    ITEM_FIELDS = ['company_id'] + list(QUANTITY_FIELDS)
+
+    def __str__(self):
+        return "Inventory summary of company %s" % self.company_id
 
 
 
+
+class ShipmentQuerySet(models.QuerySet):
+    '''
+        Custom queryset for the Shipment model.
+    '''
+
+    def with_totals(self):
+        """
+        Annotates each shipment with the total weight (total_weight_kg) and
+        volume (total_volume_m3) of its lines, summed by the database from
+        each line's quantity and its item's weight & dimensions, converted to
+        kilograms and cubic meters (see inventory/units.py).
+        """
+        return self.annotate(
+            total_weight_kg=Coalesce(
+                Sum(F('shipmentitem__quantity') * units.weight_kg('shipmentitem__item__')),
+                0.0
+            ),
+            total_volume_m3=Coalesce(
+                Sum(F('shipmentitem__quantity') * units.volume_m3('shipmentitem__item__')),
+                0.0
+            ),
+        )
+
+
 class Shipment(models.Model):
     '''
         The following model captures header-level information about shipments
@@ -244,6 +656,11 @@ class Shipment(models.Model):
 
     date_created = models.DateTimeField(auto_now_add=True)
 
+    # Bumped by every change to the shipment, including shipping it in bulk
+    # (see shipping.ship_shipments). Used as the version of the shipment's
+    # row in the shipment list.
+    date_last_modified = models.DateTimeField(auto_now=True)
+
     # The date on which the shipment is expected to arrive. To be used
     # for upcoming planned Logitrack functionality.
     date_promised = models.DateTimeField()
@@ -262,6 +679,30 @@ class Shipment(models.Model):
         default=ShipmentDirection.OUT
     )
 
+    objects = ShipmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Used to find a company's open (not yet shipped or received)
+            # shipments by direction
+            models.Index(
+                fields=['company', 'direction'],
+                condition=Q(is_shipped=False),
+                name='shipment_company_open'
+            ),
+            # Used by the (keyset paginated) list of a company's shipments,
+            # sorted by creation date
+            models.Index(
+                fields=['company', 'date_created', 'id'],
+                name='shipment_company_created'
+            ),
+            # Used to find when a company's shipments last changed
+            models.Index(
+                fields=['company', 'date_last_modified'],
+                name='shipment_company_modified'
+            ),
+        ]
+
     def get_status(self):
         """
         A helper method to display the shipment status based on the Shipment's
@@ -286,7 +727,19 @@ class Shipment(models.Model):
             not been shipped. This method is planned for use in a build of
             Logitrack that supports partial line-item fulfillment.
         """
-        return ShipmentItem.objects.filter(shipment=self, is_open=True).count() > 0
+        return ShipmentItem.objects.filter(shipment=self, is_open=True).exists()
+
+    def close_shipment_lines(self):
+        """
+            Closes all of the shipment's open lines, and removes their
+            quantities from the items' inbound or allocated totals.
+
+            This is done with one UPDATE on the Item table (adjusting each item
+            by the sum of its open lines), one on the company's inventory
+            summary and one on the ShipmentItem table, regardless of the number
+            of lines on the shipment (see ShipmentItemQuerySet.close).
+        """
+        return ShipmentItem.objects.filter(shipment=self).close(direction=self.direction)
 
     def clean(self, *args, **kwargs):
         """
@@ -299,7 +752,7 @@ class Shipment(models.Model):
         # and no date_shipped value is provided, default the date_shipped to be
         # the current time
         if self.is_shipped and self.date_shipped is None:
-            self.date_shipped = datetime.now()
+            self.date_shipped = timezone.now()
 
     def save(self, *args, **kwargs):
         """
@@ -307,22 +760,225 @@ class Shipment(models.Model):
             method in order to update its related ShipmentItem instance in the
             event that the Shipment is shipped.
 
-            The updates & saves made to the related ShipmentItem instances
-            initiates any updates of inventory quantities for the items. See
-            the ShipmentItem model for more details.
-        """
-        super(Shipment, self).save(*args, **kwargs)
-        # Check to see if ShipmentItems haven't been closed yet before updating
-        # and triggering an adjustment of inventory.
-        if self.is_shipped and self.has_open_shipment_lines():
-            shipment_items = ShipmentItem.objects.filter(shipment=self)
-            for shipment_item in shipment_items:
-                # Update the shipment line so that it no longer factors into
+            The related ShipmentItem instances are closed in bulk (see
+            close_shipment_lines), in the same transaction as the shipment.
+        """
+        with transaction.atomic():
+            super(Shipment, self).save(*args, **kwargs)
+            # Check to see if ShipmentItems haven't been closed yet before updating
+            # and triggering an adjustment of inventory.
+            if self.is_shipped and self.has_open_shipment_lines():
+                # Update the shipment lines so that they no longer factor into
                 # any calculations
-                shipment_item.is_open = False
-                shipment_item.save()
+                self.close_shipment_lines()
+
 
 
+class ShipmentItemQuerySet(models.QuerySet):
+    '''
+        Custom queryset for the ShipmentItem model.
+    '''
+
+    def close(self, direction=None):
+        """
+        Closes the open lines in the queryset, and removes their quantities
+        from the items' inbound or allocated totals, with set-based UPDATEs:
+        one on the Item table and one on the CompanyInventorySummary table per
+        shipment direction (adjusting each item & company by the sum of its
+        open lines), and one on the ShipmentItem table. A close movement is
+        written to the ledger for each line, in bulk (see
+        InventoryMovementQuerySet.record_closed_lines).
+
+        If all of the lines are on shipments of the same direction, passing
+        it as direction saves the UPDATE of the other direction.
+        Returns the number of lines closed.
+        """
+        open_lines = self.filter(is_open=True)
+
+        totals = [('OUT', 'quantity_allocated_total'), ('IN', 'quantity_inbound_total')]
+        if direction is not None:
+            totals = [(direction, dict(totals)[direction])]
+
+        for line_direction, field_name in totals:
+            lines = open_lines if direction is not None else open_lines.filter(shipment__direction=line_direction)
+
+            InventoryMovement.objects.record_closed_lines(lines, field_name)
+
+            item_open_quantity = (
+                lines
+                .filter(item=OuterRef('pk'))
+                .values('item')
+                .annotate(total=Sum('quantity'))
+                .values('total')
+            )
+
+            Item.objects.filter(pk__in=lines.values('item')).update(**{
+                field_name: F(field_name) - Subquery(item_open_quantity),
+                'date_last_modified': timezone.now(),
+            })
+
+            summary_field = CompanyInventorySummary.QUANTITY_FIELDS[field_name]
+            company_open_quantity = (
+                lines
+                .filter(item__company=OuterRef('company'))
+                .values('item__company')
+                .annotate(total=Sum('quantity'))
+                .values('total')
+            )
+
+            CompanyInventorySummary.objects.filter(company__in=lines.values('item__company')).update(**{
+                summary_field: F(summary_field) - Subquery(company_open_quantity),
+                'date_last_modified': timezone.now(),
+            })
+
+        return open_lines.update(is_open=False)
+
+    def bulk_add(self, shipment, lines, batch_size=1000):
+        """
+        Adds lines to a shipment, given as (item_id, quantity) pairs, and
+        returns a tuple of the created ShipmentItems and a dictionary of
+        ValidationErrors, by the line's position in lines. If any line is
+        invalid, no lines are added.
+
+        The lines are validated as ShipmentItem.full_clean would validate
+        each of them (see ShipmentItem.validate_inventory), but the items of
+        the whole batch are read & locked with a single SELECT ... FOR
+        UPDATE. Lines of the same item are checked against the inventory
+        left by the lines before them, as if they were saved one at a time.
+
+        The valid lines are then inserted with bulk_create, and the items'
+        quantities are adjusted with one UPDATE per batch_size items (adding
+        up the lines of each item), one on the company's inventory summary,
+        and a bulk INSERT of the movements into the ledger.
+        """
+        item_field = self.model._meta.get_field('item')
+        is_open = not shipment.is_shipped
+        now = timezone.now()
+
+        with transaction.atomic():
+            new_lines = []
+            item_ids = []
+            errors = {}
+            for index, (item_id, quantity) in enumerate(lines):
+                line = self.model(shipment=shipment, quantity=quantity, is_open=is_open)
+                line_errors = {}
+                try:
+                    line.item_id = item_field.to_python(item_id)
+                except ValidationError as error:
+                    line_errors['item'] = error.error_list
+                else:
+                    if line.item_id is None:
+                        line_errors['item'] = [ValidationError(item_field.error_messages['null'], code='null')]
+
+                # The item is validated against the items read below, rather
+                # than with a query per line
+                try:
+                    line.clean_fields(exclude=['shipment', 'item'])
+                except ValidationError as error:
+                    line_errors = error.update_error_dict(line_errors)
+
+                if line_errors:
+                    errors[index] = ValidationError(line_errors)
+                else:
+                    item_ids.append(line.item_id)
+                new_lines.append(line)
+
+            items = Item.objects.select_for_update().in_bulk(item_ids)
+            # The inventory left for the next lines of each item
+            available = {pk: item.quantity_available for pk, item in items.items()}
+
+            for index, line in enumerate(new_lines):
+                if index in errors:
+                    continue
+
+                line_errors = {}
+                if line.item_id in items:
+                    line.item = items[line.item_id]
+                else:
+                    # As ForeignKey.validate would report it
+                    line_errors['item'] = [ValidationError(
+                        item_field.error_messages['invalid'],
+                        code='invalid',
+                        params={
+                            'model': Item._meta.verbose_name, 'pk': line.item_id,
+                            'field': item_field.remote_field.field_name, 'value': line.item_id,
+                        },
+                    )]
+
+                try:
+                    line.validate_inventory(available.get(line.item_id))
+                except ValidationError as error:
+                    line_errors = error.update_error_dict(line_errors)
+
+                if line_errors:
+                    errors[index] = ValidationError(line_errors)
+                else:
+                    available[line.item_id] += line.quantity if shipment.direction == 'IN' else -line.quantity
+
+            if errors or not new_lines:
+                return [], errors
+
+            if connections[self.db].features.can_return_rows_from_bulk_insert:
+                self.bulk_create(new_lines, batch_size=batch_size)
+            else:
+                # The ledger needs the ids of the lines
+                for line in new_lines:
+                    models.Model.save(line)
+
+            total_field = new_lines[0].item_total_field()
+            available_deltas = {}
+            open_deltas = {}
+            movements = []
+            for line in new_lines:
+                available_delta = line.quantity if shipment.direction == 'IN' else -line.quantity
+                open_delta = line.quantity if is_open else 0
+                available_deltas[line.item_id] = available_deltas.get(line.item_id, 0) + available_delta
+                open_deltas[line.item_id] = open_deltas.get(line.item_id, 0) + open_delta
+
+                line._loaded_values = {'item_id': line.item_id, 'quantity': line.quantity, 'is_open': is_open}
+                if available_delta or open_delta:
+                    movements.append(InventoryMovement(
+                        item_id=line.item_id,
+                        kind=InventoryMovement.Kind.CREATE,
+                        shipment_id=shipment.pk,
+                        shipment_item_id=line.pk,
+                        date_created=now,
+                        available_delta=available_delta,
+                        **{InventoryMovement.QUANTITY_FIELDS[total_field]: open_delta}
+                    ))
+
+            changed_ids = [pk for pk in available_deltas if available_deltas[pk] or open_deltas[pk]]
+            for start in range(0, len(changed_ids), batch_size):
+                batch_ids = changed_ids[start:start + batch_size]
+                Item.objects.filter(pk__in=batch_ids).update(**{
+                    'quantity_available': F('quantity_available') + Case(
+                        *[When(pk=pk, then=Value(available_deltas[pk])) for pk in batch_ids], default=Value(0)
+                    ),
+                    total_field: F(total_field) + Case(
+                        *[When(pk=pk, then=Value(open_deltas[pk])) for pk in batch_ids], default=Value(0)
+                    ),
+                    'date_last_modified': now,
+                })
+
+            # The items are locked, so their new quantities are known without
+            # reading them back
+            for pk in changed_ids:
+                items[pk].quantity_available += available_deltas[pk]
+                setattr(items[pk], total_field, getattr(items[pk], total_field) + open_deltas[pk])
+                items[pk].date_last_modified = now
+
+            if changed_ids:
+                CompanyInventorySummary.objects.apply_delta(shipment.company_id, **{
+                    'units_available': sum(available_deltas.values()),
+                    CompanyInventorySummary.QUANTITY_FIELDS[total_field]: sum(open_deltas.values()),
+                })
+            InventoryMovement.objects.bulk_create(movements, batch_size=batch_size)
+
+            # bulk_create sends no signals
+            caching.invalidate_companies([shipment.company_id])
+
+        return new_lines, {}
+
 
 class ShipmentItem(models.Model):
     '''
@@ -344,13 +1000,130 @@ class ShipmentItem(models.Model):
     quantity = models.PositiveIntegerField()
     is_open = models.BooleanField(default=True)
 
+    objects = ShipmentItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Lets Shipment.close_shipment_lines & has_open_shipment_lines
+            # find a shipment's open lines without scanning its closed lines
+            models.Index(
+                fields=['shipment', 'item'],
+                condition=Q(is_open=True),
+                name='shipmentitem_open_by_shipment'
+            ),
+            # Used to sum an item's quantity on open lines (see
+            # ItemQuerySet.with_shipment_quantities). The quantity is included
+            # so that the sum can be read from the index alone.
+            models.Index(
+                fields=['item', 'shipment', 'quantity'],
+                condition=Q(is_open=True),
+                name='shipmentitem_open_by_item'
+            ),
+        ]
 
     def valid_item_for_company(self):
-        return self.shipment.company.id == self.item.company.id
+        return self.shipment.company_id == self.item.company_id
 
     def can_add_to_shipment(self):
         return self.shipment.direction == 'IN' or self.item.is_shippable
 
+    def item_total_field(self):
+        """
+        Returns the name of the Item field that tracks the quantity of the item
+        on open shipment lines of this line's direction.
+        """
+        if self.shipment.direction == 'OUT':
+            return 'quantity_allocated_total'
+        return 'quantity_inbound_total'
+
+    def saved_item_id(self):
+        """
+        Returns the id of the item the line was saved with, which differs
+        from item_id once the line is moved to another item, or None if the
+        line isn't saved yet.
+        """
+        if self._state.adding:
+            return None
+        return self._loaded_values.get('item_id', self.item_id)
+
+    def adjust_item_quantities(self, available_delta=0, open_delta=0, item_id=None):
+        """
+        Adds available_delta to the associated item's quantity_available, and
+        open_delta to its inbound or allocated total, with a single
+        UPDATE ... SET quantity_available = quantity_available + n statement.
+        The new values are then reloaded on self.item.
+
+        item_id adjusts another item of the shipment's company instead (the
+        item a line was moved from), which isn't reloaded.
+
+        Concurrent adjustments of the same item can't overwrite each other, as
+        the arithmetic is done by the database rather than in Python.
+        """
+        if available_delta == 0 and open_delta == 0:
+            return
+
+        item_id = item_id if item_id is not None else self.item_id
+        items = Item.objects.filter(pk=item_id)
+        updates = {'date_last_modified': timezone.now()}
+
+        if available_delta != 0:
+            updates['quantity_available'] = F('quantity_available') + available_delta
+            if available_delta < 0:
+                # Only decrement the inventory if enough of it is left
+                items = items.filter(quantity_available__gte=-available_delta)
+
+        if open_delta != 0:
+            field_name = self.item_total_field()
+            updates[field_name] = F(field_name) + open_delta
+
+        if items.update(**updates) == 0:
+            raise ValidationError(
+                "This change would create negative inventory for the item. Qty change: %(qty_change)s",
+                params={'qty_change': available_delta},
+                code="negative_inventory"
+            )
+
+        summary_deltas = {'units_available': available_delta}
+        if open_delta != 0:
+            summary_deltas[CompanyInventorySummary.QUANTITY_FIELDS[self.item_total_field()]] = open_delta
+        if item_id != self.item_id:
+            # The items of a line belong to its shipment's company
+            CompanyInventorySummary.objects.apply_delta(self.shipment.company_id, **summary_deltas)
+            return
+        CompanyInventorySummary.objects.apply_delta(self.item.company_id, **summary_deltas)
+
+        self.item.refresh_from_db(
+            fields=['quantity_available', 'date_last_modified'] + Item.SHIPMENT_QUANTITY_FIELDS
+        )
+
+    def record_movement(self, kind, available_delta=0, open_delta=0, item_id=None):
+        """
+        Writes the deltas applied by adjust_item_quantities to the inventory
+        ledger (see InventoryMovement).
+        """
+        InventoryMovement.objects.record(
+            item_id if item_id is not None else self.item_id,
+            kind,
+            shipment_id=self.shipment_id,
+            shipment_item_id=self.pk,
+            available_delta=available_delta,
+            **{InventoryMovement.QUANTITY_FIELDS[self.item_total_field()]: open_delta}
+        )
+
+    def current_quantity_available(self):
+        """
+        Reads the associated item's quantity_available from the database.
+
+        Within a transaction, the item's row is locked (SELECT ... FOR UPDATE)
+        until the transaction ends, so that concurrent shipment lines can't
+        allocate the same inventory between this check and the update.
+        """
+        items = Item.objects.filter(pk=self.item_id)
+        if transaction.get_connection().in_atomic_block:
+            items = items.select_for_update()
+
+        return items.values_list('quantity_available', flat=True).first()
+
     @classmethod
     def from_db(cls, db, field_names, values):
         """
@@ -373,49 +1146,89 @@ class ShipmentItem(models.Model):
             method in order to update the instance's associated Item's
             quantity_available on create or update.
         """
-        # Force the model to clean before proceeding with the save (protects
-        # against invalid model instances from being added by the Django shell)
-        self.full_clean()
-
-        shipment_direction = self.shipment.direction
-
-        # The save method should behave differently if the ShipmentItem instance
-        # is new to the database.
-        if self._state.adding:
+        with transaction.atomic():
+            # Force the model to clean before proceeding with the save (protects
+            # against invalid model instances from being added by the Django shell).
+            # Cleaning inside the transaction keeps the item's row locked
+            # between the inventory check and the inventory update.
+            self.full_clean()
+
+            shipment_direction = self.shipment.direction
+
+            # Lines on a shipment that has already been shipped or received never
+            # count towards the item's inbound or allocated totals
+            if self.shipment.is_shipped:
+                self.is_open = False
+
+            # The save method should behave differently if the ShipmentItem instance
+            # is new to the database.
+            if self._state.adding:
+                qty_difference = self.quantity
+                old_open_qty = 0
+            else:
+                qty_difference = self.quantity - self._loaded_values['quantity']
+                old_open_qty = self._loaded_values['quantity'] if self._loaded_values['is_open'] else 0
+
+            saved_item_id = self.saved_item_id()
+            if saved_item_id is not None and saved_item_id != self.item_id:
+                # The line was moved to another item: the saved line is
+                # reversed on the old item, and the whole line applied to the
+                # new item, as if it had been deleted and added again
+                saved_qty = self._loaded_values['quantity']
+                old_available_delta = saved_qty if shipment_direction == 'OUT' else -saved_qty
+                self.adjust_item_quantities(old_available_delta, -old_open_qty, item_id=saved_item_id)
+                self.record_movement(InventoryMovement.Kind.EDIT, old_available_delta, -old_open_qty, item_id=saved_item_id)
+
+                qty_difference = self.quantity
+                old_open_qty = 0
+
+            # Outbound lines allocate inventory, inbound lines add to it
             if shipment_direction == 'OUT':
-                self.item.quantity_available -= self.quantity
+                available_delta = -qty_difference
             else:
-                self.item.quantity_available += self.quantity
+                available_delta = qty_difference
 
-            self.item.save()
+            # Keep the item's inbound/allocated total in line with the open
+            # quantity of this line
+            new_open_qty = self.quantity if self.is_open else 0
 
-        elif self.quantity != self._loaded_values['quantity']:
-            cur_qty = self.quantity
-            old_qty = self._loaded_values['quantity']
-
-            qty_difference = cur_qty - old_qty
+            self.adjust_item_quantities(available_delta, new_open_qty - old_open_qty)
 
-            if shipment_direction == 'OUT':
-                self.item.quantity_available -= qty_difference
+            if self._state.adding:
+                kind = InventoryMovement.Kind.CREATE
+            elif old_open_qty and not self.is_open:
+                kind = InventoryMovement.Kind.CLOSE
             else:
-                self.item.quantity_available += qty_difference
+                kind = InventoryMovement.Kind.EDIT
 
-            self.item.save()
+            super(ShipmentItem, self).save(*args, **kwargs)
 
-        super(ShipmentItem, self).save(*args, **kwargs)
+            self.record_movement(kind, available_delta, new_open_qty - old_open_qty)
+
+            # The instance now reflects the database row
+            self._loaded_values = {'item_id': self.item_id, 'quantity': self.quantity, 'is_open': self.is_open}
 
     def delete(self):
         """ Override the delete method to adjust item inventory accordingly """
 
         shipment_direction = self.shipment.direction
+        saved_qty = self._loaded_values['quantity']
+
         if shipment_direction == 'OUT':
             # Unallocate the Inventory
-            self.item.quantity_available += self.quantity
+            available_delta = saved_qty
         else:
-            self.item.quantity_available -= self.quantity
+            available_delta = -saved_qty
+
+        open_delta = -saved_qty if self._loaded_values['is_open'] else 0
 
-        self.item.save()
-        super(ShipmentItem, self).delete()
+        # The saved line is reversed, even if its item was changed since
+        saved_item_id = self.saved_item_id()
+
+        with transaction.atomic():
+            self.adjust_item_quantities(available_delta, open_delta, item_id=saved_item_id)
+            self.record_movement(InventoryMovement.Kind.DELETE, available_delta, open_delta, item_id=saved_item_id)
+            super(ShipmentItem, self).delete()
 
 
     def clean(self, *args, **kwargs):
@@ -424,7 +1237,18 @@ class ShipmentItem(models.Model):
             method in order to impose a set of validation constraints
             on ShipmentItems.
         """
-        item_inventory_quantity = self.item.quantity_available
+        self.validate_inventory(self.current_quantity_available())
+        super(ShipmentItem, self).clean(*args, **kwargs)
+
+    def validate_inventory(self, item_inventory_quantity):
+        """
+            Validates the line against its item, given the item's current
+            quantity_available (None if the item doesn't exist): the item must
+            belong to the shipment's company, be shippable on outbound
+            shipments, and have enough inventory for the line's quantity.
+            Used by clean, and by ShipmentItemQuerySet.bulk_add for a whole
+            batch of lines at once.
+        """
         shipment_direction = self.shipment.direction
 
         if item_inventory_quantity is None:
@@ -445,7 +1269,8 @@ class ShipmentItem(models.Model):
                 code="item_not_shippable"
             )
 
-        if self._state.adding:
+        if self._state.adding or self.saved_item_id() != self.item_id:
+            # A line moved to another item takes its whole quantity from it
 
             if shipment_direction == "OUT" and self.quantity > item_inventory_quantity:
                 raise ValidationError(
@@ -477,15 +1302,378 @@ class ShipmentItem(models.Model):
                 pass
 
 
-        super(ShipmentItem, self).clean(*args, **kwargs)
 
+class InventoryMovementQuerySet(models.QuerySet):
+    '''
+        Custom queryset for the InventoryMovement model.
+    '''
+
+    def record(self, item_id, kind, shipment_id=None, shipment_item_id=None, **deltas):
+        """
+        Writes a movement of an item (available_delta=-5, ...) to the ledger.
+        Nothing is written if all of the deltas are zero.
+        """
+        if not any(deltas.values()):
+            return None
+
+        return self.create(
+            item_id=item_id,
+            kind=kind,
+            shipment_id=shipment_id,
+            shipment_item_id=shipment_item_id,
+            **deltas
+        )
+
+    def record_items(self, items, kind, batch_size=1000):
+        """
+        Writes one movement per item, adding the item's current quantities
+        to the ledger, with a bulk INSERT per batch_size items. Used for
+        items that are inserted in bulk (imports, seeding), rather than
+        through Item.save.
+        """
+        missing_pks = [item for item in items if item.pk is None]
+        if missing_pks:
+            # Not every database returns the primary keys of bulk inserted rows
+            item_ids = {
+                (company_id, sku): pk
+                for pk, company_id, sku in Item.objects.filter(
+                    sku__in=[item.sku for item in missing_pks]
+                ).values_list('pk', 'company_id', 'sku')
+            }
+            for item in missing_pks:
+                item.pk = item_ids.get((item.company_id, item.sku))
+
+        now = timezone.now()
+        movements = [
+            InventoryMovement(
+                item_id=item.pk,
+                kind=kind,
+                date_created=now,
+                **{
+                    movement_field: getattr(item, item_field)
+                    for item_field, movement_field in InventoryMovement.QUANTITY_FIELDS.items()
+                }
+            )
+            for item in items
+            if any(getattr(item, item_field) for item_field in InventoryMovement.QUANTITY_FIELDS)
+        ]
+        return self.bulk_create(movements, batch_size=batch_size)
+
+    def record_closed_lines(self, lines, item_field, batch_size=1000):
+        """
+        Writes a close movement for each of the given (open) shipment lines,
+        removing its quantity from the item's inbound or allocated total
+        (item_field), with one SELECT and a bulk INSERT per batch_size lines.
+        """
+        now = timezone.now()
+        movement_field = InventoryMovement.QUANTITY_FIELDS[item_field]
+        movements = [
+            InventoryMovement(
+                item_id=item_id,
+                kind=InventoryMovement.Kind.CLOSE,
+                shipment_id=shipment_id,
+                shipment_item_id=pk,
+                date_created=now,
+                **{movement_field: -quantity}
+            )
+            for pk, item_id, shipment_id, quantity
+            in lines.values_list('pk', 'item_id', 'shipment_id', 'quantity')
+        ]
+        return self.bulk_create(movements, batch_size=batch_size)
+
+
+class InventoryMovement(models.Model):
+    '''
+        The following model is the inventory ledger: an append-only record of
+        every change to an item's quantities. Each create, edit, delete or
+        close of a ShipmentItem, and each change of an item's
+        quantity_available (see Item.save), writes a row holding the deltas
+        of the change, in the same transaction as the change itself.
+
+        Adding up an item's movements gives its quantities at any point in
+        time. To avoid replaying an item's full history, the sums are taken
+        from the latest InventorySnapshot of the item (see
+        Item.quantities_at and ItemQuerySet.with_quantities_at).
+
+        The history of an item starts with the baseline snapshot taken by the
+        migration that introduced the ledger, and is deleted with the item.
+    '''
+    class Kind(models.TextChoices):
+        CREATE = 'create', 'Shipment line created'
+        EDIT = 'edit', 'Shipment line edited'
+        DELETE = 'delete', 'Shipment line deleted'
+        CLOSE = 'close', 'Shipment line closed'
+        ADJUST = 'adjust', 'Item quantity adjusted'
+        CORRECTION = 'correction', 'Totals corrected'
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='inventory_movements')
+
+    # The shipment & line that caused the movement, if any. The line isn't a
+    # foreign key, as deleted lines stay in the ledger.
+    shipment = models.ForeignKey('Shipment', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    shipment_item_id = models.BigIntegerField(null=True, blank=True)
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+
+    available_delta = models.IntegerField(default=0)
+    inbound_delta = models.IntegerField(default=0)
+    allocated_delta = models.IntegerField(default=0)
+
+    date_created = models.DateTimeField(default=timezone.now)
+
+    objects = InventoryMovementQuerySet.as_manager()
+
+    # The delta field of each Item quantity field
+    QUANTITY_FIELDS = {
+        'quantity_available': 'available_delta',
+        'quantity_inbound_total': 'inbound_delta',
+        'quantity_allocated_total': 'allocated_delta',
+    }
+
+    class Meta:
+        indexes = [
+            # Used to sum an item's movements since its latest snapshot
+            models.Index(fields=['item', 'date_created'], name='movement_by_item_date'),
+        ]
+
+    def __str__(self):
+        return "%s of item %s on %s" % (self.get_kind_display(), self.item_id, self.date_created)
+
+
+class InventorySnapshotQuerySet(models.QuerySet):
+    '''
+        Custom queryset for the InventorySnapshot model.
+    '''
+
+    def take(self, at=None, items=None, batch_size=1000):
+        """
+        Snapshots, as of at (defaults to now), the quantities of the items
+        (defaults to all items) that have moved since their latest snapshot.
+        The quantities are computed from the ledger rather than read from the
+        items, so that a snapshot can be taken as of a past date. Returns
+        the number of snapshots taken.
+        """
+        at = at or timezone.now()
+        items = Item.objects.all() if items is None else items
+
+        moved = InventoryMovement.objects.filter(
+            item=OuterRef('pk'),
+            date_created__gt=OuterRef('snapshot_date'),
+            date_created__lte=at,
+        )
+        quantities = (
+            items.with_quantities_at(at)
+            .filter(Exists(moved))
+            .values_list('pk', *['%s_at' % item_field for item_field in InventoryMovement.QUANTITY_FIELDS])
+            .order_by('pk')
+        )
+
+        snapshots = [
+            InventorySnapshot(item_id=pk, date=at, **dict(zip(InventoryMovement.QUANTITY_FIELDS, values)))
+            for pk, *values in quantities
+        ]
+        self.bulk_create(snapshots, batch_size=batch_size)
+        return len(snapshots)
+
+
+class InventorySnapshot(models.Model):
+    '''
+        The following model holds an item's quantities as of a date, as
+        computed from the ledger (see InventoryMovement). Snapshots are taken
+        periodically by the snapshot_inventory management command, so that
+        reading an item's quantities on a date costs its latest snapshot
+        before the date, plus the movements since that snapshot.
+    '''
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='inventory_snapshots')
+    date = models.DateTimeField()
+
+    quantity_available = models.IntegerField(default=0)
+    quantity_inbound_total = models.IntegerField(default=0)
+    quantity_allocated_total = models.IntegerField(default=0)
+
+    objects = InventorySnapshotQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Also used to find an item's latest snapshot before a date
+            models.UniqueConstraint(fields=['item', 'date'], name='snapshot_unique_item_date'),
+        ]
+
+    def __str__(self):
+        return "Inventory snapshot of item %s on %s" % (self.item_id, self.date)
+
+
+
+class ReorderSuggestion(models.Model):
+    '''
+        The following model holds the latest demand forecast of an item and
+        the reorder suggestion derived from it. Suggestions are computed for
+        all of a company's items at once (see inventory/forecasting.py and
+        the forecast_demand management command).
+
+        When the item's inventory position (its quantity_available, which
+        inbound lines add to when they are created) is at or below the
+        reorder point, suggested_quantity is the quantity to order to cover
+        the lead time & review period.
+    '''
+    class Method(models.TextChoices):
+        MOVING_AVERAGE = 'sma', 'Moving average'
+        EXPONENTIAL_SMOOTHING = 'ses', 'Exponential smoothing'
+
+    item = models.OneToOneField(
+        Item,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='reorder_suggestion'
+    )
+
+    method = models.CharField(max_length=3, choices=Method.choices)
+
+    # The forecast daily demand of the item, and the standard deviation of
+    # its daily demand over the forecast window
+    daily_demand = models.FloatField()
+    demand_std = models.FloatField()
+
+    reorder_point = models.PositiveIntegerField()
+    suggested_quantity = models.PositiveIntegerField()
+
+    date_computed = models.DateTimeField()
+
+    def __str__(self):
+        return "Reorder suggestion of item %s" % self.item_id
+
+
+
+
+# The placeholders of the SKU format templates (see SKUFormat.Syntax.TEMPLATE)
+SKU_TEMPLATE_TOKENS = {
+    'A': '[A-Z]',
+    '9': '[0-9]',
+    'X': '[A-Z0-9]',
+    '*': '[A-Z0-9]+',
+}
+
+
+def sku_template_to_regex(template):
+    """
+    Translates an SKU format template into a regular expression: A matches
+    an uppercase letter, 9 a digit, X either, * one or more of either, and
+    any other character matches itself (a backslash escapes a placeholder).
+    """
+    parts = []
+    escaped = False
+    for char in template:
+        if escaped:
+            parts.append(re.escape(char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in SKU_TEMPLATE_TOKENS:
+            parts.append(SKU_TEMPLATE_TOKENS[char])
+        else:
+            parts.append(re.escape(char))
+
+    if escaped:
+        raise ValueError("The template ends with an unfinished escape")
+    return ''.join(parts)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_sku_format(syntax, pattern):
+    """
+    Compiles an SKU format into a regular expression, once per process. As
+    the cache is keyed on the format itself rather than on the SKUFormat
+    row, a changed format is compiled anew, and the stale entry eventually
+    falls out of the cache.
+    """
+    if syntax == SKUFormat.Syntax.TEMPLATE:
+        pattern = sku_template_to_regex(pattern)
+    return re.compile(pattern)
+
+
+class SKUFormatQuerySet(models.QuerySet):
+    '''
+        Custom queryset for the SKUFormat model.
+    '''
+
+    def for_companies(self, company_ids):
+        """
+        Returns the SKU formats of the given companies, as a dictionary of
+        company id -> SKUFormat, read in a single query. Companies without a
+        format are left out.
+        """
+        return {
+            sku_format.company_id: sku_format
+            for sku_format in self.filter(company_id__in=set(company_ids))
+        }
+
+    def invalid_skus(self, items):
+        """
+        Validates the SKUs of many items against their companies' formats,
+        with a single query, and returns the items whose SKU doesn't match
+        as (item, SKUFormat) pairs.
+        """
+        formats = self.for_companies(item.company_id for item in items)
+        if not formats:
+            return []
+
+        return [
+            (item, formats[item.company_id]) for item in items
+            if item.company_id in formats and not formats[item.company_id].matches(item.sku)
+        ]
 
 
 class SKUFormat(models.Model):
     '''
-        The following model is planned to be used to impose restrictions
-        on a company's SKU system for items.
+        The following model imposes a format on the SKUs of a company's
+        items, either as a regular expression or as a template such as
+        AAA-9999 (see sku_template_to_regex). The whole SKU must match.
 
-        Development on this model and feature is being pushed to a future build.
+        SKUs are validated by Item.clean, and by the bulk item imports, which
+        validate a whole batch against the formats read in a single query.
+        Formats are compiled once per process (see compile_sku_format).
     '''
-    pass
+    class Syntax(models.TextChoices):
+        TEMPLATE = 'template', 'Template (A = letter, 9 = digit, X = letter or digit, * = one or more)'
+        REGEX = 'regex', 'Regular expression'
+
+    company = models.OneToOneField(
+        'Company',
+        on_delete=models.CASCADE,
+        related_name='sku_format'
+    )
+
+    syntax = models.CharField(max_length=8, choices=Syntax.choices, default=Syntax.TEMPLATE)
+    pattern = models.CharField(max_length=200)
+
+    # Shown to users whose SKUs don't match, e.g. "3 letters, a dash and 4 digits"
+    description = models.CharField(max_length=200, blank=True)
+
+    date_last_modified = models.DateTimeField(auto_now=True)
+
+    objects = SKUFormatQuerySet.as_manager()
+
+    def __str__(self):
+        return "SKU format of company %s: %s" % (self.company_id, self.pattern)
+
+    def compiled(self):
+        return compile_sku_format(self.syntax, self.pattern)
+
+    def matches(self, sku):
+        """ Whether the whole SKU matches the format """
+        return sku is not None and self.compiled().fullmatch(sku) is not None
+
+    def error_message(self, sku):
+        return "SKU %s doesn't match the company's SKU format: %s" % (sku, self.description or self.pattern)
+
+    def clean(self):
+        super(SKUFormat, self).clean()
+
+        try:
+            self.compiled()
+        except (re.error, ValueError) as error:
+            raise ValidationError({'pattern': ValidationError(
+                "Invalid SKU format: %(error)s",
+                params={'error': error},
+                code="invalid_sku_format"
+            )})
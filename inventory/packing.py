@@ -0,0 +1,349 @@
+"""
+    The following module plans how the units of an outbound shipment are
+    packed into boxes & pallets, taken from a catalog of container sizes
+    (the LOGITRACK_PACKING_CONTAINERS setting).
+
+    Packing is the 3D bin packing problem, which is solved with a fast
+    heuristic rather than exactly: first-fit decreasing with rotations.
+        - Units are packed one at a time, largest first.
+        - Each unit goes into the first open container with a free space it
+          fits in, in any of its rotations. If none has room, a new container
+          is opened, of the largest type the unit fits in.
+        - The free space of a container is a list of cuboids. When a unit is
+          placed in the corner of a free space, the rest of the space is cut
+          into three cuboids (guillotine cuts): beside, behind and above the
+          unit. No overlap checks are needed, so placing a unit only costs a
+          scan of the free spaces.
+        - Once everything is packed, each container is downsized to the
+          smallest type that still holds its contents.
+
+    Plans are cached (see plan_shipment), keyed on the contents of the
+    shipment, the measures of its items and the catalog, so that a plan is
+    only recomputed when one of them changes. Shipments of more units than
+    the LOGITRACK_PACKING_MAX_UNITS setting aren't planned, as they would
+    take too long to pack during a request.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import units
+from .models import ShipmentItem
+
+
+# The tolerance of size comparisons, so that rounding errors in the unit
+# conversions don't keep a unit out of a space it exactly fits in
+EPSILON = 1e-9
+
+
+class ContainerType:
+    """ A size of box or pallet: its inside dimensions (m) and maximum weight (kg) """
+    def __init__(self, name, dimensions, max_weight=None):
+        self.name = name
+        self.dimensions = tuple(float(value) for value in dimensions)
+        self.max_weight = float(max_weight) if max_weight is not None else float('inf')
+        self.volume = self.dimensions[0] * self.dimensions[1] * self.dimensions[2]
+        self.sorted_dimensions = tuple(sorted(self.dimensions, reverse=True))
+
+    def fits(self, unit):
+        """ Whether the unit fits in an empty container of this type, in any rotation """
+        return unit.weight <= self.max_weight and all(
+            size <= limit + EPSILON for size, limit in zip(unit.sorted_dimensions, self.sorted_dimensions)
+        )
+
+    def __repr__(self):
+        return "ContainerType(%r, %r, %r)" % (self.name, self.dimensions, self.max_weight)
+
+
+def get_container_types():
+    """ Returns the catalog of container types, from the LOGITRACK_PACKING_CONTAINERS setting """
+    return [
+        ContainerType(container['name'], container['dimensions'], container.get('max_weight'))
+        for container in getattr(settings, 'LOGITRACK_PACKING_CONTAINERS', [])
+    ]
+
+
+def get_max_units():
+    """ Returns the most units a shipment may have to be planned (the LOGITRACK_PACKING_MAX_UNITS setting) """
+    return getattr(settings, 'LOGITRACK_PACKING_MAX_UNITS', 2000)
+
+
+class Unit:
+    """ One unit of an item to pack, with its dimensions in meters and weight in kilograms """
+    __slots__ = ('sku', 'dimensions', 'sorted_dimensions', 'volume', 'weight')
+
+    def __init__(self, sku, dimensions, weight):
+        self.sku = sku
+        self.dimensions = tuple(dimensions)
+        self.sorted_dimensions = tuple(sorted(self.dimensions, reverse=True))
+        self.volume = self.dimensions[0] * self.dimensions[1] * self.dimensions[2]
+        self.weight = weight
+
+
+class Placement:
+    """ A unit placed in a container, at position (its corner closest to the origin), rotated to size """
+    __slots__ = ('sku', 'position', 'size', 'weight')
+
+    def __init__(self, sku, position, size, weight):
+        self.sku = sku
+        self.position = position
+        self.size = size
+        self.weight = weight
+
+
+def free_space(position, size):
+    """
+        A free space of a container: its position, size and the axes of its
+        size from longest to shortest, sorted once rather than for every unit
+        tried in it.
+    """
+    return position, size, sorted((0, 1, 2), key=size.__getitem__, reverse=True)
+
+
+class PackedContainer:
+    """
+        A container of a plan, with the units placed in it, and the free
+        spaces left, as (position, size, axes) cuboids (see free_space).
+    """
+    def __init__(self, container_type):
+        self.container_type = container_type
+        self.placements = []
+        self.weight = 0.0
+        self.volume = 0.0
+        self.spaces = [free_space((0.0, 0.0, 0.0), container_type.dimensions)]
+        # The sorted dimensions of the last unit no free space could take.
+        # Spaces only shrink, so the units of the same size are rejected
+        # without walking them again.
+        self.rejected = None
+
+    @property
+    def fill_rate(self):
+        """ The share of the container's volume taken by its units """
+        return self.volume / self.container_type.volume if self.container_type.volume else 0
+
+    def sku_counts(self):
+        """ Returns the (SKU, count) pairs of the units in the container """
+        counts = {}
+        for placement in self.placements:
+            counts[placement.sku] = counts.get(placement.sku, 0) + 1
+        return sorted(counts.items())
+
+    def place(self, unit, min_volume=0.0):
+        """
+            Places the unit in the first free space it fits in, and returns
+            True, or returns False if it doesn't fit anywhere. Free spaces
+            smaller than min_volume are dropped.
+        """
+        if self.weight + unit.weight > self.container_type.max_weight:
+            return False
+        if self.volume + unit.volume > self.container_type.volume + EPSILON:
+            return False
+
+        if unit.sorted_dimensions == self.rejected:
+            return False
+
+        first, second, third = unit.sorted_dimensions
+        spaces = self.spaces
+        for index, (position, space, axes) in enumerate(spaces):
+            # A box fits in a space, in some rotation, if its dimensions fit
+            # when both are sorted. The rotation lines up the unit's longest
+            # side with the space's longest side, and so on.
+            if (first > space[axes[0]] + EPSILON or
+                    second > space[axes[1]] + EPSILON or
+                    third > space[axes[2]] + EPSILON):
+                continue
+
+            size = [0.0, 0.0, 0.0]
+            size[axes[0]], size[axes[1]], size[axes[2]] = first, second, third
+            x, y, z = position
+            width, depth, height = size
+
+            # Cut the rest of the space beside, behind and above the unit
+            cuts = [
+                ((x + width, y, z), (space[0] - width, space[1], space[2])),
+                ((x, y + depth, z), (width, space[1] - depth, space[2])),
+                ((x, y, z + height), (width, depth, space[2] - height)),
+            ]
+            spaces[index:index + 1] = [
+                free_space(*cut) for cut in cuts
+                if cut[1][0] * cut[1][1] * cut[1][2] >= min_volume and min(cut[1]) > EPSILON
+            ]
+
+            self.placements.append(Placement(unit.sku, position, tuple(size), unit.weight))
+            self.weight += unit.weight
+            self.volume += unit.volume
+            return True
+
+        self.rejected = unit.sorted_dimensions
+        return False
+
+
+class PackingPlan:
+    """
+        The containers a shipment's units are packed into, and the units that
+        fit in none of the container types.
+    """
+    def __init__(self, containers, unpacked, duration=0.0):
+        self.containers = containers
+        self.unpacked = unpacked
+        self.duration = duration
+
+    @property
+    def unit_count(self):
+        return sum(len(container.placements) for container in self.containers) + len(self.unpacked)
+
+    @property
+    def fill_rate(self):
+        """ The share of the containers' total volume taken by units """
+        total = sum(container.container_type.volume for container in self.containers)
+        return sum(container.volume for container in self.containers) / total if total else 0
+
+    def container_counts(self):
+        """ Returns the (container type name, count) pairs of the plan """
+        counts = {}
+        for container in self.containers:
+            counts[container.container_type.name] = counts.get(container.container_type.name, 0) + 1
+        return sorted(counts.items())
+
+    def unpacked_counts(self):
+        """ Returns the (SKU, count) pairs of the units that couldn't be packed """
+        counts = {}
+        for unit in self.unpacked:
+            counts[unit.sku] = counts.get(unit.sku, 0) + 1
+        return sorted(counts.items())
+
+
+def pack(unit_list, container_types, decreasing=True, downsize=True):
+    """
+        Packs the units into containers of the given types, and returns a
+        PackingPlan. With decreasing=False, the units are packed in the given
+        order (plain first-fit), and with downsize=False, containers are
+        kept at the type they were opened with; both are only useful to
+        measure what the heuristic gains.
+    """
+    start = time.perf_counter()
+    container_types = sorted(container_types, key=lambda container_type: container_type.volume)
+
+    if decreasing:
+        unit_list = sorted(unit_list, key=lambda unit: (unit.volume, unit.sorted_dimensions), reverse=True)
+
+    smallest_volume = min((unit.volume for unit in unit_list), default=0.0)
+    lightest_weight = min((unit.weight for unit in unit_list), default=0.0)
+    min_volume = smallest_volume * (1 - 1e-6)
+
+    containers = []
+    # The containers that may still take a unit. A container that can't take
+    # the smallest or the lightest unit is closed, so that the next units
+    # don't scan it.
+    open_containers = []
+    unpacked = []
+    for unit in unit_list:
+        placed = None
+        for container in open_containers:
+            # Skips the containers without the volume or weight left for the
+            # unit before walking their free spaces
+            container_type = container.container_type
+            if (container.weight + unit.weight > container_type.max_weight or
+                    container.volume + unit.volume > container_type.volume + EPSILON):
+                continue
+            if container.place(unit, min_volume):
+                placed = container
+                break
+
+        if placed is not None:
+            if (not placed.spaces or
+                    placed.weight + lightest_weight > placed.container_type.max_weight or
+                    placed.volume + smallest_volume > placed.container_type.volume + EPSILON):
+                open_containers.remove(placed)
+            continue
+
+        # Open the largest container the unit fits in, so that as many units
+        # as possible share it. It is downsized once everything is packed.
+        container_type = next((ct for ct in reversed(container_types) if ct.fits(unit)), None)
+        if container_type is None:
+            unpacked.append(unit)
+            continue
+
+        container = PackedContainer(container_type)
+        container.place(unit, min_volume)
+        containers.append(container)
+        open_containers.append(container)
+
+    if downsize:
+        containers = [downsize_container(container, container_types) for container in containers]
+
+    return PackingPlan(containers, unpacked, time.perf_counter() - start)
+
+
+def downsize_container(container, container_types):
+    """
+        Repacks a container's units into the smallest container type that
+        holds them all, and returns the new container (or the container
+        itself if no smaller type does).
+    """
+    placed = [
+        Unit(placement.sku, placement.size, placement.weight)
+        for placement in container.placements
+    ]
+    min_volume = min(unit.volume for unit in placed) * (1 - 1e-6)
+
+    for container_type in container_types:
+        if container_type.volume >= container.container_type.volume:
+            break
+        if container_type.volume < container.volume or container_type.max_weight < container.weight:
+            continue
+
+        smaller = PackedContainer(container_type)
+        if all(smaller.place(unit, min_volume) for unit in placed):
+            return smaller
+
+    return container
+
+
+def shipment_rows(shipment):
+    """
+        Returns the SKU, quantity and measures of the lines of a shipment,
+        read in a single query.
+    """
+    return list(
+        ShipmentItem.objects.filter(shipment=shipment).order_by('item_id').values_list(
+            'item__sku', 'quantity',
+            'item__dimension_x_value', 'item__dimension_y_value', 'item__dimension_z_value', 'item__dimension_unit',
+            'item__weight_value', 'item__weight_unit',
+        )
+    )
+
+
+def units_from_rows(rows):
+    """ Returns the units of shipment_rows, with their dimensions in meters & weights in kilograms """
+    unit_list = []
+    for sku, quantity, x, y, z, dimension_unit, weight, weight_unit in rows:
+        meters = units.METERS.get(dimension_unit, 1.0)
+        unit = Unit(sku, (x * meters, y * meters, z * meters), weight * units.KILOGRAMS.get(weight_unit, 1.0))
+        # All the units of a line share the same measures
+        unit_list.extend([unit] * quantity)
+    return unit_list
+
+
+def plan_shipment(shipment, container_types=None, max_units=None):
+    """
+        Returns the PackingPlan of a shipment, or None if it has more than
+        max_units units (the LOGITRACK_PACKING_MAX_UNITS setting by default).
+        Plans are cached for LOGITRACK_PACKING_CACHE_TIMEOUT seconds, keyed
+        on the shipment's lines (SKU, quantity & measures of each) and the
+        container types.
+    """
+    container_types = container_types if container_types is not None else get_container_types()
+    max_units = max_units if max_units is not None else get_max_units()
+    rows = shipment_rows(shipment)
+    if sum(row[1] for row in rows) > max_units:
+        return None
+
+    key = 'packing-plan:%s' % hashlib.sha1(repr((rows, container_types)).encode('utf-8')).hexdigest()
+    plan = cache.get(key)
+    if plan is None:
+        plan = pack(units_from_rows(rows), container_types)
+        cache.set(key, plan, getattr(settings, 'LOGITRACK_PACKING_CACHE_TIMEOUT', 3600))
+    return plan
@@ -0,0 +1,191 @@
+"""
+    The following module implements keyset (cursor) pagination for the list
+    views within Logitrack.
+
+    Rather than skipping rows with OFFSET, which requires the database to read
+    every row before the requested page, each page is fetched with a WHERE
+    clause on the sort column and id of the last row of the previous page:
+
+        WHERE (sort_field, id) > (last_value, last_id) ORDER BY sort_field, id
+
+    so every page costs the same, no matter how far into the list it is.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404, QueryDict
+
+
+def get_page_size(value):
+    """
+        Returns the page size requested by the user (as a string), bounded by
+        the LOGITRACK_MAX_PAGE_SIZE setting, or the default page size.
+    """
+    default_size = getattr(settings, 'LOGITRACK_PAGE_SIZE', 50)
+    max_size = getattr(settings, 'LOGITRACK_MAX_PAGE_SIZE', 500)
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return default_size
+    return max(1, min(page_size, max_size))
+
+
+class KeysetPage:
+    """ A page of results, along with the cursors to its neighbouring pages """
+    def __init__(self, object_list, sort, page_size, next_cursor=None, previous_cursor=None, total=None):
+        self.object_list = object_list
+        self.sort = sort
+        self.page_size = page_size
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.query_params = QueryDict(mutable=True)
+
+    def get_querystring(self, cursor):
+        params = self.query_params.copy()
+        params['cursor'] = cursor
+        return params.urlencode()
+
+    @property
+    def next_querystring(self):
+        """ The query string of the link to the next page, keeping the current sort & page size """
+        return self.get_querystring(self.next_cursor)
+
+    @property
+    def previous_querystring(self):
+        """ The query string of the link to the previous page """
+        return self.get_querystring(self.previous_cursor)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+        Paginates a queryset by one of sort_fields (optionally prefixed with
+        '-' for descending order), using the primary key as a tie-breaker.
+    """
+    def __init__(self, queryset, sort_fields, default_sort, sort=None, page_size=None):
+        self.queryset = queryset
+        self.sort = sort if sort and sort.lstrip('-') in sort_fields else default_sort
+        self.descending = self.sort.startswith('-')
+        self.field_name = self.sort.lstrip('-')
+        self.field = queryset.model._meta.get_field(self.field_name)
+        self.page_size = page_size or get_page_size(None)
+
+    def encode_cursor(self, direction, obj):
+        value = self.field.value_to_string(obj)
+        data = json.dumps([direction, self.sort, value, obj.pk])
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        """ Returns the direction, sort value and primary key held by a cursor """
+        try:
+            direction, sort, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, TypeError, binascii.Error):
+            raise Http404("Invalid page cursor")
+
+        if direction not in ('next', 'previous') or sort != self.sort:
+            raise Http404("Invalid page cursor")
+
+        # The primary keys of the paginated models are integers
+        if not isinstance(pk, int) or isinstance(pk, bool):
+            raise Http404("Invalid page cursor")
+
+        try:
+            value = self.field.to_python(value)
+        except ValidationError:
+            raise Http404("Invalid page cursor")
+        if value is None:
+            raise Http404("Invalid page cursor")
+
+        return direction, value, pk
+
+    def get_page(self, cursor=None, include_total=False):
+        """
+            Returns the KeysetPage following (or preceding) the cursor, or the
+            first page if no cursor is given. The total number of rows is only
+            counted when include_total is True.
+        """
+        queryset = self.queryset
+        forward = True
+
+        if cursor:
+            direction, value, pk = self.decode_cursor(cursor)
+            forward = direction == 'next'
+
+        # Previous pages are read backwards from the cursor, then reversed
+        read_descending = self.descending if forward else not self.descending
+        prefix = '-' if read_descending else ''
+        ordering = [prefix + self.field_name]
+        if not self.field.primary_key:
+            ordering.append(prefix + 'pk')
+
+        if cursor:
+            # Only read the rows that come after the cursor, in the order
+            # the rows are being read
+            lookup = 'lt' if read_descending else 'gt'
+            if self.field.primary_key:
+                queryset = queryset.filter(**{'pk__%s' % lookup: pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{'%s__%s' % (self.field_name, lookup): value}) |
+                    Q(**{self.field_name: value, 'pk__%s' % lookup: pk})
+                )
+
+        # Read one extra row to know whether there is another page
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if forward:
+            has_next, has_previous = has_more, bool(cursor)
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_next:
+                next_cursor = self.encode_cursor('next', rows[-1])
+            if has_previous:
+                previous_cursor = self.encode_cursor('previous', rows[0])
+
+        total = self.queryset.count() if include_total else None
+
+        return KeysetPage(rows, self.sort, self.page_size, next_cursor, previous_cursor, total)
+
+
+def paginate(request, queryset, sort_fields, default_sort):
+    """
+        Returns the KeysetPage for a request's cursor, sort, page_size and
+        totals query parameters.
+    """
+    paginator = KeysetPaginator(
+        queryset,
+        sort_fields,
+        default_sort,
+        sort=request.GET.get('sort'),
+        page_size=get_page_size(request.GET.get('page_size')),
+    )
+    page = paginator.get_page(
+        cursor=request.GET.get('cursor'),
+        include_total=bool(request.GET.get('totals')),
+    )
+
+    page.query_params = request.GET.copy()
+    page.query_params.pop('cursor', None)
+    return page
@@ -0,0 +1,369 @@
+"""
+    The following module implements the item search used by pickers to look
+    items up by partial SKU or product name (see the search-items view and the
+    api/items/search/ endpoint).
+
+    A search runs two lookups, each on an index:
+        - SKU prefix search, on the index of Item.sku. SKUs are compared as
+          typed and in upper case, with a range (sku >= 'ABC' and
+          sku < 'ABC' + the highest code point) on SQLite, whose LIKE can't
+          use the index, and with LIKE 'ABC%' on PostgreSQL, which uses the
+          varchar_pattern_ops index Django creates for the field.
+        - Product name search, by trigrams: a name matches when it contains
+          every trigram of the query's words. When too few names do, names
+          containing some trigrams of each word are read as well, and kept
+          if they contain at least FUZZY_THRESHOLD of the query's trigrams,
+          so that typos ('leathr') still find the item.
+
+    The trigrams are indexed differently per database (see migration 0025):
+        - On PostgreSQL, with a pg_trgm GIN index on the product_name column.
+        - On SQLite, in an FTS5 virtual table using the trigram tokenizer
+          (SQLite 3.34+). The table is not maintained by the database:
+          Item.save & Item.delete update it, and so must any code creating
+          or deleting items in bulk (see index_items and unindex_items). The
+          rebuild_search_index management command rebuilds it from scratch.
+        - On other databases, or SQLite builds without FTS5, names are
+          searched with icontains, which scans the table.
+
+    Results are ranked exact SKU first, then SKU prefix matches (in SKU
+    order), then names containing the query, then fuzzy matches, and can be
+    limited to a company. Name matches are ranked by trigram similarity, in
+    Python, among the first CANDIDATES matches read from the index: scoring
+    every item containing a common word ('jacket') in the database would
+    take far longer than the 50ms a search is given at 1M items.
+"""
+import functools
+import sqlite3
+
+from django.db import connection
+from django.db.models import Q
+
+from . import models
+
+
+# The FTS5 table holding the trigrams of the items' product names, by item id
+SEARCH_TABLE = 'inventory_item_search'
+
+# The default & maximum number of results of a search
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# The most name matches read per search, which are then ranked in Python.
+# Reading them unordered lets the database stop at the first CANDIDATES
+# matches, rather than score every item containing a common word.
+CANDIDATES = 500
+
+# The share of a query's trigrams a product name must contain to be a fuzzy
+# match
+FUZZY_THRESHOLD = 0.5
+
+# The highest code point, which sorts after any character a SKU can contain
+PREFIX_RANGE_END = '\U0010ffff'
+
+
+@functools.lru_cache(maxsize=None)
+def sqlite_trigram_available():
+    """ Whether the SQLite library supports FTS5 tables with the trigram tokenizer """
+    try:
+        memory = sqlite3.connect(':memory:')
+        try:
+            memory.execute("CREATE VIRTUAL TABLE test USING fts5(name, tokenize='trigram')")
+        finally:
+            memory.close()
+    except sqlite3.Error:
+        return False
+    return True
+
+
+def get_backend():
+    """ Returns how product names are searched: 'postgresql', 'fts5' or 'scan' """
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite' and sqlite_trigram_available():
+        return 'fts5'
+    return 'scan'
+
+
+def company_token(company_id):
+    """
+        Returns the value indexed in the company column of the FTS5 table.
+        The tildes delimit the id, so that searching for company 7 doesn't
+        match company 17, and let FTS5 intersect the company's rows with the
+        name matches rather than filtering them afterwards.
+    """
+    return '~%s~' % company_id
+
+
+def index_items(items, replace=True):
+    """
+        Adds the given items to the search index, replacing their previous
+        entries, with one query to delete those and one to insert the items.
+        Items that were just created can skip the delete with replace=False.
+        Does nothing where the index is kept by the database itself.
+    """
+    if get_backend() != 'fts5':
+        return
+    rows = [(item.pk, item.product_name, company_token(item.company_id)) for item in items if item.pk is not None]
+    if not rows:
+        return
+
+    with connection.cursor() as cursor:
+        if replace:
+            unindex_ids(cursor, [row[0] for row in rows])
+        cursor.executemany(
+            'INSERT INTO %s (rowid, product_name, company) VALUES (%%s, %%s, %%s)' % SEARCH_TABLE,
+            rows
+        )
+
+
+def unindex_items(item_ids):
+    """ Removes the items with the given ids from the search index """
+    if get_backend() != 'fts5' or not item_ids:
+        return
+    with connection.cursor() as cursor:
+        unindex_ids(cursor, list(item_ids))
+
+
+def unindex_ids(cursor, item_ids):
+    # SQLite limits the number of parameters of a query
+    for start in range(0, len(item_ids), 500):
+        ids = item_ids[start:start + 500]
+        cursor.execute(
+            'DELETE FROM %s WHERE rowid IN (%s)' % (SEARCH_TABLE, ', '.join(['%s'] * len(ids))),
+            ids
+        )
+
+
+def rebuild_index():
+    """ Rebuilds the search index from the items table, and returns the number of items indexed """
+    if get_backend() != 'fts5':
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+        cursor.execute(
+            "INSERT INTO %s (rowid, product_name, company) SELECT id, product_name, '~' || company_id || '~' FROM %s"
+            % (SEARCH_TABLE, models.Item._meta.db_table)
+        )
+        return cursor.rowcount
+
+
+def normalize_query(query):
+    """ Strips the query & collapses its whitespace """
+    return ' '.join((query or '').split())
+
+
+def trigrams(text):
+    """
+        Returns the trigrams of the words of text, lower cased, in order of
+        first appearance. Trigrams spanning two words are left out, so that
+        the words of a query can be given in any order.
+    """
+    found = {}
+    for word in text.lower().split():
+        for start in range(len(word) - 2):
+            found.setdefault(word[start:start + 3], None)
+    return list(found)
+
+
+def sku_prefix_queryset(query, company_id=None):
+    """ Returns the items whose SKU starts with the query, as typed or in upper case, in SKU order """
+    condition = Q()
+    for prefix in {query, query.upper()}:
+        if connection.vendor == 'sqlite':
+            condition |= Q(sku__gte=prefix, sku__lt=prefix + PREFIX_RANGE_END)
+        else:
+            condition |= Q(sku__startswith=prefix)
+
+    items = models.Item.objects.filter(condition)
+    if company_id is not None:
+        items = items.filter(company_id=company_id)
+    return items.order_by('sku')
+
+
+def covering_trigrams(word):
+    """
+        Returns a subset of the trigrams of a word that covers all of its
+        letters ('jac' & 'ket' for 'jacket'), which finds nearly the same
+        names as all of its trigrams with fewer index lookups.
+    """
+    grams = trigrams(word)
+    return [gram for index, gram in enumerate(grams) if index % 3 == 0 or index == len(grams) - 1]
+
+
+def trigram_groups(query):
+    """ Returns the trigrams of each word of the query that has any """
+    return [grams for grams in (trigrams(word) for word in query.split()) if grams]
+
+
+def quote_trigram(trigram):
+    return '"%s"' % trigram.replace('"', '""')
+
+
+def fts5_match(query, company_id, fuzzy):
+    """
+        Returns the FTS5 query matching the names containing the covering
+        trigrams of each of the query's words or, with fuzzy, at least one
+        trigram of each of its words.
+    """
+    if fuzzy:
+        terms = ' AND '.join(
+            '(%s)' % ' OR '.join(quote_trigram(trigram) for trigram in group)
+            for group in trigram_groups(query)
+        )
+    else:
+        terms = ' AND '.join(
+            quote_trigram(trigram) for word in query.split() for trigram in covering_trigrams(word)
+        )
+
+    match = 'product_name : (%s)' % terms
+    if company_id is not None:
+        match = 'company : "%s" AND %s' % (company_token(company_id), match)
+    return match
+
+
+def fts5_candidates(query, company_id, fuzzy):
+    """ Returns (item id, product name) pairs of up to CANDIDATES items matching fts5_match """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid, product_name FROM %s WHERE %s MATCH %%s LIMIT %%s' % (SEARCH_TABLE, SEARCH_TABLE),
+            [fts5_match(query, company_id, fuzzy), CANDIDATES]
+        )
+        return cursor.fetchall()
+
+
+def postgresql_candidates(query, company_id, fuzzy):
+    """
+        Returns (item id, product name) pairs of up to CANDIDATES items whose
+        name contains every word of the query (ILIKE) or, with fuzzy, is
+        similar to the query (word_similarity). Both use the pg_trgm index.
+    """
+    table = connection.ops.quote_name(models.Item._meta.db_table)
+    if fuzzy:
+        condition, params = '%s <%% product_name', [query]
+    else:
+        words = query.split()
+        condition = ' AND '.join(['product_name ILIKE %s'] * len(words))
+        params = [
+            '%%%s%%' % word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            for word in words
+        ]
+    if company_id is not None:
+        condition += ' AND company_id = %s'
+        params.append(company_id)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT id, product_name FROM %s WHERE %s LIMIT %%s' % (table, condition),
+            params + [CANDIDATES]
+        )
+        return cursor.fetchall()
+
+
+def scan_candidates(query, company_id):
+    """ Returns (item id, product name) pairs of up to CANDIDATES items whose name contains every word of the query """
+    items = models.Item.objects.all()
+    for word in query.split():
+        items = items.filter(product_name__icontains=word)
+    if company_id is not None:
+        items = items.filter(company_id=company_id)
+    return list(items.values_list('pk', 'product_name')[:CANDIDATES])
+
+
+def similarity(query_trigrams, name):
+    """
+        Returns how close a product name is to the query, as a tuple that
+        sorts the best match first: the share of the query's trigrams found
+        in the name, then the share of all their trigrams that they share
+        (which favours names with fewer other words).
+    """
+    name_trigrams = set(trigrams(name))
+    shared = sum(1 for trigram in query_trigrams if trigram in name_trigrams)
+    return (
+        shared / len(query_trigrams),
+        shared / len(name_trigrams.union(query_trigrams)),
+    )
+
+
+def rank_candidates(query_trigrams, candidates, threshold=0.0):
+    """
+        Returns the ids of the candidates, a list of (item id, product name)
+        pairs, most similar to the query first, leaving out the names that
+        contain less than threshold of the query's trigrams.
+    """
+    scored = []
+    for pk, name in candidates:
+        score = similarity(query_trigrams, name) if query_trigrams else (1.0, 1.0)
+        if score[0] >= threshold:
+            scored.append((-score[0], -score[1], pk))
+    return [pk for share, overlap, pk in sorted(scored)]
+
+
+def name_matches(query, company_id, needed):
+    """
+        Returns (item id, match) pairs for the items whose product name
+        matches the query, best first. match is 'name' for names containing
+        the whole query, and 'fuzzy' for names that are only similar to it,
+        which are only looked for when there are fewer than needed names
+        containing the query.
+    """
+    backend = get_backend()
+    query_trigrams = trigrams(query)
+    if backend == 'scan':
+        return [(pk, 'name') for pk in rank_candidates(query_trigrams, scan_candidates(query, company_id))]
+    if not query_trigrams:
+        return []
+
+    find_candidates = fts5_candidates if backend == 'fts5' else postgresql_candidates
+    # The covering trigrams can match names missing some of the others
+    matches = [
+        (pk, 'name')
+        for pk in rank_candidates(query_trigrams, find_candidates(query, company_id, False), threshold=1.0)
+    ]
+    if len(matches) < needed:
+        exact = {pk for pk, match in matches}
+        matches += [
+            (pk, 'fuzzy')
+            for pk in rank_candidates(query_trigrams, find_candidates(query, company_id, True), FUZZY_THRESHOLD)
+            if pk not in exact
+        ]
+    return matches
+
+
+def search_items(query, company=None, limit=DEFAULT_LIMIT):
+    """
+        Searches the items by SKU prefix & product name, and returns up to
+        limit Items, best match first, with the company selected. Each item
+        has a search_match attribute: 'sku', 'name' or 'fuzzy'. company (a
+        Company or its id) limits the search to its items.
+
+        A search runs 2 to 4 queries: the SKU prefix search, one or two name
+        searches, and the query loading the items.
+    """
+    query = normalize_query(query)
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    company_id = getattr(company, 'pk', company)
+    company_id = int(company_id) if company_id is not None else None
+    if not query:
+        return []
+
+    ranked = {}
+    for pk in sku_prefix_queryset(query, company_id).values_list('pk', flat=True)[:limit]:
+        ranked.setdefault(pk, 'sku')
+    if len(ranked) < limit:
+        for pk, match in name_matches(query, company_id, limit - len(ranked)):
+            ranked.setdefault(pk, match)
+            if len(ranked) == limit:
+                break
+
+    items = models.Item.objects.select_related('company').in_bulk(list(ranked))
+
+    results = []
+    for pk, match in ranked.items():
+        item = items.get(pk)
+        # Entries of the search index may outlive items deleted in bulk
+        if item is None or (company_id is not None and item.company_id != company_id):
+            continue
+        item.search_match = match
+        results.append(item)
+    return results
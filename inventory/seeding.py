@@ -0,0 +1,160 @@
+"""
+    The following module generates a synthetic warehouse (companies, items,
+    and inbound & outbound shipments with their lines), used by the
+    seed_warehouse management command and the benchmarks.
+
+    All random choices are made by a random.Random instance created from a
+    seed, so the same seed always generates the same data. Rows are inserted
+    with bulk_create, and the items' inbound & allocated totals are computed
+    from the generated lines before the items are inserted, so the data is
+    consistent without going through ShipmentItem.save for every line.
+"""
+import datetime
+import random
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, search
+from .models import Company, CompanyInventorySummary, InventoryMovement, Item, Shipment, ShipmentItem
+
+
+PRODUCT_NAMES = [
+    'Bolt', 'Bracket', 'Cable', 'Charger', 'Fan', 'Filter', 'Gasket', 'Hinge',
+    'Lamp', 'Mount', 'Panel', 'Pump', 'Sensor', 'Spring', 'Switch', 'Valve',
+]
+
+ADDRESSES = [
+    '100 Main St, Ottawa', '25 King St W, Toronto', '1 Place Ville Marie, Montreal',
+    '300 Portage Ave, Winnipeg', '800 Burrard St, Vancouver', '10 Water St, Halifax',
+]
+
+
+class SeedResult:
+    """ The number of rows of each model created by a WarehouseSeeder """
+    def __init__(self):
+        self.companies = 0
+        self.items = 0
+        self.shipments = 0
+        self.shipment_lines = 0
+
+
+class WarehouseSeeder:
+    """
+        Generates companies, each with items_per_company items and
+        shipments_per_company shipments of up to lines_per_shipment lines.
+
+        About half of the shipments are inbound. shipped_ratio of the
+        shipments are already shipped (or received), and their lines are
+        closed. The label prefixes the company names and SKUs, so that several
+        datasets can be seeded into the same database.
+    """
+    def __init__(self, companies=5, items_per_company=200, shipments_per_company=50,
+                 lines_per_shipment=10, shipped_ratio=0.7, seed=0, label='SEED', batch_size=1000):
+        self.companies = companies
+        self.items_per_company = items_per_company
+        self.shipments_per_company = shipments_per_company
+        self.lines_per_shipment = min(lines_per_shipment, items_per_company)
+        self.shipped_ratio = shipped_ratio
+        self.label = label
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.now = timezone.now()
+
+    def run(self):
+        """ Creates the data in a single transaction, and returns a SeedResult """
+        result = SeedResult()
+        with transaction.atomic():
+            for company_number in range(self.companies):
+                self.seed_company(company_number, result)
+        return result
+
+    def seed_company(self, company_number, result):
+        company = Company.objects.create(name="%s company %s" % (self.label, company_number))
+        result.companies += 1
+
+        items = [self.build_item(company, company_number, i) for i in range(self.items_per_company)]
+        plan = [self.build_shipment(company) for i in range(self.shipments_per_company)]
+
+        # The lines of each shipment are planned before anything is inserted,
+        # so that the items' open totals can be set as they are created
+        for shipment, lines in plan:
+            for item_index, quantity in lines:
+                if shipment.is_shipped:
+                    continue
+                item = items[item_index]
+                if shipment.direction == 'OUT':
+                    item.quantity_allocated_total += quantity
+                else:
+                    item.quantity_inbound_total += quantity
+
+        Item.objects.bulk_create(items, batch_size=self.batch_size)
+        CompanyInventorySummary.objects.apply_item_deltas(added=items)
+        InventoryMovement.objects.record_items(items, InventoryMovement.Kind.ADJUST, batch_size=self.batch_size)
+        search.index_items(items, replace=False)
+        result.items += len(items)
+
+        # Not every database returns the primary keys of bulk inserted rows
+        item_ids = dict(Item.objects.filter(company=company).values_list('sku', 'id'))
+
+        shipments = Shipment.objects.bulk_create([shipment for shipment, lines in plan], batch_size=self.batch_size)
+        if any(shipment.pk is None for shipment in shipments):
+            shipment_ids = Shipment.objects.filter(company=company).order_by('pk').values_list('pk', flat=True)
+            for shipment, pk in zip(shipments, shipment_ids):
+                shipment.pk = pk
+        result.shipments += len(shipments)
+
+        shipment_lines = [
+            ShipmentItem(
+                shipment_id=shipment.pk,
+                item_id=item_ids[items[item_index].sku],
+                quantity=quantity,
+                is_open=not shipment.is_shipped,
+            )
+            for shipment, lines in plan
+            for item_index, quantity in lines
+        ]
+        ShipmentItem.objects.bulk_create(shipment_lines, batch_size=self.batch_size)
+        result.shipment_lines += len(shipment_lines)
+        caching.invalidate_companies([company.pk])
+
+    def build_item(self, company, company_number, item_number):
+        rand = self.random
+        return Item(
+            sku="%s%s-%s" % (self.label, company_number, item_number),
+            company=company,
+            product_name="%s %s" % (rand.choice(PRODUCT_NAMES), item_number),
+            quantity_available=rand.randint(0, 500),
+            is_shippable=True,
+            weight_value=round(rand.uniform(0.1, 50), 2),
+            weight_unit=rand.choice(Item.WeightUnit.values),
+            dimension_x_value=round(rand.uniform(0.05, 2), 2),
+            dimension_y_value=round(rand.uniform(0.05, 2), 2),
+            dimension_z_value=round(rand.uniform(0.05, 2), 2),
+            dimension_unit=rand.choice(Item.DimensionUnit.values),
+        )
+
+    def build_shipment(self, company):
+        """
+            Returns an unsaved Shipment, and the (item index, quantity) pairs
+            of its lines. An item appears at most once on a shipment.
+        """
+        rand = self.random
+        is_shipped = rand.random() < self.shipped_ratio
+        date_promised = self.now + datetime.timedelta(days=rand.randint(-60, 30))
+
+        shipment = Shipment(
+            company=company,
+            to_address=rand.choice(ADDRESSES),
+            date_promised=date_promised,
+            is_shipped=is_shipped,
+            date_shipped=date_promised if is_shipped else None,
+            direction=rand.choice(Shipment.ShipmentDirection.values),
+        )
+
+        line_count = rand.randint(1, self.lines_per_shipment) if self.lines_per_shipment else 0
+        lines = [
+            (item_index, rand.randint(1, 20))
+            for item_index in rand.sample(range(self.items_per_company), line_count)
+        ]
+        return shipment, lines
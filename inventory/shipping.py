@@ -0,0 +1,153 @@
+"""
+    The following module implements the batch shipping (and receiving) of
+    shipments, used by the batch ship view, the ship_shipments management
+    command and the API.
+
+    Shipping shipments one at a time through Shipment.save runs a handful of
+    statements per shipment. Here, the shipments are all validated up front,
+    then their lines are closed (see ShipmentItemQuerySet.close) and the
+    shipments are marked as shipped with a fixed number of set-based UPDATEs
+    per batch of batch_size shipments, in a single transaction.
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import caching
+from .models import Shipment, ShipmentItem
+
+
+class BatchShipResult:
+    """
+        The outcome of a batch: for each shipment, in the order they were
+        requested, a dictionary with its id, its status ('shipped',
+        'received' or 'error'), and the number of lines closed or the errors.
+    """
+    def __init__(self):
+        self.results = []
+
+    def add(self, pk, status, lines_closed=0, errors=None):
+        result = {'id': pk, 'status': status, 'lines_closed': lines_closed}
+        if errors:
+            result['errors'] = errors
+        self.results.append(result)
+
+    @property
+    def shipped(self):
+        return [result for result in self.results if result['status'] != 'error']
+
+    @property
+    def errors(self):
+        return [result for result in self.results if result['status'] == 'error']
+
+
+def select_shipments(shipment_ids=None, company=None, cutoff=None, direction=None):
+    """
+        Returns the ids of the shipments of a batch: either the given ids, or
+        the open shipments of a company promised on or before cutoff. Both can
+        be narrowed down to one direction.
+    """
+    if shipment_ids is not None:
+        return list(shipment_ids)
+
+    if company is None:
+        raise ValueError("Either shipment ids or a company are required")
+
+    shipments = Shipment.objects.filter(company=company, is_shipped=False)
+    if cutoff is not None:
+        shipments = shipments.filter(date_promised__lte=cutoff)
+    if direction is not None:
+        shipments = shipments.filter(direction=direction)
+    return list(shipments.order_by('pk').values_list('pk', flat=True))
+
+
+def ship_shipments(shipment_ids=None, company=None, cutoff=None, direction=None,
+                   date_shipped=None, require_all=False, batch_size=500):
+    """
+        Ships the outbound shipments and receives the inbound shipments of a
+        batch (see select_shipments), and returns a BatchShipResult.
+
+        Unknown shipments, shipments that are already shipped, and shipments
+        that don't match the company or direction are reported as errors.
+        The other shipments are shipped, unless require_all is True, in which
+        case nothing is shipped if any shipment has an error.
+    """
+    shipment_ids = select_shipments(shipment_ids, company, cutoff, direction)
+    date_shipped = date_shipped or timezone.now()
+    result = BatchShipResult()
+
+    with transaction.atomic():
+        # Lock the shipments, so that they can't be shipped twice by
+        # concurrent batches
+        shipments = {}
+        for start in range(0, len(shipment_ids), batch_size):
+            chunk = [pk for pk in shipment_ids[start:start + batch_size] if isinstance(pk, int)]
+            # Rows can't be locked by a query with a GROUP BY, so the lines
+            # are counted separately
+            list(Shipment.objects.select_for_update().filter(pk__in=chunk).values_list('pk'))
+            shipments.update(
+                (shipment['pk'], shipment)
+                for shipment in Shipment.objects.filter(pk__in=chunk).annotate(
+                    open_lines=Count('shipmentitem', filter=Q(shipmentitem__is_open=True))
+                ).values('pk', 'company', 'direction', 'is_shipped', 'open_lines')
+            )
+
+        valid = []
+        seen = set()
+        for pk in shipment_ids:
+            if not isinstance(pk, int) or isinstance(pk, bool):
+                # Not looked up, as it may not even be hashable
+                result.add(pk, 'error', errors=["Unknown shipment"])
+                continue
+
+            shipment = shipments.get(pk)
+            errors = validate_shipment(shipment, company, direction)
+            if pk in seen:
+                errors = ["The shipment appears more than once in the batch"]
+            seen.add(pk)
+
+            if errors:
+                result.add(pk, 'error', errors=errors)
+            else:
+                valid.append(shipment)
+                status = 'shipped' if shipment['direction'] == 'OUT' else 'received'
+                result.add(pk, status, lines_closed=shipment['open_lines'])
+
+        if require_all and result.errors:
+            # Nothing is shipped, so report the valid shipments as not shipped
+            for shipment_result in result.shipped:
+                shipment_result.update(status='error', lines_closed=0, errors=["Not shipped, as other shipments in the batch have errors"])
+            return result
+
+        for start in range(0, len(valid), batch_size):
+            chunk = valid[start:start + batch_size]
+            for line_direction in ('OUT', 'IN'):
+                pks = [shipment['pk'] for shipment in chunk if shipment['direction'] == line_direction]
+                if pks:
+                    ShipmentItem.objects.filter(shipment__in=pks).close(direction=line_direction)
+
+            Shipment.objects.filter(pk__in=[shipment['pk'] for shipment in chunk]).update(
+                is_shipped=True,
+                date_shipped=date_shipped,
+                date_last_modified=timezone.now(),
+            )
+
+        # The shipments & lines are updated without sending signals
+        caching.invalidate_companies(shipment['company'] for shipment in valid)
+
+    return result
+
+
+def validate_shipment(shipment, company=None, direction=None):
+    """ Returns the reasons why a shipment (as read by ship_shipments) can't be shipped """
+    if shipment is None:
+        return ["Unknown shipment"]
+
+    errors = []
+    if shipment['is_shipped']:
+        errors.append("The shipment has already been shipped or received")
+    if company is not None and shipment['company'] != getattr(company, 'pk', company):
+        errors.append("The shipment belongs to another company")
+    if direction is not None and shipment['direction'] != direction:
+        errors.append("The shipment isn't an %s shipment" % ('outbound' if direction == 'OUT' else 'inbound'))
+    return errors
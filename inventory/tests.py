@@ -1,9 +1,71 @@
-from django.test import TestCase
-from inventory.models import Company, Item, Shipment, ShipmentItem
-from django.db.utils import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from inventory.models import Company, CompanyInventorySummary, InventoryMovement, InventorySnapshot, Item, ReorderSuggestion, Shipment, ShipmentItem, SKUFormat, compile_sku_format
+from django.db import connection, connections
+from django.db.utils import IntegrityError, OperationalError
 from django.core.exceptions import ValidationError
+from django.db.models import F, Sum
 
 from django.utils import timezone
+from django.urls import path, reverse
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from inventory.imports import ItemImporter, read_rows
+from inventory.shipping import ship_shipments
+from inventory.forecasting import DemandHistory, exponential_smoothing, forecast_company, moving_average
+from inventory import units
+from inventory import packing
+from inventory import search
+from inventory import caching
+from unittest import mock
+from django.core.cache import cache
+import random
+import numpy as np
+from django.test.utils import CaptureQueriesContext
+from django.db.migrations.executor import MigrationExecutor
+from logitrack.identity import current_identity_map, identity_map
+import os
+import tempfile
+import csv
+import json
+import base64
+import datetime
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import override_settings
+import threading
+from logitrack.middleware import record_queries
+from logitrack.testing import QueryBudgetMixin
+import time
+
+
+def create_item(company, sku, quantity=0, product_name=None, **fields):
+    """ Creates a shippable item of the company, 1 x 1 x 1 and weighing 1 """
+    return Item.objects.create(
+        sku=sku,
+        company=company,
+        product_name=product_name or "Item %s" % sku,
+        quantity_available=quantity,
+        is_shippable=True,
+        weight_value=1,
+        dimension_x_value=1,
+        dimension_y_value=1,
+        dimension_z_value=1,
+        **fields
+    )
+
+
+def create_shipment(company, direction, **fields):
+    """ Creates a shipment of the company, promised for now """
+    return Shipment.objects.create(
+        company=company,
+        to_address="Test address",
+        date_promised=timezone.now(),
+        direction=direction,
+        **fields
+    )
+
 
 class ItemTestCase(TestCase):
     def setUp(self):
@@ -55,24 +117,60 @@ class ItemTestCase(TestCase):
 
     def test_unique_item_sku_diff_company(self):
         """
-            This test ensures that duplicate item SKUs cannot exist across
-            companies. The plan is to eventually remove this test as
-            sku uniqueness will be supported only within a company, and
-            not globally.
+            This test ensures that SKUs are only unique within a company:
+            another company can create an item with a SKU that is already
+            used by the company from the setUp method.
         """
         company_w_same_sku = Company.objects.create(name="Company With Same Sku")
-        with self.assertRaises(ValidationError):
-            Item.objects.create(
+        item = Item.objects.create(
+            sku="BLU-SHRT-LG",
+            company=company_w_same_sku,
+            product_name="Blue Shirt (Large) Duplicate",
+            quantity_available=100,
+            weight_value=10,
+            weight_unit='kg',
+            dimension_x_value=1,
+            dimension_y_value=2,
+            dimension_z_value=3
+        )
+        self.assertEquals(Item.objects.filter(sku="BLU-SHRT-LG").count(), 2)
+
+        # Moving the item to the company already using its SKU is rejected
+        item.company = self.company1
+        with self.assertRaises(ValidationError) as context:
+            item.save()
+        self.assertIn('sku', context.exception.message_dict)
+
+    def test_unique_sku_constraint(self):
+        """ The (company, sku) constraint holds when validation is skipped """
+        with self.assertRaises(IntegrityError):
+            Item.objects.bulk_create([Item(
                 sku="BLU-SHRT-LG",
-                company=company_w_same_sku,
+                company=self.company1,
                 product_name="Blue Shirt (Large) Duplicate",
-                quantity_available=100,
                 weight_value=10,
-                weight_unit='kg',
                 dimension_x_value=1,
                 dimension_y_value=2,
                 dimension_z_value=3
-            )
+            )])
+
+    def test_validate_unique_batch(self):
+        """
+            The SKUs of a batch of items are checked with a single query,
+            against the database and each other.
+        """
+        other_company = Company.objects.create(name="Company With Same Sku")
+        items = [
+            Item(sku="BLU-SHRT-LG", company=self.company1),
+            Item(sku="BLU-SHRT-LG", company=other_company),
+            Item(sku="RED-SHRT-LG", company=self.company1),
+            Item(sku="RED-SHRT-LG", company=self.company1),
+            self.item2,
+        ]
+        with self.assertNumQueries(1):
+            errors = Item.objects.validate_unique_batch(items)
+        self.assertEquals(sorted(errors), [0, 3])
+        self.assertEquals(errors[0].message_dict['sku'], ["Item with this Company and Sku already exists."])
 
     def test_delete_item_with_open_shipments(self):
         """
@@ -320,6 +418,9 @@ class ItemClassQuantityMethodTestCase(TestCase):
         self.shipment1.is_shipped=True
         self.shipment1.save()
 
+        # The allocated total is updated in the database when the shipment
+        # closes its lines, so reload it before validating
+        self.item1.refresh_shipment_quantities()
         self.assertEquals(self.item1.quantity_allocated(), 0)
 
 
@@ -526,3 +627,2770 @@ class CompanyTestCase(TestCase):
         """ This test validates that a Company's name field must be unique"""
         with self.assertRaises(IntegrityError):
             Company.objects.create(name="The Test Company")
+
+
+class ItemQuerySetTestCase(TestCase):
+    def setUp(self):
+        self.company1 = Company.objects.create(name="The Test Company")
+        self.item1 = Item.objects.create(
+            sku="BLU-SHRT-LG",
+            company=self.company1,
+            product_name="Blue Shirt (Large)",
+            quantity_available=100,
+            is_shippable=True,
+            weight_value=10,
+            weight_unit='kg',
+            dimension_x_value=1,
+            dimension_y_value=2,
+            dimension_z_value=3
+        )
+        self.item2 = Item.objects.create(
+            sku="BLU-SHRT-SM",
+            company=self.company1,
+            product_name="Blue Shirt (Small)",
+            quantity_available=100,
+            is_shippable=True,
+            weight_value=10,
+            weight_unit='kg',
+            dimension_x_value=1,
+            dimension_y_value=2,
+            dimension_z_value=3
+        )
+        self.outbound = Shipment.objects.create(
+            company = self.company1,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            is_shipped=False,
+            direction='OUT'
+        )
+        self.inbound = Shipment.objects.create(
+            company = self.company1,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            is_shipped=False,
+            direction='IN'
+        )
+
+    def test_with_shipment_quantities(self):
+        """
+            The annotated quantities should match the values returned by the
+            per-item aggregate methods, and closed lines should be ignored.
+        """
+        ShipmentItem.objects.create(shipment=self.outbound, item=self.item1, quantity=3)
+        ShipmentItem.objects.create(shipment=self.outbound, item=self.item1, quantity=4)
+        ShipmentItem.objects.create(shipment=self.inbound, item=self.item1, quantity=5)
+
+        closed = Shipment.objects.create(
+            company = self.company1,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            is_shipped=False,
+            direction='OUT'
+        )
+        ShipmentItem.objects.create(shipment=closed, item=self.item1, quantity=6)
+        closed.is_shipped = True
+        closed.save()
+
+        items = {item.pk: item for item in Item.objects.with_shipment_quantities()}
+
+        self.assertEquals(items[self.item1.pk].open_quantity_allocated, 7)
+        self.assertEquals(items[self.item1.pk].open_quantity_inbound, 5)
+        self.assertEquals(items[self.item2.pk].open_quantity_allocated, 0)
+        self.assertEquals(items[self.item2.pk].open_quantity_inbound, 0)
+
+        fresh_item1 = Item.objects.get(pk=self.item1.pk)
+        self.assertEquals(items[self.item1.pk].quantity_allocated(), fresh_item1.quantity_allocated())
+        self.assertEquals(items[self.item1.pk].quantity_inbound(), fresh_item1.quantity_inbound())
+
+    def test_quantity_methods_do_not_query(self):
+        """
+            The quantity helper methods read the totals stored on the item,
+            and should not hit the database.
+        """
+        ShipmentItem.objects.create(shipment=self.outbound, item=self.item1, quantity=3)
+        item = Item.objects.get(pk=self.item1.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEquals(item.quantity_allocated(), 3)
+            self.assertEquals(item.quantity_inbound(), 0)
+            self.assertTrue(item.is_on_shipments())
+
+    def test_view_all_items_query_count(self):
+        """
+            The item list should not issue additional queries per item (one
+            query reads the list's ETag, and one the items).
+        """
+        with self.assertNumQueries(2):
+            self.client.get(reverse('view_all_items'))
+
+        for i in range(10):
+            Item.objects.create(
+                sku="EXTRA-%s" % i,
+                company=self.company1,
+                product_name="Extra item",
+                weight_value=1,
+                dimension_x_value=1,
+                dimension_y_value=1,
+                dimension_z_value=1
+            )
+
+        with self.assertNumQueries(2):
+            self.client.get(reverse('view_all_items'))
+
+
+class ItemQuantityTotalsTestCase(TestCase):
+    def setUp(self):
+        self.company1 = Company.objects.create(name="The Test Company")
+        self.item1 = Item.objects.create(
+            sku="BLU-SHRT-LG",
+            company=self.company1,
+            product_name="Blue Shirt (Large)",
+            quantity_available=100,
+            is_shippable=True,
+            weight_value=10,
+            weight_unit='kg',
+            dimension_x_value=1,
+            dimension_y_value=2,
+            dimension_z_value=3
+        )
+        self.outbound = Shipment.objects.create(
+            company = self.company1,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            is_shipped=False,
+            direction='OUT'
+        )
+        self.inbound = Shipment.objects.create(
+            company = self.company1,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            is_shipped=False,
+            direction='IN'
+        )
+
+    def assertTotalsMatchShipmentLines(self):
+        item = Item.objects.with_shipment_quantities().get(pk=self.item1.pk)
+        self.assertEquals(item.quantity_inbound_total, item.open_quantity_inbound)
+        self.assertEquals(item.quantity_allocated_total, item.open_quantity_allocated)
+
+    def test_totals_follow_shipment_item_changes(self):
+        """
+            Creating, editing, and deleting shipment lines should keep the
+            stored totals equal to the quantities on open lines.
+        """
+        out_line = ShipmentItem.objects.create(shipment=self.outbound, item=self.item1, quantity=5)
+        in_line = ShipmentItem.objects.create(shipment=self.inbound, item=self.item1, quantity=7)
+        self.assertEquals(self.item1.quantity_allocated(), 5)
+        self.assertEquals(self.item1.quantity_inbound(), 7)
+        self.assertTotalsMatchShipmentLines()
+
+        out_line = ShipmentItem.objects.get(pk=out_line.pk)
+        out_line.quantity = 8
+        out_line.save()
+        self.assertTotalsMatchShipmentLines()
+
+        in_line = ShipmentItem.objects.get(pk=in_line.pk)
+        in_line.delete()
+        self.assertTotalsMatchShipmentLines()
+
+        self.outbound.is_shipped = True
+        self.outbound.save()
+        self.assertTotalsMatchShipmentLines()
+
+        self.item1.refresh_shipment_quantities()
+        self.assertEquals(self.item1.quantity_allocated(), 0)
+        self.assertEquals(self.item1.quantity_inbound(), 0)
+
+    def test_stale_item_save_keeps_totals(self):
+        """
+            Saving an Item instance loaded before its shipment lines changed
+            should not overwrite the stored totals.
+        """
+        stale_item = Item.objects.get(pk=self.item1.pk)
+        ShipmentItem.objects.create(shipment=self.outbound, item=self.item1, quantity=5)
+
+        stale_item.product_name = "Renamed"
+        stale_item.save()
+
+        self.assertTotalsMatchShipmentLines()
+        self.assertEquals(Item.objects.get(pk=self.item1.pk).quantity_allocated_total, 5)
+
+    def test_rebuild_item_quantities_command(self):
+        """
+            The rebuild_item_quantities command should detect & correct totals
+            that no longer match the shipment lines.
+        """
+        ShipmentItem.objects.create(shipment=self.outbound, item=self.item1, quantity=5)
+        call_command('rebuild_item_quantities', '--check', stdout=StringIO())
+
+        Item.objects.filter(pk=self.item1.pk).update(quantity_allocated_total=42)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_item_quantities', '--check', stdout=StringIO())
+
+        call_command('rebuild_item_quantities', stdout=StringIO())
+        self.assertTotalsMatchShipmentLines()
+
+
+class ConcurrentInventoryAdjustmentTestCase(TransactionTestCase):
+    """
+        The following tests run shipment line writes from several threads at
+        once, each thread using its own database connection, to make sure that
+        inventory adjustments are not lost when they overlap.
+    """
+    thread_count = 6
+    lines_per_thread = 12
+    # How long (in seconds) a save is retried while the database is locked
+    lock_timeout = 30
+
+    def setUp(self):
+        self.company1 = Company.objects.create(name="The Test Company")
+        self.item1 = Item.objects.create(
+            sku="BLU-SHRT-LG",
+            company=self.company1,
+            product_name="Blue Shirt (Large)",
+            quantity_available=100,
+            is_shippable=True,
+            weight_value=10,
+            weight_unit='kg',
+            dimension_x_value=1,
+            dimension_y_value=2,
+            dimension_z_value=3
+        )
+        self.outbound = Shipment.objects.create(
+            company = self.company1,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            is_shipped=False,
+            direction='OUT'
+        )
+        self.inbound = Shipment.objects.create(
+            company = self.company1,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            is_shipped=False,
+            direction='IN'
+        )
+
+    def run_concurrently(self, target):
+        """
+            Runs target(thread_index) in thread_count threads and returns once
+            all of them are done.
+        """
+        errors = []
+
+        def run(thread_index):
+            try:
+                target(thread_index)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(errors, [])
+
+    def save_with_retry(self, save):
+        """
+            SQLite only allows a single writer at a time, and reports
+            conflicting transactions as locked rather than waiting on them.
+            Those transactions are rolled back as a whole, so they are retried,
+            for up to lock_timeout seconds.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                return save()
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                if time.monotonic() > deadline:
+                    self.fail("The database was still locked after %s seconds: %s" % (self.lock_timeout, error))
+                time.sleep(0.001)
+
+    def test_concurrent_shipment_lines_do_not_drift(self):
+        """
+            Outbound and inbound lines are added from several threads. The
+            item's final quantities must account for every saved line, and
+            outbound lines must never allocate more inventory than available.
+        """
+        def add_lines(thread_index):
+            shipment = self.outbound if thread_index % 2 == 0 else self.inbound
+            for i in range(self.lines_per_thread):
+                def add_line():
+                    ShipmentItem.objects.create(
+                        shipment=Shipment.objects.get(pk=shipment.pk),
+                        item=Item.objects.get(pk=self.item1.pk),
+                        quantity=1 + (i % 3)
+                    )
+                try:
+                    self.save_with_retry(add_line)
+                except ValidationError:
+                    # Not enough inventory left for this outbound line
+                    pass
+
+        self.run_concurrently(add_lines)
+
+        item = Item.objects.with_shipment_quantities().get(pk=self.item1.pk)
+        allocated = item.open_quantity_allocated
+        inbound = item.open_quantity_inbound
+
+        self.assertEquals(item.quantity_available, 100 - allocated + inbound)
+        self.assertEquals(item.quantity_allocated_total, allocated)
+        self.assertEquals(item.quantity_inbound_total, inbound)
+
+    def test_concurrent_line_edits_and_deletes_do_not_drift(self):
+        """
+            Existing outbound lines are edited and then deleted from several
+            threads. Once every line is deleted, the item's inventory must be
+            back to where it started.
+        """
+        line_ids = [
+            ShipmentItem.objects.create(shipment=self.outbound, item=self.item1, quantity=1).pk
+            for i in range(self.thread_count * 3)
+        ]
+
+        def edit_then_delete(thread_index):
+            for line_id in line_ids[thread_index::self.thread_count]:
+                def edit():
+                    line = ShipmentItem.objects.get(pk=line_id)
+                    line.quantity = 2
+                    line.save()
+                self.save_with_retry(edit)
+                self.save_with_retry(lambda: ShipmentItem.objects.get(pk=line_id).delete())
+
+        self.run_concurrently(edit_then_delete)
+
+        item = Item.objects.get(pk=self.item1.pk)
+        self.assertEquals(ShipmentItem.objects.count(), 0)
+        self.assertEquals(item.quantity_available, 100)
+        self.assertEquals(item.quantity_allocated_total, 0)
+
+
+class ShipmentCloseTestCase(TestCase):
+    def setUp(self):
+        self.company1 = Company.objects.create(name="The Test Company")
+        self.items = [
+            Item.objects.create(
+                sku="ITEM-%s" % i,
+                company=self.company1,
+                product_name="Item %s" % i,
+                quantity_available=100,
+                is_shippable=True,
+                weight_value=10,
+                weight_unit='kg',
+                dimension_x_value=1,
+                dimension_y_value=2,
+                dimension_z_value=3
+            )
+            for i in range(5)
+        ]
+
+    def create_shipment(self, direction, line_count):
+        shipment = Shipment.objects.create(
+            company = self.company1,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            is_shipped=False,
+            direction=direction
+        )
+        for i in range(line_count):
+            ShipmentItem.objects.create(
+                shipment=shipment,
+                item=self.items[i % len(self.items)],
+                quantity=1 + i % 3
+            )
+        return shipment
+
+    def test_close_adjusts_each_item_total(self):
+        """
+            Shipping a shipment with several lines per item should close every
+            line and remove each item's open quantity from its totals, without
+            touching other shipments.
+        """
+        outbound = self.create_shipment('OUT', 12)
+        other_outbound = self.create_shipment('OUT', 3)
+        inbound = self.create_shipment('IN', 7)
+
+        outbound.is_shipped = True
+        outbound.save()
+
+        self.assertFalse(outbound.has_open_shipment_lines())
+        self.assertTrue(other_outbound.has_open_shipment_lines())
+
+        inbound.is_shipped = True
+        inbound.save()
+
+        self.assertFalse(inbound.has_open_shipment_lines())
+        for item in Item.objects.with_shipment_quantities():
+            self.assertEquals(item.quantity_allocated_total, item.open_quantity_allocated)
+            self.assertEquals(item.quantity_inbound_total, item.open_quantity_inbound)
+            self.assertEquals(item.quantity_inbound_total, 0)
+
+    def test_close_query_count_does_not_grow_with_lines(self):
+        """
+            Closing a shipment's lines should run the same number of queries
+            whether it has a handful of lines or many.
+        """
+        small = self.create_shipment('OUT', 2)
+        large = self.create_shipment('OUT', 40)
+
+        small.is_shipped = True
+        with self.assertNumQueries(9):
+            small.save()
+
+        large.is_shipped = True
+        with self.assertNumQueries(9):
+            large.save()
+
+
+class ItemImportTestCase(TestCase):
+    def setUp(self):
+        self.company1 = Company.objects.create(name="The Test Company")
+        self.company2 = Company.objects.create(name="Another Company")
+        Item.objects.create(
+            sku="BLU-SHRT-LG",
+            company=self.company1,
+            product_name="Blue Shirt (Large)",
+            weight_value=10,
+            dimension_x_value=1,
+            dimension_y_value=2,
+            dimension_z_value=3
+        )
+
+    csv_data = (
+        "sku,company,product_name,quantity_available,is_shippable,weight_value,weight_unit,dimension_x_value,dimension_y_value,dimension_z_value,dimension_unit\n"
+        "RED-PNT-SM,The Test Company,Red Pant (Small),10,yes,1.5,kg,1,2,3,m\n"
+        "RED-PNT-LG,Another Company,Red Pant (Large),5,no,2,lb,1,2,3,ft\n"
+        "BLU-SHRT-LG,The Test Company,Duplicate of an existing item,1,yes,1,kg,1,1,1,m\n"
+        "RED-PNT-SM,The Test Company,Duplicate within the file,1,yes,1,kg,1,1,1,m\n"
+        "GRN-HAT,Unknown Company,Green Hat,1,yes,1,kg,1,1,1,m\n"
+        "GRN-SCK,The Test Company,Green Sock,-4,yes,heavy,kg,1,1,1,m\n"
+        "GRN-TIE,The Test Company,,1,yes,1,kg,1,1,1,m\n"
+    )
+
+    def import_csv(self, data, batch_size=500):
+        return ItemImporter(batch_size=batch_size).run(read_rows(StringIO(data), 'csv'))
+
+    def test_import_reports_row_errors_without_aborting(self):
+        """
+            Valid rows should be imported, and each invalid row should be
+            reported with its row number.
+        """
+        result = self.import_csv(self.csv_data, batch_size=2)
+
+        self.assertEquals(result.rows_read, 7)
+        self.assertEquals(result.rows_created, 2)
+        self.assertEquals(sorted(row_number for row_number, message in result.errors), [4, 5, 6, 7, 8])
+
+        item = Item.objects.get(sku="RED-PNT-SM")
+        self.assertEquals(item.company, self.company1)
+        self.assertEquals(item.quantity_available, 10)
+        self.assertTrue(item.is_shippable)
+        self.assertEquals(item.weight_value, 1.5)
+
+        item = Item.objects.get(sku="RED-PNT-LG")
+        self.assertEquals(item.company, self.company2)
+        self.assertFalse(item.is_shippable)
+        self.assertEquals(item.dimension_unit, 'ft')
+
+    def test_import_ndjson(self):
+        """ NDJSON rows, including malformed lines, should be imported the same way """
+        data = (
+            '{"sku": "RED-PNT-SM", "company": "The Test Company", "product_name": "Red Pant", "is_shippable": true, "weight_value": 1, "dimension_x_value": 1, "dimension_y_value": 1, "dimension_z_value": 1}\n'
+            '\n'
+            '{"sku": "RED-PNT-LG", "company": \n'
+        )
+        result = ItemImporter().run(read_rows(StringIO(data), 'ndjson'))
+
+        self.assertEquals(result.rows_created, 1)
+        self.assertEquals([row_number for row_number, message in result.errors], [3])
+        self.assertTrue(Item.objects.get(sku="RED-PNT-SM").is_shippable)
+
+    def test_import_same_sku_in_different_companies(self):
+        """ SKUs only have to be unique within a company, in the file and in the database """
+        data = (
+            "sku,company,product_name,weight_value,dimension_x_value,dimension_y_value,dimension_z_value\n"
+            "BLU-SHRT-LG,Another Company,Blue Shirt,1,1,1,1\n"
+            "RED-PNT-SM,The Test Company,Red Pant,1,1,1,1\n"
+            "RED-PNT-SM,Another Company,Red Pant,1,1,1,1\n"
+        )
+        result = self.import_csv(data)
+
+        self.assertEquals(result.rows_created, 3)
+        self.assertEquals(result.errors, [])
+        self.assertEquals(Item.objects.filter(sku="BLU-SHRT-LG").count(), 2)
+        self.assertEquals(Item.objects.filter(sku="RED-PNT-SM").count(), 2)
+
+    def test_import_query_count_does_not_grow_with_rows(self):
+        """
+            A batch is validated & inserted with a fixed number of queries,
+            no matter how many rows it contains.
+        """
+        header = "sku,company,product_name,weight_value,dimension_x_value,dimension_y_value,dimension_z_value\n"
+        rows = ''.join("SKU-%s,The Test Company,Item %s,1,1,1,1\n" % (i, i) for i in range(50))
+
+        # Company lookup map, SKU check, SKU formats, and the insert, the
+        # company's inventory summary update & the search index insert
+        # (within a savepoint)
+        with self.assertNumQueries(8):
+            result = self.import_csv(header + rows)
+        self.assertEquals(result.rows_created, 50)
+
+    def test_import_items_command(self):
+        """ The import_items command should import a file from disk """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'items.csv')
+            with open(path, 'w') as import_file:
+                import_file.write(self.csv_data)
+
+            stdout, stderr = StringIO(), StringIO()
+            call_command('import_items', path, '--batch-size', '3', stdout=stdout, stderr=stderr)
+
+        self.assertIn("Imported 2 of 7 rows", stdout.getvalue())
+        self.assertIn("Row 6: Unknown company: Unknown Company", stderr.getvalue())
+        self.assertTrue(Item.objects.filter(sku="RED-PNT-LG").exists())
+
+    def test_import_view(self):
+        """ Uploading a file to the import view should import its rows """
+        upload = SimpleUploadedFile('items.csv', self.csv_data.encode('utf-8'))
+        response = self.client.post(reverse('import-items'), {'import_file': upload})
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.context['result'].rows_created, 2)
+        self.assertTrue(Item.objects.filter(sku="RED-PNT-LG").exists())
+
+    def test_import_badly_encoded_file(self):
+        """
+            A file that isn't valid UTF-8 is reported along with the rows
+            imported before the error, rather than failing the request.
+        """
+        header = "sku,company,product_name,weight_value,dimension_x_value,dimension_y_value,dimension_z_value\n"
+        rows = ''.join("SKU-%s,The Test Company,Item %s,1,1,1,1\n" % (i, i) for i in range(1000))
+        # Latin-1, past the first batches
+        data = (header + rows).encode('utf-8') + "CAFE-1,The Test Company,Café,1,1,1,1\n".encode('latin-1')
+
+        upload = SimpleUploadedFile('items.csv', data)
+        response = self.client.post(reverse('import-items'), {'import_file': upload})
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.context['result'].rows_created, 500)
+        self.assertIn(
+            "500 rows were imported before the error.",
+            response.context['form'].errors['import_file'][0]
+        )
+        self.assertEquals(Item.objects.filter(sku__startswith="SKU-").count(), 500)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'items.csv')
+            with open(path, 'wb') as import_file:
+                import_file.write(data.replace(b'SKU-', b'NEW-'))
+
+            with self.assertRaisesMessage(CommandError, "900 rows were imported before the error."):
+                call_command('import_items', path, '--batch-size', '300', stdout=StringIO(), stderr=StringIO())
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.company1 = Company.objects.create(name="The Test Company")
+        self.company2 = Company.objects.create(name="Another Company")
+        self.item1 = Item.objects.create(
+            sku="BLU-SHRT-LG",
+            company=self.company1,
+            product_name="Blue Shirt, Large",
+            quantity_available=100,
+            is_shippable=True,
+            weight_value=10,
+            dimension_x_value=1,
+            dimension_y_value=2,
+            dimension_z_value=3
+        )
+        self.item2 = Item.objects.create(
+            sku="RED-PNT-SM",
+            company=self.company2,
+            product_name="Red Pant (Small)",
+            quantity_available=100,
+            is_shippable=True,
+            weight_value=10,
+            dimension_x_value=1,
+            dimension_y_value=2,
+            dimension_z_value=3
+        )
+        self.shipment1 = Shipment.objects.create(
+            company = self.company1,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            direction='OUT'
+        )
+        self.shipment2 = Shipment.objects.create(
+            company = self.company2,
+            to_address = "Test address 1234",
+            date_promised=timezone.now(),
+            direction='OUT'
+        )
+        ShipmentItem.objects.create(shipment=self.shipment1, item=self.item1, quantity=4)
+        ShipmentItem.objects.create(shipment=self.shipment2, item=self.item2, quantity=6)
+
+        # Move the second shipment back in time, to test the date filters
+        Shipment.objects.filter(pk=self.shipment2.pk).update(
+            date_created=timezone.now() - datetime.timedelta(days=30)
+        )
+
+    def get_export(self, dataset, file_format, **params):
+        response = self.client.get(reverse('export-data', args=[dataset, file_format]), params)
+        self.assertEquals(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_items_csv(self):
+        """ Every item should be exported, with the header row first """
+        rows = list(csv.DictReader(StringIO(self.get_export('items', 'csv'))))
+
+        self.assertEquals([row['sku'] for row in rows], ["BLU-SHRT-LG", "RED-PNT-SM"])
+        self.assertEquals(rows[0]['product_name'], "Blue Shirt, Large")
+        self.assertEquals(rows[0]['company'], "The Test Company")
+        self.assertEquals(rows[0]['quantity_allocated'], '4')
+
+    def test_export_shipment_lines_ndjson_filters(self):
+        """ The company and date filters should limit the exported rows """
+        rows = [json.loads(line) for line in self.get_export('shipment_lines', 'ndjson').splitlines()]
+        self.assertEquals(len(rows), 2)
+
+        rows = [
+            json.loads(line) for line in
+            self.get_export('shipment_lines', 'ndjson', company=self.company2.pk).splitlines()
+        ]
+        self.assertEquals([row['sku'] for row in rows], ["RED-PNT-SM"])
+
+        since = (timezone.now() - datetime.timedelta(days=7)).date().isoformat()
+        rows = list(csv.DictReader(StringIO(self.get_export('shipments', 'csv', created_after=since))))
+        self.assertEquals([int(row['id']) for row in rows], [self.shipment1.pk])
+
+    def test_export_invalid_parameters(self):
+        """ Invalid datasets, formats and filters should be rejected """
+        response = self.client.get(reverse('export-data', args=['shipments', 'csv']), {'created_after': 'yesterday'})
+        self.assertEquals(response.status_code, 400)
+
+        response = self.client.get(reverse('export-data', args=['items', 'csv']), {'shipped_after': '2022-01-01'})
+        self.assertEquals(response.status_code, 400)
+
+        # Well formatted, but impossible dates
+        response = self.client.get(reverse('export-data', args=['shipments', 'csv']), {'created_after': '2022-02-30'})
+        self.assertEquals(response.status_code, 400)
+
+        response = self.client.get(reverse('export-data', args=['shipments', 'csv']), {'shipped_before': '2022-02-31T00:00:00'})
+        self.assertEquals(response.status_code, 400)
+
+        with self.assertRaises(CommandError):
+            call_command('export', 'shipments', '--created-after', '2022-02-30', stdout=StringIO())
+
+        response = self.client.get(reverse('export-data', args=['passwords', 'csv']))
+        self.assertEquals(response.status_code, 400)
+
+        response = self.client.get(reverse('export-data', args=['items', 'xlsx']))
+        self.assertEquals(response.status_code, 404)
+
+    def test_export_command(self):
+        """ The export command should write the same rows as the views """
+        stdout = StringIO()
+        call_command('export', 'shipments', '--company', str(self.company1.pk), stdout=stdout)
+
+        rows = list(csv.DictReader(StringIO(stdout.getvalue())))
+        self.assertEquals([int(row['id']) for row in rows], [self.shipment1.pk])
+
+
+@override_settings(LOGITRACK_PAGE_SIZE=4)
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.company1 = Company.objects.create(name="The Test Company")
+        # SKUs are created out of order, so that sorting by SKU and by id
+        # give different results
+        self.items = [
+            Item.objects.create(
+                sku="SKU-%02d" % ((i * 7) % 10),
+                company=self.company1,
+                product_name="Item %s" % i,
+                quantity_available=i % 3,
+                weight_value=1,
+                dimension_x_value=1,
+                dimension_y_value=1,
+                dimension_z_value=1
+            )
+            for i in range(10)
+        ]
+        for i in range(6):
+            Shipment.objects.create(
+                company = self.company1,
+                to_address = "Test address %s" % i,
+                date_promised=timezone.now(),
+                direction='OUT'
+            )
+
+    def walk_pages(self, url, params):
+        """
+            Follows the next links from the first page, then the previous
+            links back, and returns the ids seen on each pass.
+        """
+        forward, backward = [], []
+        response = self.client.get(url, params)
+        while True:
+            page = response.context['page']
+            forward.append([obj.pk for obj in page])
+            if not page.has_next():
+                break
+            response = self.client.get(url + '?' + page.next_querystring)
+
+        while True:
+            page = response.context['page']
+            backward.insert(0, [obj.pk for obj in page])
+            if not page.has_previous():
+                break
+            response = self.client.get(url + '?' + page.previous_querystring)
+
+        return forward, backward
+
+    def test_item_pages_by_sort_field(self):
+        """
+            Walking through the pages forwards and backwards should return
+            every item once, in the requested order, for each sort field.
+        """
+        url = reverse('view_all_items')
+        for sort, key in [
+            ('id', lambda item: item.pk),
+            ('-sku', lambda item: item.sku),
+            ('quantity_available', lambda item: (item.quantity_available, item.pk)),
+            ('-date_created', lambda item: (item.date_created, item.pk)),
+        ]:
+            expected = [item.pk for item in sorted(self.items, key=key, reverse=sort.startswith('-'))]
+
+            forward, backward = self.walk_pages(url, {'sort': sort})
+
+            self.assertEquals([len(page) for page in forward], [4, 4, 2])
+            self.assertEquals(sum(forward, []), expected)
+            self.assertEquals(backward, forward)
+
+    def test_item_page_query_count(self):
+        """
+            Later pages shouldn't cost more queries than the first one, and
+            the total is only counted when asked for.
+        """
+        url = reverse('view_all_items')
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertIsNone(response.context['itemCount'])
+
+        with self.assertNumQueries(2):
+            self.client.get(url + '?' + response.context['page'].next_querystring)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'totals': '1'})
+        self.assertEquals(response.context['itemCount'], 10)
+
+    def test_shipment_pages(self):
+        """ Shipments default to the most recently created first """
+        url = reverse('view-all-shipments', kwargs={'company': self.company1.pk})
+        forward, backward = self.walk_pages(url, {'page_size': 5})
+
+        expected = list(Shipment.objects.order_by('-date_created', '-pk').values_list('pk', flat=True))
+        self.assertEquals(sum(forward, []), expected)
+        self.assertEquals([len(page) for page in forward], [5, 1])
+        self.assertEquals(backward, forward)
+
+    def test_invalid_cursor(self):
+        """ A malformed cursor should return a 404 rather than an error """
+        response = self.client.get(reverse('view_all_items'), {'cursor': 'not-a-cursor'})
+        self.assertEquals(response.status_code, 404)
+
+        # Well-formed cursors, with a value or primary key of the wrong type
+        for data in [['next', 'date_created', 'notadate', 1], ['next', 'id', 'x', 'abc'], ['next', 'sku', 'x', 'abc']]:
+            cursor = base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+            response = self.client.get(reverse('view_all_items'), {'cursor': cursor, 'sort': data[1]})
+            self.assertEquals(response.status_code, 404)
+
+
+class QueryPlanIndexTestCase(TestCase):
+    """
+        The following tests seed a dataset, then check with EXPLAIN that the
+        database uses the indexes defined for the shipment quantity & list
+        queries.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.companies = Company.objects.bulk_create([
+            Company(name="Company %s" % i) for i in range(5)
+        ])
+        cls.items = Item.objects.bulk_create([
+            Item(
+                sku="SKU-%s" % i,
+                company=cls.companies[i % 5],
+                product_name="Item %s" % i,
+                quantity_available=100,
+                is_shippable=True,
+                weight_value=1,
+                dimension_x_value=1,
+                dimension_y_value=1,
+                dimension_z_value=1
+            )
+            for i in range(200)
+        ])
+        cls.shipments = Shipment.objects.bulk_create([
+            Shipment(
+                company=cls.companies[i % 5],
+                to_address="Test address",
+                date_promised=timezone.now(),
+                is_shipped=i % 4 != 0,
+                direction='OUT' if i % 2 else 'IN'
+            )
+            for i in range(100)
+        ])
+        ShipmentItem.objects.bulk_create([
+            ShipmentItem(
+                shipment=shipment,
+                item=cls.items[(s * 20 + i) % 200],
+                quantity=1,
+                is_open=not shipment.is_shipped
+            )
+            # As in a real warehouse, most lines are on closed shipments
+            for s, shipment in enumerate(cls.shipments)
+            for i in range(20 if shipment.is_shipped else 3)
+        ])
+
+        # Give the query planner statistics about the seeded data
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == 'postgresql':
+            # The seeded tables are small enough for PostgreSQL to prefer
+            # sequential scans, so rule those out
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_item_open_quantity_uses_index(self):
+        queryset = ShipmentItem.objects.filter(
+            item=self.items[0],
+            is_open=True,
+            shipment__is_shipped=False,
+            shipment__direction='OUT'
+        ).values('item').annotate(total=Sum('quantity'))
+        self.assertUsesIndex(queryset, 'shipmentitem_open_by_item')
+
+    def test_open_shipment_lines_uses_index(self):
+        queryset = ShipmentItem.objects.filter(shipment=self.shipments[0], is_open=True)
+        self.assertUsesIndex(queryset, 'shipmentitem_open_by_shipment')
+
+    def test_company_open_shipments_uses_index(self):
+        queryset = Shipment.objects.filter(company=self.companies[0], is_shipped=False, direction='OUT')
+        self.assertUsesIndex(queryset, 'shipment_company_open')
+
+    def test_company_shipment_list_uses_index(self):
+        queryset = Shipment.objects.filter(company=self.companies[0]).order_by('-date_created', '-pk')[:50]
+        self.assertUsesIndex(queryset, 'shipment_company_created')
+
+    def test_company_sku_prefix_uses_index(self):
+        queryset = search.sku_prefix_queryset("sku-1", self.companies[0].pk)[:20]
+        self.assertUsesIndex(queryset, 'item_unique_company_sku')
+
+
+class SeedWarehouseTestCase(TestCase):
+    def seed(self, **options):
+        out = StringIO()
+        call_command('seed_warehouse', companies=2, items=20, shipments=10, lines=5, stdout=out, **options)
+        return out.getvalue()
+
+    def test_seed_creates_consistent_data(self):
+        """
+            The seeded items' inbound & allocated totals should match the
+            open lines of the seeded shipments.
+        """
+        output = self.seed()
+
+        self.assertEquals(Company.objects.count(), 2)
+        self.assertEquals(Item.objects.count(), 40)
+        self.assertEquals(Shipment.objects.count(), 20)
+        self.assertIn("Created 2 companies, 40 items, 20 shipments", output)
+
+        # Lines are only open on shipments that haven't been shipped
+        self.assertFalse(ShipmentItem.objects.filter(is_open=True, shipment__is_shipped=True).exists())
+        self.assertFalse(ShipmentItem.objects.filter(is_open=False, shipment__is_shipped=False).exists())
+        self.assertFalse(ShipmentItem.objects.exclude(item__company=F('shipment__company')).exists())
+
+        # Raises a CommandError if any totals are mismatched
+        call_command('rebuild_item_quantities', check=True, stdout=StringIO())
+
+    def test_same_seed_generates_same_data(self):
+        self.seed(seed=7, label='A')
+        self.seed(seed=7, label='B')
+        self.seed(seed=8, label='C')
+
+        def dataset(label):
+            items = Item.objects.filter(company__name__startswith=label + ' ').order_by('pk')
+            lines = ShipmentItem.objects.filter(item__in=items).order_by('pk')
+            return (
+                list(items.values_list('product_name', 'quantity_available', 'quantity_allocated_total', 'quantity_inbound_total')),
+                list(lines.values_list('item__product_name', 'quantity', 'is_open', 'shipment__direction')),
+            )
+
+        self.assertEquals(dataset('A'), dataset('B'))
+        self.assertNotEqual(dataset('A'), dataset('C'))
+
+    def test_seed_with_existing_label(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+
+
+@override_settings(LOGITRACK_PAGE_CACHE=None)
+class QueryInstrumentationTestCase(QueryBudgetMixin, TestCase):
+    """
+        The following tests validate the query instrumentation middleware, and
+        keep the number of queries run by Logitrack's pages within budget.
+        The pages are rendered on every request, without the page cache.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_warehouse', companies=3, items=20, shipments=10, lines=5, stdout=StringIO())
+        cls.company = Company.objects.order_by('pk').first()
+        cls.item = Item.objects.filter(company=cls.company).order_by('pk').first()
+
+    @override_settings(LOGITRACK_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('view_all_items'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[0-9.]+;desc="2 queries", dup;desc="0 duplicated queries", total;dur=[0-9.]+$')
+
+    @override_settings(LOGITRACK_SERVER_TIMING=False)
+    def test_server_timing_header_disabled(self):
+        response = self.client.get(reverse('view_all_items'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(LOGITRACK_QUERY_BUDGET=0, LOGITRACK_SERVER_TIMING=True)
+    def test_request_over_budget_is_logged(self):
+        with self.assertLogs('logitrack.queries', level='WARNING') as logs:
+            response = self.client.get(reverse('view_all_items'))
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEquals(record['view'], 'view_all_items')
+        self.assertEquals(record['queries'], 2)
+        self.assertTrue(record['over_budget'])
+        self.assertIn('budget;desc="over budget"', response['Server-Timing'])
+
+    @override_settings(LOGITRACK_QUERY_LOG=True)
+    def test_request_log_line(self):
+        with self.assertLogs('logitrack.queries', level='INFO') as logs:
+            self.client.get(reverse('view-item', args=[self.item.pk]))
+
+        self.assertEquals(logs.records[0].levelname, 'INFO')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEquals(record['view'], 'view-item')
+        self.assertEquals(record['status'], 200)
+        self.assertFalse(record['over_budget'])
+
+    def test_duplicate_queries_are_fingerprinted(self):
+        items = list(Item.objects.order_by('pk')[:3])
+        with record_queries() as recorder:
+            for item in items:
+                Item.objects.get(pk=item.pk)
+            Company.objects.count()
+
+        self.assertEquals(recorder.count, 4)
+        self.assertEquals(len(recorder.duplicates()), 1)
+        key, count = recorder.duplicates()[0]
+        self.assertEquals(count, 3)
+        self.assertIn('inventory_item', recorder.statements[key])
+
+    def test_page_query_budgets(self):
+        shipment_list = reverse('view-all-shipments', kwargs={'company': self.company.pk})
+
+        # The item & shipment lists read their ETag first (see conditional.py)
+        self.assertQueryBudget(reverse('view_all_items'), 2, max_duplicates=0)
+        self.assertQueryBudget(reverse('view_all_items') + '?totals=1', 3, max_duplicates=0)
+        self.assertQueryBudget(reverse('view-item', args=[self.item.pk]), 2, max_duplicates=0)
+        self.assertQueryBudget(reverse('edit-item', args=[self.item.pk]), 6, max_duplicates=0)
+        self.assertQueryBudget(reverse('view-all-companies'), 1, max_duplicates=0)
+        self.assertQueryBudget(reverse('view-company', kwargs={'company': self.company.pk}), 1, max_duplicates=0)
+        self.assertQueryBudget(shipment_list, 3, max_duplicates=0)
+        self.assertQueryBudget(reverse('export-data', kwargs={'dataset': 'items', 'file_format': 'csv'}), 1)
+        self.assertQueryBudget(reverse('export-data', kwargs={'dataset': 'shipment_lines', 'file_format': 'ndjson'}), 1)
+
+
+class APITestCase(QueryBudgetMixin, TestCase):
+    """
+        The following tests validate the JSON API (see inventory/api.py)
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="The Test Company")
+        self.other_company = Company.objects.create(name="Another Company")
+        self.items = [
+            Item.objects.create(
+                sku="API-%s" % i,
+                company=self.company,
+                product_name="API item %s" % i,
+                quantity_available=50,
+                is_shippable=True,
+                weight_value=1,
+                dimension_x_value=1,
+                dimension_y_value=1,
+                dimension_z_value=1
+            )
+            for i in range(30)
+        ]
+        self.shipment = Shipment.objects.create(
+            company=self.company,
+            to_address="Test address",
+            date_promised=timezone.now(),
+            direction='OUT'
+        )
+
+    def post_json(self, url, data):
+        return self.client.post(url, data=json.dumps(data), content_type='application/json')
+
+    def patch_json(self, url, data):
+        return self.client.patch(url, data=json.dumps(data), content_type='application/json')
+
+    def test_list_items_with_field_selection(self):
+        url = reverse('api-items') + '?fields=id,sku,company_name&page_size=10'
+        response = self.assertQueryBudget(url, 1)
+
+        data = response.json()
+        self.assertEquals(len(data['results']), 10)
+        self.assertEquals(data['results'][0], {'id': self.items[0].pk, 'sku': 'API-0', 'company_name': 'The Test Company'})
+        self.assertIsNotNone(data['next'])
+
+        next_page = self.client.get(url + '&cursor=' + data['next']).json()
+        self.assertEquals(next_page['results'][0]['sku'], 'API-10')
+
+    def test_list_filters(self):
+        response = self.client.get(reverse('api-items'), {'company': self.other_company.pk})
+        self.assertEquals(response.json()['results'], [])
+
+        response = self.client.get(reverse('api-shipments'), {'is_shipped': 'false', 'fields': 'id,status'})
+        self.assertEquals(response.json()['results'], [{'id': self.shipment.pk, 'status': 'Pending Shipping'}])
+
+        response = self.client.get(reverse('api-items'), {'company': 'abc'})
+        self.assertEquals(response.status_code, 400)
+
+    def test_unknown_field_selection(self):
+        response = self.client.get(reverse('api-items') + '?fields=id,price')
+        self.assertEquals(response.status_code, 400)
+        self.assertIn('fields', response.json()['errors'])
+
+    def test_create_item(self):
+        response = self.post_json(reverse('api-items'), {
+            'sku': 'API-NEW',
+            'company': self.company.pk,
+            'product_name': 'New item',
+            'weight_value': 2.5,
+            'dimension_x_value': 1,
+            'dimension_y_value': 1,
+            'dimension_z_value': 1,
+        })
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(response.json()['sku'], 'API-NEW')
+        self.assertTrue(Item.objects.filter(sku='API-NEW', company=self.company).exists())
+
+    def test_create_invalid_item(self):
+        """ The model's validation should be returned as errors by field """
+        response = self.post_json(reverse('api-items'), {
+            'sku': 'API-0',
+            'company': self.company.pk,
+            'product_name': 'Duplicate SKU',
+            'weight_value': 'heavy',
+            'dimension_x_value': 1,
+            'dimension_y_value': 1,
+            'dimension_z_value': 1,
+        })
+        self.assertEquals(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertIn('sku', errors)
+        self.assertIn('weight_value', errors)
+
+    def test_update_item(self):
+        url = reverse('api-item', args=[self.items[0].pk])
+        response = self.patch_json(url, {'product_name': 'Renamed'})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()['product_name'], 'Renamed')
+
+        # The inbound & allocated totals are maintained by the shipment lines
+        response = self.patch_json(url, {'quantity_allocated_total': 0})
+        self.assertEquals(response.status_code, 400)
+
+    def test_not_found(self):
+        response = self.client.get(reverse('api-item', args=[0]))
+        self.assertEquals(response.status_code, 404)
+        self.assertEquals(response.json(), {'errors': ['Not found']})
+
+    def test_create_company_and_shipment(self):
+        response = self.post_json(reverse('api-companies'), {'name': 'API Company'})
+        self.assertEquals(response.status_code, 201)
+        company_id = response.json()['id']
+
+        response = self.post_json(reverse('api-shipments'), {
+            'company': company_id,
+            'to_address': '1 Test Road',
+            'date_promised': '2022-02-01T12:00:00Z',
+            'direction': 'IN',
+        })
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(response.json()['status'], 'Pending Receipt')
+
+        response = self.post_json(reverse('api-companies'), {'name': 'API Company'})
+        self.assertEquals(response.status_code, 400)
+
+    def test_add_shipment_lines_in_bulk(self):
+        url = reverse('api-shipment-lines', args=[self.shipment.pk])
+        lines = [{'item': item.pk, 'quantity': 5} for item in self.items]
+
+        # The lines are validated & added as a batch (see
+        # ShipmentItemQuerySet.bulk_add): the shipment, the items, the lines,
+        # the items' quantities, the company's summary & the ledger, within
+        # two savepoints
+        with self.assertNumQueries(10):
+            response = self.post_json(url + '?fields=id,sku,quantity', {'lines': lines})
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(len(response.json()['results']), 30)
+        self.assertEquals(ShipmentItem.objects.filter(shipment=self.shipment).count(), 30)
+
+        item = Item.objects.get(pk=self.items[0].pk)
+        self.assertEquals(item.quantity_available, 45)
+        self.assertEquals(item.quantity_allocated(), 5)
+
+        self.assertQueryBudget(url, 2)
+
+    def test_add_invalid_shipment_lines(self):
+        """ If any line is invalid, no lines should be added """
+        other_item = Item.objects.create(
+            sku="OTHER",
+            company=self.other_company,
+            product_name="Other company's item",
+            quantity_available=50,
+            is_shippable=True,
+            weight_value=1,
+            dimension_x_value=1,
+            dimension_y_value=1,
+            dimension_z_value=1
+        )
+        url = reverse('api-shipment-lines', args=[self.shipment.pk])
+        response = self.post_json(url, [
+            {'item': self.items[0].pk, 'quantity': 5},
+            {'item': self.items[1].pk, 'quantity': 500},
+            {'item': other_item.pk, 'quantity': 1},
+            {'item': self.items[2].pk, 'quantity': 1, 'is_open': False},
+        ])
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(sorted(response.json()['errors']), ['1', '2', '3'])
+        self.assertFalse(ShipmentItem.objects.filter(shipment=self.shipment).exists())
+        self.assertEquals(Item.objects.get(pk=self.items[0].pk).quantity_available, 50)
+
+    def test_update_shipment_line(self):
+        line = ShipmentItem(shipment=self.shipment, item=self.items[0], quantity=5)
+        line.save()
+
+        response = self.patch_json(reverse('api-shipment-line', args=[line.pk]), {'quantity': 8})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()['quantity'], 8)
+        self.assertEquals(Item.objects.get(pk=self.items[0].pk).quantity_available, 42)
+
+    def test_update_shipment_line_with_invalid_quantity(self):
+        """ Invalid quantities are returned as errors, before the inventory is checked """
+        line = ShipmentItem(shipment=self.shipment, item=self.items[0], quantity=5)
+        line.save()
+
+        for quantity in ['abc', None]:
+            response = self.patch_json(reverse('api-shipment-line', args=[line.pk]), {'quantity': quantity})
+            self.assertEquals(response.status_code, 400)
+            self.assertIn('quantity', response.json()['errors'])
+        self.assertEquals(Item.objects.get(pk=self.items[0].pk).quantity_available, 45)
+
+        response = self.post_json(reverse('api-shipment-lines', args=[self.shipment.pk]), [
+            {'item': self.items[1].pk, 'quantity': 'abc'},
+            {'item': self.items[2].pk, 'quantity': None},
+        ])
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(sorted(response.json()['errors']), ['0', '1'])
+
+    def test_ship_shipments(self):
+        second_shipment = Shipment.objects.create(
+            company=self.company,
+            to_address="Test address",
+            date_promised=timezone.now(),
+            direction='IN'
+        )
+        ShipmentItem(shipment=self.shipment, item=self.items[0], quantity=5).save()
+        ShipmentItem(shipment=second_shipment, item=self.items[0], quantity=7).save()
+
+        response = self.post_json(reverse('api-ship-shipments'), {
+            'shipments': [self.shipment.pk, second_shipment.pk, 0]
+        })
+        self.assertEquals(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEquals([result['status'] for result in results], ['shipped', 'received', 'error'])
+
+        self.assertFalse(ShipmentItem.objects.filter(is_open=True).exists())
+        item = Item.objects.get(pk=self.items[0].pk)
+        self.assertEquals(item.quantity_allocated(), 0)
+        self.assertEquals(item.quantity_inbound(), 0)
+        self.assertIsNotNone(Shipment.objects.get(pk=second_shipment.pk).date_shipped)
+
+    def test_ship_shipments_with_invalid_ids(self):
+        response = self.post_json(reverse('api-ship-shipments'), {'shipments': [self.shipment.pk, {}, 'abc']})
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.json()['errors'], {'shipments': {'1': ["Expected a shipment id"], '2': ["Expected a shipment id"]}})
+        self.assertFalse(Shipment.objects.get(pk=self.shipment.pk).is_shipped)
+
+        # Outside the API, ids that aren't integers are reported as errors
+        result = ship_shipments([self.shipment.pk, {}])
+        self.assertEquals([row['status'] for row in result.results], ['shipped', 'error'])
+
+        # Shipments can't be shipped twice
+        response = self.post_json(reverse('api-ship-shipments'), [self.shipment.pk])
+        self.assertEquals(response.json()['results'][0]['status'], 'error')
+
+
+class BatchShipTestCase(TestCase):
+    """
+        The following tests validate the shipping & receiving of many
+        shipments at once (see inventory/shipping.py)
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="The Test Company")
+        self.other_company = Company.objects.create(name="Another Company")
+        self.items = [
+            Item.objects.create(
+                sku="BATCH-%s" % i,
+                company=self.company,
+                product_name="Batch item %s" % i,
+                quantity_available=100,
+                is_shippable=True,
+                weight_value=1,
+                dimension_x_value=1,
+                dimension_y_value=1,
+                dimension_z_value=1
+            )
+            for i in range(3)
+        ]
+
+    def create_shipment(self, direction='OUT', days=0, company=None, quantity=2):
+        shipment = Shipment.objects.create(
+            company=company or self.company,
+            to_address="Test address",
+            date_promised=timezone.now() + datetime.timedelta(days=days),
+            direction=direction
+        )
+        if company is None:
+            for item in self.items:
+                ShipmentItem(shipment=shipment, item=item, quantity=quantity).save()
+        return shipment
+
+    def assertTotals(self, inbound, allocated):
+        for item in Item.objects.filter(company=self.company):
+            self.assertEquals(item.quantity_inbound(), inbound)
+            self.assertEquals(item.quantity_allocated(), allocated)
+
+    def test_ship_shipments_by_id(self):
+        outbound = [self.create_shipment('OUT') for i in range(3)]
+        inbound = self.create_shipment('IN', quantity=5)
+        shipped = self.create_shipment('OUT')
+        shipped.is_shipped = True
+        shipped.date_shipped = timezone.now()
+        shipped.save()
+        self.assertTotals(5, 6)
+
+        shipment_ids = [shipment.pk for shipment in outbound] + [inbound.pk, shipped.pk, 0, outbound[0].pk]
+        result = ship_shipments(shipment_ids)
+
+        self.assertEquals(
+            [shipment['status'] for shipment in result.results],
+            ['shipped', 'shipped', 'shipped', 'received', 'error', 'error', 'error']
+        )
+        self.assertEquals(result.results[0]['lines_closed'], 3)
+        self.assertEquals(len(result.shipped), 4)
+        self.assertEquals(len(result.errors), 3)
+
+        self.assertTotals(0, 0)
+        self.assertFalse(ShipmentItem.objects.filter(is_open=True).exists())
+        self.assertFalse(Shipment.objects.filter(is_shipped=False).exists())
+        self.assertFalse(Shipment.objects.filter(date_shipped__isnull=True).exists())
+
+        # Receiving doesn't change the quantity available, which is added
+        # when the inbound lines are created
+        self.assertEquals(Item.objects.get(pk=self.items[0].pk).quantity_available, 100 - 4 * 2 + 5)
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        small_batch = [self.create_shipment(direction).pk for direction in ('OUT', 'IN')]
+        large_batch = [self.create_shipment(direction).pk for direction in ('OUT', 'IN') * 10]
+
+        with CaptureQueriesContext(connection) as small_queries:
+            ship_shipments(small_batch)
+        with CaptureQueriesContext(connection) as large_queries:
+            result = ship_shipments(large_batch)
+
+        self.assertEquals(len(large_queries), len(small_queries))
+        self.assertEquals(len(result.shipped), 20)
+        self.assertTotals(0, 0)
+
+    def test_ship_by_company_and_cutoff(self):
+        due = self.create_shipment('OUT', days=-1)
+        later = self.create_shipment('OUT', days=5)
+        inbound = self.create_shipment('IN', days=-1)
+        other = self.create_shipment('OUT', days=-1, company=self.other_company)
+
+        result = ship_shipments(company=self.company, cutoff=timezone.now(), direction='OUT')
+
+        self.assertEquals(result.results, [{'id': due.pk, 'status': 'shipped', 'lines_closed': 3}])
+        self.assertEquals(
+            set(Shipment.objects.filter(is_shipped=False).values_list('pk', flat=True)),
+            {later.pk, inbound.pk, other.pk}
+        )
+
+    def test_require_all(self):
+        outbound = self.create_shipment('OUT')
+        other = self.create_shipment('OUT', company=self.other_company)
+
+        result = ship_shipments([outbound.pk, other.pk], company=self.company, require_all=True)
+
+        self.assertEquals(len(result.errors), 2)
+        self.assertFalse(Shipment.objects.filter(is_shipped=True).exists())
+        self.assertTotals(0, 2)
+
+    def test_command(self):
+        outbound = self.create_shipment('OUT')
+        out = StringIO()
+        call_command('ship_shipments', outbound.pk, date_shipped='2022-01-31', stdout=out)
+
+        self.assertIn("1 shipments shipped or received, 0 errors", out.getvalue())
+        self.assertEquals(Shipment.objects.get(pk=outbound.pk).date_shipped.date(), datetime.date(2022, 1, 31))
+
+        with self.assertRaises(CommandError):
+            call_command('ship_shipments', outbound.pk, stdout=StringIO(), stderr=StringIO())
+
+    def test_view(self):
+        due = self.create_shipment('OUT', days=-1)
+        later = self.create_shipment('OUT', days=5)
+        url = reverse('ship-shipment-batch', kwargs={'company': self.company.pk})
+
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+
+        response = self.client.post(url, {
+            'direction': 'OUT',
+            'shipments': [due.pk],
+            'date_shipped': '2022-01-31 17:00',
+        })
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(len(response.context['result'].shipped), 1)
+        self.assertTrue(Shipment.objects.get(pk=due.pk).is_shipped)
+        self.assertFalse(Shipment.objects.get(pk=later.pk).is_shipped)
+
+    def test_api_cutoff(self):
+        due = self.create_shipment('IN', days=-1)
+        response = self.client.post(
+            reverse('api-ship-shipments'),
+            data=json.dumps({'company': self.company.pk, 'cutoff': '2100-01-01', 'direction': 'IN'}),
+            content_type='application/json'
+        )
+        self.assertEquals(response.json()['results'], [{'id': due.pk, 'status': 'received', 'lines_closed': 3}])
+
+
+class CompanyInventorySummaryTestCase(QueryBudgetMixin, TestCase):
+    """
+        The following tests validate that the company inventory summaries are
+        kept up to date as items, shipments & shipment lines change.
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="The Test Company")
+        self.other_company = Company.objects.create(name="Another Company")
+
+    def assertSummary(self, company, sku_count, available, inbound, allocated):
+        summary = CompanyInventorySummary.objects.get(company=company)
+        self.assertEquals(
+            (summary.sku_count, summary.units_available, summary.units_inbound, summary.units_allocated),
+            (sku_count, available, inbound, allocated)
+        )
+        # The incremental updates should match a full recomputation
+        self.assertEquals(CompanyInventorySummary.objects.rebuild(save=False), 0)
+
+    def test_summary_follows_items(self):
+        self.assertSummary(self.company, 0, 0, 0, 0)
+
+        item = create_item(self.company, "SUM-1", 10)
+        create_item(self.company, "SUM-2", 5)
+        self.assertSummary(self.company, 2, 15, 0, 0)
+
+        item.quantity_available = 4
+        item.save()
+        self.assertSummary(self.company, 2, 9, 0, 0)
+
+        item.company = self.other_company
+        item.save()
+        self.assertSummary(self.company, 1, 5, 0, 0)
+        self.assertSummary(self.other_company, 1, 4, 0, 0)
+
+        # Fields left out of update_fields aren't saved
+        item.quantity_available = 100
+        item.save(update_fields=['product_name'])
+        self.assertSummary(self.other_company, 1, 4, 0, 0)
+
+        item.delete()
+        self.assertSummary(self.other_company, 0, 0, 0, 0)
+
+    def test_summary_follows_shipment_lines(self):
+        item = create_item(self.company, "SUM-1", 10)
+        outbound = create_shipment(self.company, 'OUT')
+        inbound = create_shipment(self.company, 'IN')
+
+        line = ShipmentItem(shipment=outbound, item=item, quantity=4)
+        line.save()
+        ShipmentItem(shipment=inbound, item=item, quantity=6).save()
+        self.assertSummary(self.company, 1, 12, 6, 4)
+
+        line.quantity = 7
+        line.save()
+        self.assertSummary(self.company, 1, 9, 6, 7)
+
+        line.delete()
+        self.assertSummary(self.company, 1, 16, 6, 0)
+
+        ShipmentItem(shipment=outbound, item=item, quantity=2).save()
+        outbound.is_shipped = True
+        outbound.date_shipped = timezone.now()
+        outbound.save()
+        self.assertSummary(self.company, 1, 14, 6, 0)
+
+        ship_shipments([inbound.pk])
+        self.assertSummary(self.company, 1, 14, 0, 0)
+
+    def test_summary_follows_bulk_imports(self):
+        data = (
+            "sku,company,product_name,quantity_available,weight_value,dimension_x_value,dimension_y_value,dimension_z_value\n"
+            "IMP-1,The Test Company,Imported item,10,1,1,1,1\n"
+            "IMP-2,Another Company,Imported item,3,1,1,1,1\n"
+        )
+        ItemImporter().run(read_rows(StringIO(data), 'csv'))
+
+        self.assertSummary(self.company, 1, 10, 0, 0)
+        self.assertSummary(self.other_company, 1, 3, 0, 0)
+
+    def test_rebuild_item_quantities_rebuilds_summaries(self):
+        create_item(self.company, "SUM-1", 10)
+        CompanyInventorySummary.objects.filter(company=self.company).update(units_available=0)
+        CompanyInventorySummary.objects.filter(company=self.other_company).delete()
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_item_quantities', check=True, stdout=StringIO())
+
+        out = StringIO()
+        call_command('rebuild_item_quantities', stdout=out)
+        self.assertIn("2 out of date company inventory summaries", out.getvalue())
+        self.assertSummary(self.company, 1, 10, 0, 0)
+        self.assertSummary(self.other_company, 0, 0, 0, 0)
+
+    def test_company_pages_read_the_summary(self):
+        for i in range(10):
+            create_item(self.company, "SUM-%s" % i, i)
+
+        response = self.assertQueryBudget(reverse('view-all-companies'), 1)
+        self.assertContains(response, "<td>45</td>", html=True)
+
+        response = self.assertQueryBudget(reverse('view-company', kwargs={'company': self.company.pk}), 1)
+        self.assertContains(response, "<dd>45</dd>", html=True)
+
+
+class InventoryLedgerTestCase(TestCase):
+    """
+        The following tests validate the inventory ledger: the movements
+        written as items & shipment lines change, and the quantities on past
+        dates computed from them & the snapshots.
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="The Test Company")
+        self.item = create_item(self.company, "LEDGER-1", 10, product_name="Ledger item")
+
+    def assertQuantitiesAt(self, at, available, inbound, allocated):
+        expected = {
+            'quantity_available': available,
+            'quantity_inbound_total': inbound,
+            'quantity_allocated_total': allocated,
+        }
+        self.assertEquals(self.item.quantities_at(at), expected)
+
+        item = Item.objects.with_quantities_at(at).get(pk=self.item.pk)
+        self.assertEquals({name: getattr(item, '%s_at' % name) for name in expected}, expected)
+
+    def assertLedgerMatchesItem(self):
+        self.item.refresh_from_db()
+        self.assertQuantitiesAt(
+            timezone.now(),
+            self.item.quantity_available,
+            self.item.quantity_inbound_total,
+            self.item.quantity_allocated_total
+        )
+
+    def test_shipment_lines_write_movements(self):
+        outbound = create_shipment(self.company, 'OUT')
+        inbound = create_shipment(self.company, 'IN')
+
+        line = ShipmentItem(shipment=outbound, item=self.item, quantity=4)
+        line.save()
+        line.quantity = 7
+        line.save()
+        ShipmentItem(shipment=inbound, item=self.item, quantity=6).save()
+        line_pk = line.pk
+        line.delete()
+        self.assertLedgerMatchesItem()
+
+        ShipmentItem(shipment=outbound, item=self.item, quantity=2).save()
+        outbound.is_shipped = True
+        outbound.date_shipped = timezone.now()
+        outbound.save()
+        ship_shipments([inbound.pk])
+        self.assertLedgerMatchesItem()
+
+        movements = self.item.inventory_movements.order_by('pk')
+        self.assertEquals(
+            list(movements.values_list('kind', 'available_delta', 'inbound_delta', 'allocated_delta')),
+            [
+                ('adjust', 10, 0, 0),
+                ('create', -4, 0, 4),
+                ('edit', -3, 0, 3),
+                ('create', 6, 6, 0),
+                ('delete', 7, 0, -7),
+                ('create', -2, 0, 2),
+                ('close', 0, 0, -2),
+                ('close', 0, -6, 0),
+            ]
+        )
+        self.assertEquals(movements.filter(kind='delete').get().shipment_item_id, line_pk)
+
+    def test_moving_a_line_to_another_item(self):
+        other_item = create_item(self.company, "LEDGER-2", 10)
+        outbound = create_shipment(self.company, 'OUT')
+        inbound = create_shipment(self.company, 'IN')
+        ShipmentItem(shipment=outbound, item=self.item, quantity=5).save()
+        ShipmentItem(shipment=inbound, item=self.item, quantity=3).save()
+
+        for line in ShipmentItem.objects.filter(item=self.item):
+            line.item = other_item
+            line.save()
+
+        items = Item.objects.with_shipment_quantities().order_by('pk')
+        self.assertEquals(
+            [(item.quantity_available, item.quantity_allocated_total, item.quantity_inbound_total) for item in items],
+            [(10, 0, 0), (8, 5, 3)]
+        )
+        for item in items:
+            self.assertEquals(item.quantity_allocated_total, item.open_quantity_allocated)
+            self.assertEquals(item.quantity_inbound_total, item.open_quantity_inbound)
+        self.assertEquals(CompanyInventorySummary.objects.rebuild(save=False), 0)
+        self.assertLedgerMatchesItem()
+        self.item = other_item
+        self.assertLedgerMatchesItem()
+
+        # The new item must have the whole quantity of an outbound line
+        line = ShipmentItem.objects.get(shipment=outbound)
+        line.item = create_item(self.company, "LEDGER-3", 4)
+        with self.assertRaises(ValidationError):
+            line.save()
+
+    def test_rejected_changes_write_no_movements(self):
+        outbound = create_shipment(self.company, 'OUT')
+        with self.assertRaises(ValidationError):
+            ShipmentItem(shipment=outbound, item=self.item, quantity=11).save()
+
+        self.assertEquals(self.item.inventory_movements.exclude(kind='adjust').count(), 0)
+
+    def test_quantities_at_past_dates(self):
+        # Move the item's creation an hour into the past
+        created = timezone.now() - datetime.timedelta(hours=1)
+        before = created - datetime.timedelta(hours=1)
+        InventoryMovement.objects.filter(item=self.item).update(date_created=created)
+
+        outbound = create_shipment(self.company, 'OUT')
+        ShipmentItem(shipment=outbound, item=self.item, quantity=4).save()
+        allocated = timezone.now()
+        ship_shipments([outbound.pk])
+
+        self.assertQuantitiesAt(before, 0, 0, 0)
+        self.assertQuantitiesAt(created, 10, 0, 0)
+        self.assertQuantitiesAt(allocated, 6, 0, 4)
+        self.assertQuantitiesAt(timezone.now(), 6, 0, 0)
+
+    def test_snapshots_bound_the_ledger_scan(self):
+        outbound = create_shipment(self.company, 'OUT')
+        ShipmentItem(shipment=outbound, item=self.item, quantity=4).save()
+
+        snapshot_date = timezone.now()
+        self.assertEquals(InventorySnapshot.objects.take(snapshot_date), 1)
+        # Only the items that moved since their latest snapshot are snapshotted
+        self.assertEquals(InventorySnapshot.objects.take(snapshot_date), 0)
+
+        ship_shipments([outbound.pk])
+
+        # The movements before the snapshot are no longer read
+        InventoryMovement.objects.filter(date_created__lte=snapshot_date).delete()
+        with self.assertNumQueries(2):
+            self.assertEquals(
+                self.item.quantities_at(timezone.now()),
+                {'quantity_available': 6, 'quantity_inbound_total': 0, 'quantity_allocated_total': 0}
+            )
+        self.assertQuantitiesAt(snapshot_date, 6, 0, 4)
+
+    def test_bulk_imports_write_movements(self):
+        data = (
+            "sku,company,product_name,quantity_available,weight_value,dimension_x_value,dimension_y_value,dimension_z_value\n"
+            "IMP-1,The Test Company,Imported item,10,1,1,1,1\n"
+            "IMP-2,The Test Company,Imported item,0,1,1,1,1\n"
+        )
+        ItemImporter().run(read_rows(StringIO(data), 'csv'))
+
+        self.item = Item.objects.get(sku="IMP-1")
+        self.assertLedgerMatchesItem()
+        self.assertFalse(InventoryMovement.objects.filter(item__sku="IMP-2").exists())
+
+    def test_snapshot_command(self):
+        out = StringIO()
+        call_command('snapshot_inventory', stdout=out)
+        self.assertIn("Took 1 snapshots", out.getvalue())
+
+        out = StringIO()
+        call_command('snapshot_inventory', company=self.company.pk, stdout=out)
+        self.assertIn("Took 0 snapshots", out.getvalue())
+        self.assertLedgerMatchesItem()
+
+        with self.assertRaises(CommandError):
+            call_command('snapshot_inventory', at='2999-01-01', stdout=StringIO())
+
+
+class ForecastingTestCase(TestCase):
+    """
+        The following tests validate the demand history loaded from the
+        shipments, the forecasts and the reorder suggestions.
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="The Test Company")
+        self.item = create_item(self.company, "FC-1", 20)
+        self.idle_item = create_item(self.company, "FC-2", 5)
+        self.today = timezone.localdate()
+
+    def ship(self, item, quantity, days_ago, direction='OUT'):
+        shipment = Shipment.objects.create(
+            company=self.company,
+            to_address="Test address",
+            date_promised=timezone.now(),
+            direction=direction
+        )
+        ShipmentItem(shipment=shipment, item=item, quantity=quantity).save()
+        date = self.today - datetime.timedelta(days=days_ago)
+        ship_shipments([shipment.pk], date_shipped=timezone.make_aware(datetime.datetime.combine(date, datetime.time(12))))
+        return shipment
+
+    def test_demand_history(self):
+        self.ship(self.item, 3, 0)
+        self.ship(self.item, 4, 0)
+        self.ship(self.item, 5, 2)
+        self.ship(self.item, 6, 10)
+        self.ship(self.item, 7, 1, direction='IN')
+
+        # Lines on open shipments aren't demand yet
+        open_shipment = Shipment.objects.create(
+            company=self.company, to_address="Test address", date_promised=timezone.now(), direction='OUT'
+        )
+        ShipmentItem(shipment=open_shipment, item=self.item, quantity=1).save()
+
+        with self.assertNumQueries(2):
+            history = DemandHistory.load(self.company, days=5)
+
+        self.assertEquals(history.item_ids.tolist(), [self.item.pk, self.idle_item.pk])
+        self.assertEquals(history.start, self.today - datetime.timedelta(days=4))
+        self.assertEquals(history.quantities.tolist(), [[0, 0, 5, 0, 7], [0, 0, 0, 0, 0]])
+        self.assertEquals(history.positions.tolist(), [20 - 18 + 7 - 1, 5])
+
+    def test_forecasts(self):
+        quantities = np.array([[1, 2, 3, 4], [4, 4, 4, 4]], dtype=np.float32)
+        self.assertEquals(moving_average(quantities, 2).tolist(), [3.5, 4])
+        self.assertEquals(moving_average(quantities, 10).tolist(), [2.5, 4])
+
+        # The vectorized smoothing matches the recursive definition
+        level = 1
+        for quantity in [2, 3, 4]:
+            level = 0.5 * quantity + 0.5 * level
+        smoothed = exponential_smoothing(quantities, 0.5)
+        self.assertAlmostEqual(smoothed[0], level)
+        self.assertAlmostEqual(smoothed[1], 4)
+
+        with self.assertRaises(ValueError):
+            exponential_smoothing(quantities, 0)
+
+    def test_reorder_suggestions(self):
+        for days_ago in range(7):
+            self.ship(self.item, 2, days_ago)
+
+        suggestions = forecast_company(
+            self.company, method='sma', window=7, lead_time_days=7, review_days=14
+        )
+        self.assertEquals(len(suggestions), 2)
+
+        suggestion = ReorderSuggestion.objects.get(item=self.item)
+        self.assertAlmostEqual(suggestion.daily_demand, 2)
+        self.assertAlmostEqual(suggestion.demand_std, 0)
+        self.assertEquals(suggestion.reorder_point, 14)
+        # 6 left, ordered up to the reorder point plus 14 days of demand
+        self.assertEquals(suggestion.suggested_quantity, 14 + 28 - 6)
+
+        idle = ReorderSuggestion.objects.get(item=self.idle_item)
+        self.assertEquals((idle.reorder_point, idle.suggested_quantity), (0, 0))
+
+        response = self.client.get(reverse('view-item', kwargs={'id': self.item.pk}))
+        self.assertContains(response, "<dd>36</dd>", html=True)
+
+        # Forecasting again replaces the suggestions
+        forecast_company(self.company)
+        self.assertEquals(ReorderSuggestion.objects.filter(item__company=self.company).count(), 2)
+        self.assertEquals(ReorderSuggestion.objects.get(item=self.item).method, 'ses')
+
+    def test_open_inbound_lines_count_once(self):
+        for days_ago in range(7):
+            self.ship(self.item, 2, days_ago)
+        # The open inbound line adds its 5 units to quantity_available already
+        inbound = create_shipment(self.company, 'IN')
+        ShipmentItem(shipment=inbound, item=self.item, quantity=5).save()
+
+        history = DemandHistory.load(self.company)
+        self.assertEquals(list(history.positions), [11, 5])
+
+        # 11 is below the reorder point of 14, which 16 (counting the
+        # inbound units twice) wouldn't be
+        forecast_company(self.company, method='sma', window=7, lead_time_days=7, review_days=14)
+        suggestion = ReorderSuggestion.objects.get(item=self.item)
+        self.assertEquals(suggestion.suggested_quantity, 14 + 28 - 11)
+
+    def test_command(self):
+        self.ship(self.item, 2, 1)
+        out = StringIO()
+        call_command('forecast_demand', company=self.company.pk, stdout=out)
+        self.assertIn("forecast 2 items", out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('forecast_demand', alpha=2, stdout=StringIO())
+
+
+class UnitsTestCase(QueryBudgetMixin, TestCase):
+    """
+        The following tests validate the conversion of item weights &
+        dimensions to kilograms and cubic meters, and the shipment totals.
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="The Test Company")
+        self.metric = self.create_item("UNIT-1", 2, 'kg', 'm', (1, 2, 0.5))
+        self.imperial = self.create_item("UNIT-2", 16, 'oz', 'ft', (2, 2, 2))
+        self.pounds = self.create_item("UNIT-3", 10, 'lb', 'm', (0.1, 0.1, 0.1))
+
+    def create_item(self, sku, weight, weight_unit, dimension_unit, dimensions):
+        return Item.objects.create(
+            sku=sku,
+            company=self.company,
+            product_name="Item %s" % sku,
+            quantity_available=100,
+            is_shippable=True,
+            weight_value=weight,
+            weight_unit=weight_unit,
+            dimension_x_value=dimensions[0],
+            dimension_y_value=dimensions[1],
+            dimension_z_value=dimensions[2],
+            dimension_unit=dimension_unit
+        )
+
+    def test_item_measures(self):
+        self.assertEquals(self.imperial.total_volume_unit(), "ft ^ 3")
+        self.assertAlmostEqual(self.imperial.volume_m3(), 8 * 0.3048 ** 3)
+        self.assertAlmostEqual(self.imperial.weight_kg(), 16 * 0.028349523125)
+        self.assertAlmostEqual(self.pounds.weight_kg(), 4.5359237)
+
+        self.metric.dimension_z_value = None
+        self.assertFalse(self.metric.can_calculate_volume())
+        self.assertIsNone(self.metric.total_volume_unit())
+        self.assertIsNone(self.metric.volume_m3())
+
+    def test_database_and_numpy_conversions_match(self):
+        items = Item.objects.order_by('pk')
+        expected = [(item.weight_kg(), item.volume_m3()) for item in items]
+
+        annotated = items.with_measures().values_list('weight_kg', 'volume_m3')
+        for (weight, volume), (expected_weight, expected_volume) in zip(annotated, expected):
+            self.assertAlmostEqual(weight, expected_weight)
+            self.assertAlmostEqual(volume, expected_volume)
+
+        weights = units.weights_kg(items.values_list(*units.WEIGHT_FIELDS))
+        volumes = units.volumes_m3(items.values_list(*units.VOLUME_FIELDS))
+        np.testing.assert_allclose(weights, [weight for weight, volume in expected])
+        np.testing.assert_allclose(volumes, [volume for weight, volume in expected])
+
+        self.assertEquals(len(units.weights_kg([])), 0)
+        self.assertTrue(np.isnan(units.weights_kg([(1, 'stone')])[0]))
+
+    def test_shipment_totals(self):
+        shipment = Shipment.objects.create(
+            company=self.company, to_address="Test address", date_promised=timezone.now(), direction='OUT'
+        )
+        empty = Shipment.objects.create(
+            company=self.company, to_address="Test address", date_promised=timezone.now(), direction='OUT'
+        )
+        ShipmentItem(shipment=shipment, item=self.metric, quantity=3).save()
+        ShipmentItem(shipment=shipment, item=self.imperial, quantity=2).save()
+
+        totals = Shipment.objects.with_totals().in_bulk([shipment.pk, empty.pk])
+        self.assertAlmostEqual(totals[shipment.pk].total_weight_kg, 3 * 2 + 2 * 16 * 0.028349523125)
+        self.assertAlmostEqual(totals[shipment.pk].total_volume_m3, 3 * 1 + 2 * 8 * 0.3048 ** 3)
+        self.assertEquals((totals[empty.pk].total_weight_kg, totals[empty.pk].total_volume_m3), (0, 0))
+
+        response = self.assertQueryBudget(reverse('view-all-shipments', kwargs={'company': self.company.pk}), 3)
+        self.assertContains(response, "<td>6.91 kg</td>", html=True)
+
+        ship_url = reverse('ship-shipment', kwargs={'company': self.company.pk, 'shipmentid': shipment.pk})
+        response = self.assertQueryBudget(ship_url, 4)
+        self.assertContains(response, "<th>3.453 m³</th>", html=True)
+
+
+class PackingTestCase(TestCase):
+    """
+        The following tests validate the packing plans of shipments.
+    """
+    def setUp(self):
+        cache.clear()
+        self.container_types = [
+            packing.ContainerType('Small box', (0.3, 0.3, 0.3), 20),
+            packing.ContainerType('Medium box', (0.6, 0.4, 0.4), 30),
+            packing.ContainerType('Pallet', (1.2, 1.0, 1.5), 1000),
+        ]
+
+    def assertValidPlan(self, plan):
+        for container in plan.containers:
+            self.assertLessEqual(container.weight, container.container_type.max_weight)
+            boxes = [
+                [(position[axis], position[axis] + placement.size[axis]) for axis in range(3)]
+                for placement in container.placements
+                for position in [placement.position]
+            ]
+            for box in boxes:
+                for axis, (low, high) in enumerate(box):
+                    self.assertGreaterEqual(low, -packing.EPSILON)
+                    self.assertLessEqual(high, container.container_type.dimensions[axis] + packing.EPSILON)
+            # No two units overlap
+            for i, first in enumerate(boxes):
+                for second in boxes[i + 1:]:
+                    self.assertFalse(all(
+                        first[axis][0] < second[axis][1] - packing.EPSILON and
+                        second[axis][0] < first[axis][1] - packing.EPSILON
+                        for axis in range(3)
+                    ))
+
+    def test_units_are_packed_in_the_smallest_container(self):
+        cube = packing.Unit('CUBE', (0.15, 0.15, 0.15), 1)
+        plan = packing.pack([cube] * 8, self.container_types)
+
+        self.assertEquals(plan.container_counts(), [('Small box', 1)])
+        self.assertAlmostEqual(plan.fill_rate, 1)
+        self.assertValidPlan(plan)
+
+    def test_rotations_weight_and_oversized_units(self):
+        # Only fits in the medium box lying down
+        pole = packing.Unit('POLE', (0.2, 0.2, 0.55), 1)
+        heavy = packing.Unit('HEAVY', (0.1, 0.1, 0.1), 15)
+        huge = packing.Unit('HUGE', (2, 2, 2), 1)
+
+        plan = packing.pack([pole], self.container_types)
+        self.assertEquals(plan.container_counts(), [('Medium box', 1)])
+        self.assertEquals(plan.containers[0].placements[0].size[0], 0.55)
+
+        plan = packing.pack([heavy] * 3 + [huge], self.container_types)
+        self.assertEquals(plan.unpacked_counts(), [('HUGE', 1)])
+        self.assertEquals(plan.unit_count, 4)
+        self.assertValidPlan(plan)
+
+    def test_random_shipments(self):
+        rand = random.Random(0)
+        skus = [
+            packing.Unit('SKU-%s' % i, (rand.uniform(0.02, 0.5), rand.uniform(0.02, 0.4), rand.uniform(0.02, 0.3)), rand.uniform(0.1, 5))
+            for i in range(20)
+        ]
+        unit_list = [rand.choice(skus) for i in range(300)]
+
+        plan = packing.pack(unit_list, self.container_types)
+        self.assertEquals(sum(len(container.placements) for container in plan.containers), 300)
+        self.assertValidPlan(plan)
+
+        # Packing the largest units first shouldn't need more containers
+        first_fit = packing.pack(unit_list, self.container_types, decreasing=False, downsize=False)
+        self.assertLessEqual(len(plan.containers), len(first_fit.containers))
+
+    def test_plans_are_cached_by_shipment_contents(self):
+        company = Company.objects.create(name="The Test Company")
+        item = Item.objects.create(
+            sku="PACK-1", company=company, product_name="Packed item", quantity_available=100,
+            is_shippable=True, weight_value=10, weight_unit='oz',
+            dimension_x_value=0.5, dimension_y_value=0.5, dimension_z_value=0.5, dimension_unit='ft'
+        )
+        shipment = Shipment.objects.create(
+            company=company, to_address="Test address", date_promised=timezone.now(), direction='OUT'
+        )
+        line = ShipmentItem(shipment=shipment, item=item, quantity=8)
+        line.save()
+
+        with mock.patch('inventory.packing.pack', wraps=packing.pack) as pack:
+            plan = packing.plan_shipment(shipment, self.container_types)
+            with self.assertNumQueries(1):
+                packing.plan_shipment(shipment, self.container_types)
+            self.assertEquals(pack.call_count, 1)
+
+            line.quantity = 9
+            line.save()
+            packing.plan_shipment(shipment, self.container_types)
+            self.assertEquals(pack.call_count, 2)
+
+        # 0.5ft is 0.1524m, so 8 units fill a 0.3048m cube, but not the small box
+        self.assertEquals(plan.container_counts(), [('Medium box', 1)])
+
+        response = self.client.get(reverse('ship-shipment', kwargs={'company': company.pk, 'shipmentid': shipment.pk}))
+        self.assertContains(response, "9 x PACK-1")
+
+    def test_large_shipments_are_not_planned(self):
+        company = Company.objects.create(name="The Test Company")
+        item = Item.objects.create(
+            sku="PACK-1", company=company, product_name="Packed item", quantity_available=100,
+            is_shippable=True, weight_value=1, weight_unit='kg',
+            dimension_x_value=0.1, dimension_y_value=0.1, dimension_z_value=0.1, dimension_unit='m'
+        )
+        shipment = Shipment.objects.create(
+            company=company, to_address="Test address", date_promised=timezone.now(), direction='OUT'
+        )
+        ShipmentItem(shipment=shipment, item=item, quantity=11).save()
+
+        with mock.patch('inventory.packing.pack', wraps=packing.pack) as pack:
+            self.assertIsNone(packing.plan_shipment(shipment, self.container_types, max_units=10))
+            self.assertEquals(pack.call_count, 0)
+        self.assertEquals(packing.plan_shipment(shipment, self.container_types, max_units=11).unit_count, 11)
+
+        url = reverse('ship-shipment', kwargs={'company': company.pk, 'shipmentid': shipment.pk})
+        with self.settings(LOGITRACK_PACKING_MAX_UNITS=10):
+            response = self.client.get(url)
+        self.assertContains(response, "Packing plan unavailable: the shipment has more than 10 units.")
+        self.assertNotContains(response, "11 x PACK-1")
+
+    def test_full_containers_are_skipped(self):
+        cube = packing.Unit('CUBE', (0.15, 0.15, 0.15), 1)
+        # Only one fits in the medium box, though two would by volume
+        pole = packing.Unit('POLE', (0.25, 0.25, 0.55), 1)
+
+        with mock.patch.object(packing.PackedContainer, 'place', autospec=True, side_effect=packing.PackedContainer.place) as place:
+            plan = packing.pack([cube] * 16, self.container_types[:1])
+        # Each full box is closed, and each cube tried in a single box
+        self.assertEquals(plan.container_counts(), [('Small box', 2)])
+        self.assertEquals(place.call_count, 16)
+
+        # Once a box rejects a size, the units of that size skip its spaces
+        container = packing.PackedContainer(self.container_types[1])
+        self.assertTrue(container.place(pole))
+        self.assertFalse(container.place(pole))
+        container.spaces = None
+        self.assertFalse(container.place(pole))
+        self.assertValidPlan(plan)
+
+
+class SKUFormatTestCase(TestCase):
+    """
+        The following tests validate that SKUs are checked against their
+        company's SKU format, on save and in bulk imports.
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="The Test Company")
+        self.other_company = Company.objects.create(name="Another Company")
+        self.sku_format = SKUFormat.objects.create(
+            company=self.company, pattern="AAA-9999", description="3 letters, a dash and 4 digits"
+        )
+
+    def build_item(self, sku, company=None):
+        return Item(
+            sku=sku,
+            company=company or self.company,
+            product_name="Item %s" % sku,
+            weight_value=1,
+            dimension_x_value=1,
+            dimension_y_value=1,
+            dimension_z_value=1
+        )
+
+    def test_invalid_company_is_left_to_the_field(self):
+        item = self.build_item("BLU-1234")
+        item.company_id = "abc"
+        with self.assertRaises(ValidationError) as context:
+            item.full_clean()
+        self.assertIn('company', context.exception.message_dict)
+
+        response = self.client.post(reverse('api-items'), data=json.dumps({
+            'sku': 'BLU-1234',
+            'company': 'abc',
+            'product_name': 'Invalid company',
+            'weight_value': 1,
+            'dimension_x_value': 1,
+            'dimension_y_value': 1,
+            'dimension_z_value': 1,
+        }), content_type='application/json')
+        self.assertEquals(response.status_code, 400)
+        self.assertIn('company', response.json()['errors'])
+
+    def test_templates(self):
+        self.assertTrue(self.sku_format.matches("BLU-1234"))
+        self.assertFalse(self.sku_format.matches("BLU-123"))
+        self.assertFalse(self.sku_format.matches("blu-1234"))
+        self.assertFalse(self.sku_format.matches("BLU-12345"))
+
+        sku_format = SKUFormat(company=self.company, pattern="X*\\-\\9")
+        self.assertTrue(sku_format.matches("A1B-9"))
+        self.assertFalse(sku_format.matches("A1B-1"))
+
+        regex = SKUFormat(company=self.company, syntax='regex', pattern="[A-Z]{2}[0-9]+")
+        self.assertTrue(regex.matches("AB12"))
+        self.assertFalse(regex.matches("AB12-"))
+
+        with self.assertRaises(ValidationError):
+            SKUFormat(company=self.other_company, syntax='regex', pattern="[A-Z").full_clean()
+
+    def test_formats_are_compiled_once(self):
+        compile_sku_format.cache_clear()
+        for sku in ["ABC-0001", "ABC-0002", "ABC-0003"]:
+            self.sku_format.matches(sku)
+        self.assertEquals(compile_sku_format.cache_info().misses, 1)
+
+        # A changed format is compiled anew
+        self.sku_format.pattern = "AA-99"
+        self.sku_format.save()
+        self.assertTrue(SKUFormat.objects.get(company=self.company).matches("AB-12"))
+        self.assertEquals(compile_sku_format.cache_info().misses, 2)
+
+    def test_item_clean(self):
+        with self.assertRaises(ValidationError) as error:
+            self.build_item("BLU-SHRT-LG").save()
+        self.assertIn("3 letters, a dash and 4 digits", error.exception.message_dict['sku'][0])
+
+        self.build_item("BLU-1234").save()
+        # Other companies have no format
+        self.build_item("BLU-SHRT-LG", company=self.other_company).save()
+
+    def test_bulk_import(self):
+        header = "sku,company,product_name,weight_value,dimension_x_value,dimension_y_value,dimension_z_value\n"
+        rows = ''.join(
+            "%s,%s,Item,1,1,1,1\n" % (sku, company)
+            for sku, company in [
+                ("ABC-0001", "The Test Company"),
+                ("ABC-01", "The Test Company"),
+                ("anything", "Another Company"),
+            ]
+        )
+
+        # The formats of the batch are read in a single query, and the
+        # summaries of both companies are updated
+        with self.assertNumQueries(9):
+            result = ItemImporter().run(read_rows(StringIO(header + rows), 'csv'))
+        self.assertEquals(result.rows_created, 2)
+        self.assertEquals(len(result.errors), 1)
+        self.assertIn("ABC-01", result.errors[0][1])
+
+
+class ItemSearchTestCase(TestCase):
+    """
+        The following tests validate the item search by SKU prefix & product
+        name, its ranking, company scoping, and that the search index follows
+        the items as they are saved, deleted and imported.
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="The Test Company")
+        self.other_company = Company.objects.create(name="Another Company")
+        self.shirt = create_item(self.company, "BLU-SHRT-LG", product_name="Blue Shirt Large")
+        self.shirt_small = create_item(self.company, "BLU-SHRT-SM", product_name="Blue Shirt Small")
+        self.jacket = create_item(self.company, "BLK-JKT", product_name="Black Leather Jacket")
+        self.speaker = create_item(self.other_company, "SPK-1", product_name="Bluetooth Speaker")
+
+    def search(self, query, **kwargs):
+        return [(item.sku, item.search_match) for item in search.search_items(query, **kwargs)]
+
+    def test_sku_prefix(self):
+        """ SKU prefixes match in any case, in SKU order, exact SKU first """
+        self.assertEquals(self.search("blu-shrt"), [("BLU-SHRT-LG", 'sku'), ("BLU-SHRT-SM", 'sku')])
+        self.assertEquals(self.search("BLU-SHRT-SM")[0], ("BLU-SHRT-SM", 'sku'))
+        self.assertEquals(self.search("SHRT"), [])
+
+    def test_product_name(self):
+        """ Names containing the words of the query come first, then similar names """
+        self.assertEquals(self.search("shirt blue"), [("BLU-SHRT-LG", 'name'), ("BLU-SHRT-SM", 'name')])
+        self.assertEquals(self.search("leathr jacket"), [("BLK-JKT", 'fuzzy')])
+        self.assertEquals(self.search("blue"), [
+            ("BLU-SHRT-LG", 'name'), ("BLU-SHRT-SM", 'name'), ("SPK-1", 'name')
+        ])
+
+        # Product names are only matched on whole trigrams
+        self.assertEquals(self.search("ir"), [])
+        self.assertEquals(self.search("  "), [])
+
+    def test_ranking_and_limit(self):
+        create_item(self.company, "BLUE-1", product_name="Navy Scarf")
+        results = self.search("blue", limit=3)
+        self.assertEquals(results[0], ("BLUE-1", 'sku'))
+        self.assertEquals(len(results), 3)
+
+    def test_company_scoping(self):
+        self.assertEquals(self.search("blue", company=self.other_company), [("SPK-1", 'name')])
+        self.assertEquals(self.search("BLU-SHRT", company=self.other_company.pk), [])
+        self.assertEquals(self.search("speaker", company=self.company), [])
+
+    def test_index_follows_items(self):
+        """ Saving, deleting & importing items updates the search index """
+        self.jacket.product_name = "Black Wool Coat"
+        self.jacket.save()
+        self.assertEquals(self.search("leather"), [])
+        self.assertEquals(self.search("wool coat"), [("BLK-JKT", 'name')])
+
+        self.speaker.company = self.company
+        self.speaker.save()
+        self.assertEquals(self.search("speaker", company=self.company), [("SPK-1", 'name')])
+
+        self.shirt_small.delete()
+        self.assertEquals(self.search("shirt"), [("BLU-SHRT-LG", 'name')])
+
+        header = "sku,company,product_name,weight_value,dimension_x_value,dimension_y_value,dimension_z_value\n"
+        ItemImporter().run(read_rows(StringIO(header + "RED-PNT,The Test Company,Red Pants,1,1,1,1\n"), 'csv'))
+        self.assertEquals(self.search("pants"), [("RED-PNT", 'name')])
+
+        if search.get_backend() == 'fts5':
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM %s" % search.SEARCH_TABLE)
+            self.assertEquals(self.search("pants"), [])
+            call_command('rebuild_search_index', stdout=StringIO())
+            self.assertEquals(self.search("pants"), [("RED-PNT", 'name')])
+
+    def test_query_count(self):
+        """ A search runs a fixed number of queries, whatever the number of results """
+        for i in range(20):
+            create_item(self.company, "TEE-%s" % i, product_name="Cotton Tee %s" % i)
+        with self.assertNumQueries(3):
+            self.assertEquals(len(search.search_items("cotton tee")), 20)
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search-items'), {'q': 'shirt', 'company': self.company.pk})
+        self.assertEquals(response.status_code, 200)
+        self.assertContains(response, "BLU-SHRT-LG")
+        self.assertNotContains(response, "SPK-1")
+
+        response = self.client.get(reverse('search-items'), {'q': 'nothing like it'})
+        self.assertContains(response, "No items match")
+
+    def test_search_api(self):
+        response = self.client.get(reverse('api-item-search'), {'q': 'blu-shrt-l', 'fields': 'id,sku'})
+        self.assertEquals(response.json(), {'results': [{'id': self.shirt.pk, 'sku': "BLU-SHRT-LG", 'match': 'sku'}]})
+
+        response = self.client.get(reverse('api-item-search'), {'q': 'blue', 'company': 'abc'})
+        self.assertEquals(response.status_code, 400)
+
+        # Digits that int() doesn't take (superscripts) are rejected too
+        response = self.client.get(reverse('api-item-search'), {'q': 'blue', 'company': '²'})
+        self.assertEquals(response.json(), {'errors': {'company': ["Expected a company id"]}})
+        response = self.client.get(reverse('api-item-search'), {'q': 'blue', 'limit': '²'})
+        self.assertEquals(response.json(), {'errors': {'limit': ["Expected a number"]}})
+
+
+class ItemUniqueSKUMigrationTestCase(TransactionTestCase):
+    """
+        The following test runs the migration replacing the global uniqueness
+        of Item.sku with the (company, sku) constraint against a table of
+        several million items, to make sure it completes in a reasonable time
+        and keeps every row. The number of rows can be lowered with the
+        LOGITRACK_MIGRATION_TEST_ROWS environment variable.
+    """
+    migrate_from = [('inventory', '0025_item_search')]
+    migrate_to = [('inventory', '0026_item_unique_company_sku')]
+    row_count = int(os.environ.get('LOGITRACK_MIGRATION_TEST_ROWS', 2000000))
+    company_count = 100
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.old_apps = executor.loader.project_state(self.migrate_from).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def insert_items(self):
+        """ Inserts row_count items, spread over the companies, with a single INSERT ... SELECT """
+        Company = self.old_apps.get_model('inventory', 'Company')
+        companies = Company.objects.bulk_create([
+            Company(name="Migration company %s" % i) for i in range(self.company_count)
+        ])
+        first_company = min(company.pk for company in companies)
+
+        if connection.vendor == 'postgresql':
+            numbers = "SELECT n FROM generate_series(0, %s - 1) AS n"
+        else:
+            numbers = "WITH RECURSIVE numbers(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM numbers WHERE n + 1 < %s) SELECT n FROM numbers"
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO inventory_item (sku, company_id, product_name, quantity_available, "
+                "quantity_inbound_total, quantity_allocated_total, date_created, date_last_modified, "
+                "is_shippable, weight_value, weight_unit, dimension_x_value, dimension_y_value, "
+                "dimension_z_value, dimension_unit) "
+                "SELECT 'SKU-' || n, %s + n %% %s, 'Item', 0, 0, 0, %s, %s, %s, 1, 'kg', 1, 1, 1, 'm' "
+                "FROM (" + numbers + ") AS numbers",
+                [first_company, self.company_count, timezone.now(), timezone.now(), True, self.row_count]
+            )
+        return companies
+
+    def test_migration(self):
+        companies = self.insert_items()
+
+        start = time.perf_counter()
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        duration = time.perf_counter() - start
+
+        Item = executor.loader.project_state(self.migrate_to).apps.get_model('inventory', 'Item')
+        self.assertEquals(Item.objects.count(), self.row_count)
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'inventory_item')
+        unique_company_sku = constraints['item_unique_company_sku']
+        self.assertTrue(unique_company_sku['unique'])
+        self.assertEquals(unique_company_sku['columns'], ['company_id', 'sku'])
+        self.assertNotIn('item_company_sku', constraints)
+        self.assertFalse(any(
+            constraint['unique'] and constraint['columns'] == ['sku'] for constraint in constraints.values()
+        ))
+
+        # SKU-0 belongs to the first company. Another company can now use it,
+        # but not the first one. The companies come from the state before the
+        # migration, hence company_id.
+        Item.objects.create(
+            sku='SKU-0', company_id=companies[1].pk, product_name='Item', weight_value=1,
+            dimension_x_value=1, dimension_y_value=1, dimension_z_value=1
+        )
+        with self.assertRaises(IntegrityError):
+            Item.objects.create(
+                sku='SKU-0', company_id=companies[0].pk, product_name='Item', weight_value=1,
+                dimension_x_value=1, dimension_y_value=1, dimension_z_value=1
+            )
+
+        # Copying the table & building two indexes takes seconds, not minutes
+        self.assertLess(duration, 120)
+
+
+class ShipmentEditItemViewTestCase(QueryBudgetMixin, TestCase):
+    """
+        The following tests make sure that the page editing a shipment's
+        lines runs the same number of queries whatever the number of lines,
+        and that its forms still only accept the items of the shipment's
+        company and the lines of the shipment.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name="The Test Company")
+        cls.other_company = Company.objects.create(name="Another Company")
+        cls.items = Item.objects.bulk_create([
+            Item(
+                sku="EDIT-%s" % i, company=cls.company, product_name="Edited item %s" % i,
+                quantity_available=100, is_shippable=True, weight_value=1,
+                dimension_x_value=1, dimension_y_value=1, dimension_z_value=1
+            )
+            for i in range(300)
+        ])
+        cls.other_item = Item.objects.create(
+            sku="EDIT-0", company=cls.other_company, product_name="Other item",
+            quantity_available=100, is_shippable=True, weight_value=1,
+            dimension_x_value=1, dimension_y_value=1, dimension_z_value=1
+        )
+
+        cls.small_shipment = Shipment.objects.create(
+            company=cls.company, to_address="Test address 1234", date_promised=timezone.now(), direction='OUT'
+        )
+        cls.large_shipment = Shipment.objects.create(
+            company=cls.company, to_address="Test address 1234", date_promised=timezone.now(), direction='OUT'
+        )
+        ShipmentItem.objects.create(shipment=cls.small_shipment, item=cls.items[0], quantity=1)
+        for item in cls.items:
+            ShipmentItem.objects.create(shipment=cls.large_shipment, item=item, quantity=1)
+
+    def edit_url(self, shipment):
+        return reverse('edit-shipment', kwargs={'company': shipment.company_id, 'shipmentid': shipment.pk})
+
+    def post_data(self, shipment, **changes):
+        """ The data posted by the page, for the existing lines of the shipment and one new line """
+        lines = list(ShipmentItem.objects.filter(shipment=shipment).order_by('pk'))
+        data = {
+            'shipmentitem_set-TOTAL_FORMS': len(lines) + 1,
+            'shipmentitem_set-INITIAL_FORMS': len(lines),
+            'shipmentitem_set-MIN_NUM_FORMS': 0,
+            'shipmentitem_set-MAX_NUM_FORMS': 1000,
+        }
+        for i, line in enumerate(lines):
+            data['shipmentitem_set-%s-id' % i] = line.pk
+            data['shipmentitem_set-%s-item' % i] = line.item_id
+            data['shipmentitem_set-%s-quantity' % i] = line.quantity
+        data.update(changes)
+        return data
+
+    def test_edit_page_query_budget(self):
+        # The shipment, the inventory table, the lines & the selectable items
+        small = self.assertQueryBudget(self.edit_url(self.small_shipment), 4, max_duplicates=0)
+        large = self.assertQueryBudget(self.edit_url(self.large_shipment), 4, max_duplicates=0)
+
+        # Each existing line, and three empty forms
+        self.assertEquals(len(small.context['form'].forms), 4)
+        self.assertEquals(len(large.context['form'].forms), 303)
+        self.assertContains(large, '<option value="%s" selected>' % self.items[-1].pk)
+        self.assertNotContains(large, 'Other item')
+
+    def test_edit_line_quantity(self):
+        data = self.post_data(self.small_shipment, **{'shipmentitem_set-0-quantity': 5})
+        response = self.client.post(self.edit_url(self.small_shipment), data)
+
+        self.assertEquals(response.status_code, 302)
+        self.assertEquals(ShipmentItem.objects.get(shipment=self.small_shipment).quantity, 5)
+        # The item is also on a line of the large shipment
+        self.assertEquals(Item.objects.get(pk=self.items[0].pk).quantity_available, 94)
+
+    def test_item_of_another_company_is_rejected(self):
+        data = self.post_data(self.small_shipment, **{
+            'shipmentitem_set-1-item': self.other_item.pk,
+            'shipmentitem_set-1-quantity': 1,
+        })
+        response = self.client.post(self.edit_url(self.small_shipment), data)
+
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('item', response.context['form'].forms[1].errors)
+        self.assertEquals(ShipmentItem.objects.filter(shipment=self.small_shipment).count(), 1)
+
+    def test_line_of_another_shipment_is_rejected(self):
+        other_line = ShipmentItem.objects.filter(shipment=self.large_shipment).order_by('pk').last()
+        data = self.post_data(self.small_shipment, **{'shipmentitem_set-0-id': other_line.pk})
+        response = self.client.post(self.edit_url(self.small_shipment), data)
+
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('id', response.context['form'].forms[0].errors)
+
+
+class ShipmentItemBulkAddTestCase(TestCase):
+    """
+        The following tests validate ShipmentItemQuerySet.bulk_add: lines
+        added as a batch must be validated with the same rules as
+        ShipmentItem.full_clean, and adjust the inventory, the company's
+        summary and the ledger as saving each line would.
+    """
+    def setUp(self):
+        self.company = Company.objects.create(name="The Test Company")
+        self.other_company = Company.objects.create(name="Another Company")
+        self.items = [
+            Item.objects.create(
+                sku="BULK-%s" % i, company=self.company, product_name="Bulk item %s" % i,
+                quantity_available=10, is_shippable=True, weight_value=1,
+                dimension_x_value=1, dimension_y_value=1, dimension_z_value=1
+            )
+            for i in range(20)
+        ]
+        self.unshippable = Item.objects.create(
+            sku="BULK-NOSHIP", company=self.company, product_name="Unshippable item",
+            quantity_available=10, is_shippable=False, weight_value=1,
+            dimension_x_value=1, dimension_y_value=1, dimension_z_value=1
+        )
+        self.other_item = Item.objects.create(
+            sku="BULK-0", company=self.other_company, product_name="Other company's item",
+            quantity_available=10, is_shippable=True, weight_value=1,
+            dimension_x_value=1, dimension_y_value=1, dimension_z_value=1
+        )
+        self.outbound = create_shipment(self.company, 'OUT')
+        self.inbound = create_shipment(self.company, 'IN')
+
+    def assertTotalsMatchLines(self):
+        for item in Item.objects.with_shipment_quantities():
+            self.assertEquals(item.quantity_inbound_total, item.open_quantity_inbound)
+            self.assertEquals(item.quantity_allocated_total, item.open_quantity_allocated)
+        self.assertEquals(CompanyInventorySummary.objects.rebuild(save=False), 0)
+
+    def test_bulk_add_lines(self):
+        lines = [(item.pk, 3) for item in self.items] + [(self.items[0].pk, 2)]
+
+        # The items, the lines, the items' quantities, the summary & the
+        # ledger, within a savepoint, whatever the number of lines
+        with self.assertNumQueries(7):
+            created, errors = ShipmentItem.objects.bulk_add(self.outbound, lines)
+
+        self.assertEquals(errors, {})
+        self.assertEquals(len(created), 21)
+        self.assertTrue(all(line.pk for line in created))
+        self.assertEquals(created[0].item.quantity_available, 5)
+
+        item = Item.objects.get(pk=self.items[0].pk)
+        self.assertEquals(item.quantity_available, 5)
+        self.assertEquals(item.quantity_allocated(), 5)
+        self.assertEquals(Item.objects.get(pk=self.items[1].pk).quantity_available, 7)
+        self.assertEquals(InventoryMovement.objects.filter(shipment=self.outbound).count(), 21)
+        self.assertEquals(item.quantities_at(timezone.now())['quantity_available'], 5)
+        self.assertTotalsMatchLines()
+
+        # The added lines can be edited as any other line
+        line = ShipmentItem.objects.get(pk=created[0].pk)
+        line.quantity = 1
+        line.save()
+        self.assertEquals(Item.objects.get(pk=self.items[0].pk).quantity_available, 7)
+        self.assertTotalsMatchLines()
+
+    def test_bulk_add_to_shipped_shipment(self):
+        received = create_shipment(self.company, 'IN', is_shipped=True)
+        created, errors = ShipmentItem.objects.bulk_add(received, [(self.items[0].pk, 4)])
+
+        self.assertEquals(errors, {})
+        self.assertFalse(created[0].is_open)
+        item = Item.objects.get(pk=self.items[0].pk)
+        self.assertEquals(item.quantity_available, 14)
+        self.assertEquals(item.quantity_inbound(), 0)
+        self.assertTotalsMatchLines()
+
+    def test_bulk_add_validates_lines_as_full_clean(self):
+        """ Each invalid line should have the errors full_clean would report """
+        lines = [
+            (self.items[0].pk, 5),
+            (self.other_item.pk, 1),
+            (self.unshippable.pk, 1),
+            (self.items[1].pk, 11),
+            (999999, 1),
+            (self.items[2].pk, None),
+        ]
+        created, errors = ShipmentItem.objects.bulk_add(self.outbound, lines)
+
+        self.assertEquals(created, [])
+        self.assertEquals(sorted(errors), [1, 2, 3, 4, 5])
+        self.assertEquals(errors[5].message_dict, {'quantity': ['This field cannot be null.']})
+        for index, (item_id, quantity) in enumerate(lines[1:5], 1):
+            with self.assertRaises(ValidationError) as context:
+                ShipmentItem(shipment=self.outbound, item_id=item_id, quantity=quantity).full_clean()
+            self.assertEquals(errors[index].message_dict, context.exception.message_dict)
+
+        self.assertFalse(ShipmentItem.objects.exists())
+        self.assertEquals(Item.objects.get(pk=self.items[0].pk).quantity_available, 10)
+
+    def test_bulk_add_checks_inventory_left_by_previous_lines(self):
+        lines = [(self.items[0].pk, 6), (self.items[0].pk, 6), (self.items[0].pk, 4)]
+        created, errors = ShipmentItem.objects.bulk_add(self.outbound, lines)
+
+        self.assertEquals(sorted(errors), [1])
+        self.assertEquals(errors[1].messages, [
+            "An outbound shipment cannot ship more inventory than is available. Inventory Qty: 4 - Entered Qty: 6"
+        ])
+
+        # Inbound lines have no quantity restrictions
+        created, errors = ShipmentItem.objects.bulk_add(self.inbound, [(self.unshippable.pk, 50)])
+        self.assertEquals(errors, {})
+        self.assertEquals(Item.objects.get(pk=self.unshippable.pk).quantity_available, 60)
+
+
+def shipment_lines_page(request, shipmentid):
+    """ Lists a shipment's lines, loading each line's shipment & item through its foreign keys """
+    lines = ShipmentItem.objects.filter(shipment=shipmentid).order_by('pk')
+    return HttpResponse('\n'.join('%s: %s' % (line.shipment.company, line.item) for line in lines))
+
+
+# The pages only used by the tests (see IdentityMapTestCase), as Logitrack's
+# own pages don't load the same rows through foreign keys repeatedly
+urlpatterns = [
+    path('shipments/<int:shipmentid>/lines/', shipment_lines_page, name='test-shipment-lines'),
+]
+
+
+class IdentityMapTestCase(TestCase):
+    """
+        The following tests validate the request-scoped identity map (see
+        logitrack/identity.py): foreign keys to the same row should load it
+        once per request, and the map's hits & misses should be reported.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_warehouse', companies=2, items=10, shipments=4, lines=5, stdout=StringIO())
+        cls.shipment = Shipment.objects.filter(shipmentitem__isnull=False).order_by('pk').first()
+
+    def test_foreign_keys_share_instances(self):
+        lines = list(ShipmentItem.objects.filter(shipment=self.shipment).order_by('pk'))
+        item_count = len({line.item_id for line in lines})
+
+        with self.assertNumQueries(len(lines)):
+            for line in lines:
+                line.shipment
+
+        lines = list(ShipmentItem.objects.filter(shipment=self.shipment).order_by('pk'))
+        with identity_map() as request_map:
+            # The shipment, each item, and their company
+            with self.assertNumQueries(1 + item_count + 1):
+                for line in lines:
+                    self.assertEquals(line.shipment.company.name, line.item.company.name)
+
+            self.assertIs(lines[0].shipment, lines[-1].shipment)
+            self.assertIs(lines[0].shipment.company, lines[0].item.company)
+
+        stats = request_map.stats()
+        self.assertEquals(stats['models']['inventory.Shipment'], {'hits': len(lines) - 1, 'misses': 1})
+        self.assertEquals(stats['models']['inventory.Item'], {'hits': len(lines) - item_count, 'misses': item_count})
+        self.assertEquals(stats['models']['inventory.Company'], {'hits': item_count, 'misses': 1})
+        self.assertEquals(stats['hits'] + stats['misses'], 2 * len(lines) + 1 + item_count)
+        self.assertIsNone(current_identity_map())
+
+    def test_saved_instances_are_evicted(self):
+        lines = list(ShipmentItem.objects.filter(shipment=self.shipment).order_by('pk'))
+        with identity_map():
+            item = lines[0].item
+            updated = Item.objects.get(pk=item.pk)
+            updated.product_name = "Renamed item"
+            updated.save()
+
+            # Another line of the same item loads the saved row
+            line = ShipmentItem.objects.get(pk=lines[0].pk)
+            with self.assertNumQueries(1):
+                self.assertEquals(line.item.product_name, "Renamed item")
+
+    @override_settings(
+        LOGITRACK_IDENTITY_MAP=True, LOGITRACK_SERVER_TIMING=True, LOGITRACK_QUERY_LOG=True,
+        ROOT_URLCONF='inventory.tests'
+    )
+    def test_middleware_reports_hits_and_misses(self):
+        url = reverse('test-shipment-lines', kwargs={'shipmentid': self.shipment.pk})
+
+        with override_settings(LOGITRACK_IDENTITY_MAP=False):
+            with record_queries() as without_map:
+                self.client.get(url)
+
+        # The page lists the shipment's lines, with the company of the
+        # shipment and of each line's item
+        with self.assertLogs('logitrack.queries', level='INFO') as logs:
+            with record_queries() as with_map:
+                response = self.client.get(url)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertGreater(record['identity_map']['hits'], 0)
+        self.assertLess(with_map.count, without_map.count)
+        self.assertIn(
+            'idmap;desc="%s hits, %s misses"' % (record['identity_map']['hits'], record['identity_map']['misses']),
+            response['Server-Timing']
+        )
+        self.assertIsNone(current_identity_map())
+
+
+class PageCacheTestCase(TestCase):
+    """
+        The following tests validate the page cache of the item, company &
+        shipment lists and the item pages, and its invalidation.
+    """
+    def setUp(self):
+        caching.get_page_cache().clear()
+        self.companies = [Company.objects.create(name="Company %s" % i) for i in range(2)]
+        self.items = [
+            Item.objects.create(
+                sku="CACHE-%s" % i, company=company, product_name="Cached item %s" % i, quantity_available=10, is_shippable=True,
+                weight_value=1, dimension_x_value=1, dimension_y_value=1, dimension_z_value=1,
+            )
+            for i, company in enumerate(self.companies)
+        ]
+        self.shipment = Shipment.objects.create(
+            company=self.companies[0], to_address="Address", date_promised=timezone.now(), direction='OUT'
+        )
+
+    def shipment_list(self, company):
+        return reverse('view-all-shipments', kwargs={'company': company.pk})
+
+    def assertCached(self, url, cached=True):
+        """ Requests url, and fails unless it is served from the cache, or rendered """
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+        outcome = getattr(response.wsgi_request, 'page_cache', None)
+        if cached:
+            self.assertEquals(outcome, 'hit', "%s wasn't served from the cache" % url)
+        else:
+            self.assertNotEqual(outcome, 'hit', "%s was served from the cache" % url)
+        return response
+
+    def test_pages_are_cached(self):
+        urls = [
+            reverse('view_all_items'),
+            reverse('view_all_items') + '?sort=-sku',
+            reverse('view-item', args=[self.items[0].pk]),
+            reverse('view-all-companies'),
+            self.shipment_list(self.companies[0]),
+        ]
+        for url in urls:
+            rendered = self.assertCached(url, cached=False)
+            cached = self.assertCached(url)
+            self.assertEquals(cached.content, rendered.content)
+            self.assertEquals(cached['Content-Type'], rendered['Content-Type'])
+
+        stats = caching.page_cache_stats()
+        self.assertEquals(stats['item-list'], {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+        self.assertEquals(stats['shipment-list']['hits'], 1)
+
+    def test_changes_invalidate_company_pages(self):
+        item_list = reverse('view_all_items')
+        for url in [item_list, self.shipment_list(self.companies[0]), self.shipment_list(self.companies[1])]:
+            self.assertCached(url, cached=False)
+
+        self.items[1].product_name = "Renamed item"
+        self.items[1].save()
+        self.assertContains(self.assertCached(item_list, cached=False), "Renamed item")
+        self.assertCached(self.shipment_list(self.companies[0]))
+        self.assertCached(self.shipment_list(self.companies[1]), cached=False)
+
+        ShipmentItem(shipment=self.shipment, item=self.items[0], quantity=2).save()
+        self.assertCached(self.shipment_list(self.companies[0]), cached=False)
+        self.assertCached(self.shipment_list(self.companies[1]))
+
+        # Shipping updates the shipments & lines without signals
+        ship_shipments([self.shipment.pk])
+        self.assertCached(self.shipment_list(self.companies[0]), cached=False)
+        self.assertCached(self.shipment_list(self.companies[1]))
+
+    def test_item_page_follows_its_company(self):
+        url = reverse('view-item', args=[self.items[0].pk])
+        self.assertCached(url, cached=False)
+        self.assertCached(url)
+
+        self.items[0].company = self.companies[1]
+        self.items[0].save()
+        self.assertCached(url, cached=False)
+        self.assertCached(url)
+
+        # Pages of items whose company isn't known yet are rendered, until it is
+        caching.get_page_cache().clear()
+        self.assertCached(url, cached=False)
+        self.assertCached(url, cached=False)
+        self.assertCached(url)
+
+    def test_bulk_add_invalidates_company_pages(self):
+        url = self.shipment_list(self.companies[0])
+        self.assertCached(url, cached=False)
+        lines, errors = ShipmentItem.objects.bulk_add(self.shipment, [(self.items[0].pk, 1)])
+        self.assertEquals(errors, {})
+        self.assertCached(url, cached=False)
+
+    @override_settings(LOGITRACK_SERVER_TIMING=True)
+    def test_hits_are_reported(self):
+        url = reverse('view-all-companies')
+        self.assertIn('cache;desc="miss"', self.client.get(url)['Server-Timing'])
+        self.assertIn('cache;desc="hit"', self.client.get(url)['Server-Timing'])
+
+        stdout = StringIO()
+        call_command('page_cache_stats', reset=True, stdout=stdout)
+        self.assertRegex(stdout.getvalue(), r'company-list\s+1\s+1\s+50.0%')
+        self.assertEquals(caching.page_cache_stats()['company-list']['hit_rate'], None)
+
+    @override_settings(LOGITRACK_PAGE_CACHE=None)
+    def test_page_cache_disabled(self):
+        url = reverse('view-all-companies')
+        self.assertCached(url, cached=False)
+        self.assertCached(url, cached=False)
+        with self.assertRaises(CommandError):
+            call_command('page_cache_stats', stdout=StringIO())
+
+
+@override_settings(LOGITRACK_PAGE_CACHE=None)
+class ConditionalListTestCase(TestCase):
+    """
+        The following tests validate the conditional GETs (ETag &
+        Last-Modified) and the cached rows of the item & shipment lists.
+    """
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name="Conditional company")
+        self.items = [
+            Item.objects.create(
+                sku="COND-%s" % i, company=self.company, product_name="Conditional item %s" % i, quantity_available=10,
+                is_shippable=True, weight_value=1, dimension_x_value=1, dimension_y_value=1, dimension_z_value=1,
+            )
+            for i in range(3)
+        ]
+        self.shipment = Shipment.objects.create(
+            company=self.company, to_address="Address", date_promised=timezone.now(), direction='OUT'
+        )
+        self.item_list = reverse('view_all_items')
+        self.shipment_list = reverse('view-all-shipments', kwargs={'company': self.company.pk})
+
+    def assertNotModified(self, url, response):
+        """ Fails unless a request revalidating response gets a 304, without rendering the page """
+        with self.assertNumQueries(1):
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(revalidated.status_code, 304)
+        self.assertEquals(revalidated['ETag'], response['ETag'])
+        self.assertEquals(revalidated.content, b'')
+
+    def assertModified(self, url, response):
+        """ Fails unless a request revalidating response gets the page again, and returns it """
+        revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(revalidated.status_code, 200)
+        self.assertNotEqual(revalidated['ETag'], response['ETag'])
+        return revalidated
+
+    def test_item_list(self):
+        response = self.client.get(self.item_list)
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertNotModified(self.item_list, response)
+
+        # Pages are revalidated by date too
+        since = self.client.get(self.item_list, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEquals(since.status_code, 304)
+
+        self.items[0].product_name = "Renamed item"
+        self.items[0].save()
+        response = self.assertModified(self.item_list, response)
+        self.assertContains(response, "Renamed item")
+        self.assertNotModified(self.item_list, response)
+
+        self.items[2].delete()
+        response = self.assertModified(self.item_list, response)
+
+        self.company.name = "Renamed company"
+        self.company.save()
+        self.assertContains(self.assertModified(self.item_list, response), "Renamed company")
+
+    def test_shipment_list(self):
+        response = self.client.get(self.shipment_list)
+        self.assertNotModified(self.shipment_list, response)
+
+        # Adding a line changes the shipment's totals
+        ShipmentItem(shipment=self.shipment, item=self.items[0], quantity=2).save()
+        response = self.assertModified(self.shipment_list, response)
+        self.assertNotModified(self.shipment_list, response)
+
+        ship_shipments([self.shipment.pk])
+        response = self.assertModified(self.shipment_list, response)
+        self.assertContains(response, "Shipped")
+
+        Shipment.objects.create(company=self.company, to_address="Address", date_promised=timezone.now(), direction='IN')
+        self.assertModified(self.shipment_list, response)
+
+        self.assertEquals(self.client.get(reverse('view-all-shipments', kwargs={'company': 0})).status_code, 404)
+
+    def test_rows_are_cached(self):
+        self.client.get(self.item_list)
+        self.client.get(self.shipment_list)
+
+        # Rows are keyed on their version, so a change that doesn't bump it
+        # isn't shown
+        Item.objects.filter(pk=self.items[0].pk).update(product_name="Hidden change")
+        self.assertNotContains(self.client.get(self.item_list), "Hidden change")
+
+        self.items[0].refresh_from_db()
+        self.items[0].product_name = "Shown change"
+        self.items[0].save()
+        self.assertContains(self.client.get(self.item_list), "Shown change")
+
+        self.assertContains(self.client.get(self.shipment_list), "0.00 kg")
+        ShipmentItem(shipment=self.shipment, item=self.items[1], quantity=2).save()
+        self.assertContains(self.client.get(self.shipment_list), "2.00 kg")
@@ -0,0 +1,104 @@
+"""
+    The following module normalizes the weights & dimensions of items, which
+    are stored in the unit chosen for each item (see Item.WeightUnit and
+    Item.DimensionUnit), to kilograms and cubic meters.
+
+    The conversions are available in two forms, for whole querysets at once:
+        - as database expressions (weight_kg & volume_m3), to annotate
+          querysets or sum over shipment lines without loading the items
+          (see ItemQuerySet.with_measures and ShipmentQuerySet.with_totals),
+        - as NumPy batch computations over the rows of a values_list
+          (weights_kg & volumes_m3), for computations done in Python.
+"""
+import numpy as np
+from django.db.models import Case, F, FloatField, Value, When
+
+
+# Kilograms per weight unit
+KILOGRAMS = {
+    'kg': 1.0,
+    'lb': 0.45359237,
+    'oz': 0.028349523125,
+}
+
+# Meters per dimension unit
+METERS = {
+    'm': 1.0,
+    'ft': 0.3048,
+}
+
+# The Item fields read by weights_kg & volumes_m3, in order
+WEIGHT_FIELDS = ('weight_value', 'weight_unit')
+VOLUME_FIELDS = ('dimension_x_value', 'dimension_y_value', 'dimension_z_value', 'dimension_unit')
+
+
+def unit_factor(field_name, factors, power=1):
+    """
+    Returns an expression of the conversion factor (raised to power) of the
+    unit stored in field_name. Unknown units have no factor (NULL).
+    """
+    return Case(
+        *[When(**{field_name: unit}, then=Value(factor ** power)) for unit, factor in factors.items()],
+        default=Value(None),
+        output_field=FloatField()
+    )
+
+
+def weight_kg(prefix=''):
+    """
+    Returns an expression of an item's weight in kilograms. The prefix
+    reaches the item through a relation, e.g. weight_kg('item__') on
+    ShipmentItem.
+    """
+    return F(prefix + 'weight_value') * unit_factor(prefix + 'weight_unit', KILOGRAMS)
+
+
+def volume_m3(prefix=''):
+    """ Returns an expression of an item's volume in cubic meters (see weight_kg) """
+    return (
+        F(prefix + 'dimension_x_value') *
+        F(prefix + 'dimension_y_value') *
+        F(prefix + 'dimension_z_value') *
+        unit_factor(prefix + 'dimension_unit', METERS, 3)
+    )
+
+
+def unit_factors(units, factors, power=1):
+    """
+    Returns the conversion factor (raised to power) of each unit in units,
+    as an array. Unknown units have a factor of NaN.
+    """
+    units = np.asarray(units, dtype=object)
+    result = np.full(len(units), np.nan)
+    for unit, factor in factors.items():
+        result[units == unit] = factor ** power
+    return result
+
+
+def weights_kg(rows):
+    """
+    Returns the weights in kilograms of the items of rows, a sequence of
+    (weight_value, weight_unit) tuples such as
+    Item.objects.values_list(*WEIGHT_FIELDS), as an array.
+    """
+    rows = list(rows)
+    if not rows:
+        return np.zeros(0)
+
+    values, units = zip(*rows)
+    return np.array(values, dtype=np.float64) * unit_factors(units, KILOGRAMS)
+
+
+def volumes_m3(rows):
+    """
+    Returns the volumes in cubic meters of the items of rows, a sequence of
+    (x, y, z, dimension_unit) tuples such as
+    Item.objects.values_list(*VOLUME_FIELDS), as an array.
+    """
+    rows = list(rows)
+    if not rows:
+        return np.zeros(0)
+
+    x, y, z, units = zip(*rows)
+    dimensions = np.array([x, y, z], dtype=np.float64)
+    return dimensions.prod(axis=0) * unit_factors(units, METERS, 3)
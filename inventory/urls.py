@@ -1,22 +1,39 @@
 from django.urls import path, include, reverse
-from . import views
+from . import views, api
 from .models import Item
 
 urlpatterns = [
     path('', views.landing_page, name="landing_page"),
     path('view-all-items/', views.view_all_items, name="view_all_items"),
+    path('search/', views.item_search, name="search-items"),
     path('create-item/', views.ItemCreateView.as_view(model=Item, success_url='/view-all-items/'), name='create_item'),
+    path('import-items/', views.ItemImportView.as_view(), name='import-items'),
     path('item/<int:id>', views.ItemDetailView.as_view(), name="view-item"),
     path('item/<int:id>/edit/', views.ItemUpdateView.as_view(), name="edit-item"),
     path('item/<int:id>/delete/', views.ItemDeleteView.as_view(model=Item, success_url='/view-all-items/'), name="delete-item"),
 
+    path('export/<str:dataset>.<str:file_format>', views.export_data, name='export-data'),
+
     path('view-all-companies/', views.CompanyListView.as_view(), name="view-all-companies"),
     path('create-company/', views.CompanyCreateView.as_view(), name='create-company'),
     path('company/<int:company>', views.CompanyDetailView.as_view(), name='view-company'),
 
     path('company/<int:company>/shipments/', views.ShipmentListView.as_view(), name="view-all-shipments"),
     path('company/<int:company>/shipments/create/', views.ShipmentCreateView.as_view(), name="create-shipment"),
+    path('company/<int:company>/shipments/ship-batch/', views.ShipmentBatchShipView.as_view(), name="ship-shipment-batch"),
     path('company/<int:company>/shipments/<int:shipmentid>/items/', views.ShipmentEditItemView.as_view(), name="edit-shipment"),
     path('company/<int:company>/shipments/<int:shipmentid>/ship/', views.ShipmentShipView.as_view(), name="ship-shipment"),
     path('company/<int:company>/shipments/<int:shipmentid>/receive/', views.ShipmentReceiveView.as_view(), name="receive-shipment"),
+
+    # JSON API, see inventory/api.py
+    path('api/companies/', api.companies, name='api-companies'),
+    path('api/companies/<int:pk>/', api.company_detail, name='api-company'),
+    path('api/items/', api.items, name='api-items'),
+    path('api/items/search/', api.item_search, name='api-item-search'),
+    path('api/items/<int:pk>/', api.item_detail, name='api-item'),
+    path('api/shipments/', api.shipments, name='api-shipments'),
+    path('api/shipments/ship/', api.ship_shipments, name='api-ship-shipments'),
+    path('api/shipments/<int:pk>/', api.shipment_detail, name='api-shipment'),
+    path('api/shipments/<int:pk>/lines/', api.shipment_lines, name='api-shipment-lines'),
+    path('api/shipment-lines/<int:pk>/', api.shipment_line_detail, name='api-shipment-line'),
 ]
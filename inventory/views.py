@@ -1,11 +1,20 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponseRedirect, HttpResponseForbidden
+from django.http import HttpResponseRedirect, HttpResponseForbidden, HttpResponseBadRequest, StreamingHttpResponse, Http404
 from .models import Company, Item, Shipment, ShipmentItem
 from django.views.generic import DetailView, ListView, CreateView, UpdateView, DeleteView, FormView
 from django.views.generic.detail import SingleObjectMixin
 from django.contrib import messages
+from django.utils.decorators import method_decorator
 from django.urls import reverse
-from .forms import ItemCreateForm, ShipmentCreateForm, ShipmentShipForm, ShipmentItemFormset, CompanyCreateForm
+from .forms import ItemCreateForm, ItemImportForm, ItemSearchForm, ShipmentBatchShipForm, ShipmentCreateForm, ShipmentShipForm, ShipmentItemFormset, CompanyCreateForm
+from .imports import READ_ERRORS, ImportResult, ItemImporter, guess_format, open_uploaded_file, read_rows
+from .pagination import paginate
+from .packing import get_max_units, plan_shipment
+from . import search
+from .shipping import ship_shipments
+from .caching import all_companies, cached_page, fragment_cache_context, item_company, remember_item_company, url_company
+from .conditional import conditional_page, item_list_validators, shipment_list_validators
+from .exports import DATE_FILTERS, EXPORT_CONTENT_TYPES, EXPORT_FORMATS, ExportError, build_export_queryset, export_rows
 
 from django.utils import timezone
 
@@ -14,6 +23,10 @@ from django.utils import timezone
     Function based views
 """
 
+# The columns that the item & shipment lists can be sorted by
+ITEM_SORT_FIELDS = ['id', 'sku', 'product_name', 'quantity_available', 'date_created', 'date_last_modified']
+SHIPMENT_SORT_FIELDS = ['id', 'date_created', 'date_promised']
+
 # Create your views here.
 def landing_page(request):
     """
@@ -23,22 +36,73 @@ def landing_page(request):
     return render(request, 'inventory/home.html', {})
 
 
+@conditional_page(item_list_validators)
+@cached_page('item-list', all_companies)
 def view_all_items(request):
     """
         The following function handles requests to view all items
         currently present in Logitrack.
     """
 
-    items = Item.objects.all()
+    # Items are displayed one page at a time, and only counted when the
+    # user asks for the total
+    page = paginate(request, Item.objects.select_related('company'), ITEM_SORT_FIELDS, 'id')
 
     context = {
-        'items': items,
-        'itemCount': items.count()
+        'items': page,
+        'page': page,
+        'itemCount': page.total,
+        **fragment_cache_context(),
     }
 
     return render(request, 'inventory/items-list.html', context=context)
 
 
+def item_search(request):
+    """
+        The following function handles the item search box: items whose SKU
+        starts with the query or whose product name matches it, best match
+        first, optionally within a single company.
+    """
+    form = ItemSearchForm(request.GET or None)
+    query = ''
+    results = []
+    if form.is_valid():
+        query = form.cleaned_data['q']
+        results = search.search_items(query, company=form.cleaned_data['company'])
+
+    context = {
+        'form': form,
+        'query': query,
+        'results': results,
+    }
+    return render(request, 'inventory/items/item_search.html', context=context)
+
+
+def export_data(request, dataset, file_format):
+    """
+        The following function streams an export of items, shipments or
+        shipment lines as CSV or NDJSON. The export can be filtered with the
+        company, created_after, created_before, shipped_after and
+        shipped_before query parameters.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise Http404("Unsupported export format")
+
+    filters = {name: request.GET.get(name) for name in DATE_FILTERS}
+    try:
+        queryset = build_export_queryset(dataset, company=request.GET.get('company'), **filters)
+    except ExportError as error:
+        return HttpResponseBadRequest(str(error))
+
+    response = StreamingHttpResponse(
+        export_rows(dataset, queryset, file_format),
+        content_type=EXPORT_CONTENT_TYPES[file_format]
+    )
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (dataset, file_format)
+    return response
+
+
 '''
     Item Views
 
@@ -56,6 +120,7 @@ class ItemCreateView(CreateView):
 
 
 
+@method_decorator(cached_page('item-detail', item_company), name='dispatch')
 class ItemDetailView(DetailView):
     """
         The following class implements the READ/DETAIL view for a single item.
@@ -75,7 +140,10 @@ class ItemDetailView(DetailView):
             If the item does not exist, a 404 response is returned.
         """
         item_id = self.kwargs.get("id")
-        return get_object_or_404(Item, id=item_id)
+        item = get_object_or_404(Item.objects.select_related('reorder_suggestion'), id=item_id)
+        # The page is cached once its company is known
+        remember_item_company(item)
+        return item
 
 
 class ItemUpdateView(UpdateView):
@@ -106,7 +174,11 @@ class ItemUpdateView(UpdateView):
         item_id = self.kwargs.get("id")
         item_company = Item.objects.filter(id=item_id).values('company').distinct()
 
-        context['shipments'] = Shipment.objects.filter(company__in=item_company)
+        # The lines of every shipment, with their item & its company (which
+        # the item's name includes), are read with one query each
+        context['shipments'] = Shipment.objects.filter(company__in=item_company).prefetch_related(
+            'shipmentitem_set__item__company'
+        )
 
         return context
 
@@ -141,6 +213,28 @@ class ItemDeleteView(DeleteView):
             return HttpResponseForbidden("You cannot delete this item. Validate whether it is on shipments, and try again")
 
 
+class ItemImportView(FormView):
+    """
+        The following class allows users to upload a CSV or NDJSON file of
+        items to be created in bulk. The rows are imported as the file is
+        read, and a summary of the import is displayed once it completes.
+    """
+    template_name = 'inventory/items/item_import.html'
+    form_class = ItemImportForm
+
+    def form_valid(self, form):
+        import_file = form.cleaned_data['import_file']
+        file_format = form.cleaned_data['file_format'] or guess_format(import_file.name)
+
+        result = ImportResult()
+        try:
+            ItemImporter().run(read_rows(open_uploaded_file(import_file), file_format), result)
+        except READ_ERRORS as error:
+            form.add_error('import_file', result.read_error_message(error))
+
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
 '''
     Company Views
 
@@ -168,21 +262,29 @@ class CompanyDetailView(DetailView):
 
     def get_object(self):
         company_id = self.kwargs.get("company")
-        return get_object_or_404(Company, id=company_id)
+        # The inventory totals are read from the company's precomputed summary
+        return get_object_or_404(Company.objects.select_related('inventory_summary'), id=company_id)
 
+@method_decorator(cached_page('company-list', all_companies), name='dispatch')
 class CompanyListView(ListView):
     """
-        The following view displays a list of companies within Logitrack
+        The following view displays a list of companies within Logitrack,
+        along with their inventory totals
     """
     model = Company
     template_name='inventory/companies/company_list.html'
 
+    def get_queryset(self):
+        return Company.objects.select_related('inventory_summary').order_by('name')
+
 
 '''
     Shipment Views
 
 '''
 
+@method_decorator(conditional_page(shipment_list_validators), name='dispatch')
+@method_decorator(cached_page('shipment-list', url_company), name='dispatch')
 class ShipmentListView(ListView):
     """
         This provides VIEW (list) functionality for all Shipment instances
@@ -192,10 +294,21 @@ class ShipmentListView(ListView):
     template_name = 'inventory/shipments/shipment_list.html'
 
     def get_queryset(self):
-        # We only display
-        print(self.kwargs['company'])
+        # We only display the shipments of the company, one page at a time
         self.company = get_object_or_404(Company, id=self.kwargs['company'])
-        return Shipment.objects.filter(company=self.company)
+        self.page = paginate(
+            self.request,
+            Shipment.objects.filter(company=self.company).with_totals(),
+            SHIPMENT_SORT_FIELDS,
+            '-date_created'
+        )
+        return self.page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super(ShipmentListView, self).get_context_data(**kwargs)
+        context['page'] = self.page
+        context.update(fragment_cache_context())
+        return context
 
 
 class ShipmentCreateView(CreateView):
@@ -230,6 +343,10 @@ class ShipmentShipView(UpdateView):
     form_class = ShipmentShipForm
     model = Shipment
 
+    def get_queryset(self):
+        # Displays the total weight & volume of the shipment
+        return Shipment.objects.with_totals()
+
     pk_url_kwarg='shipmentid'
 
     def get_initial(self):
@@ -242,9 +359,14 @@ class ShipmentShipView(UpdateView):
 
         # Display the items on the shipment that is being marked as shipped
         shipmentid = self.kwargs.get("shipmentid")
-        shipmentItems = ShipmentItem.objects.filter(shipment=shipmentid)
+        shipmentItems = ShipmentItem.objects.filter(shipment=shipmentid).select_related('item')
         context['shipmentItems'] = shipmentItems
 
+        # Suggest how to pack the shipment's units into boxes & pallets
+        # (None when the shipment has too many units to plan)
+        context['packing_plan'] = plan_shipment(self.object)
+        context['packing_max_units'] = get_max_units()
+
         return context
 
     def form_valid(self, form):
@@ -271,6 +393,10 @@ class ShipmentReceiveView(UpdateView):
     template_name = 'inventory/shipments/shipment_receive.html'
     form_class = ShipmentShipForm
     model = Shipment
+
+    def get_queryset(self):
+        # Displays the total weight & volume of the shipment
+        return Shipment.objects.with_totals()
     pk_url_kwarg='shipmentid'
 
     def get_initial(self):
@@ -285,7 +411,7 @@ class ShipmentReceiveView(UpdateView):
         # in the event that they try to change the 'is_shippable' property
         # to false when there are pending shipments
         shipmentid = self.kwargs.get("shipmentid")
-        shipmentItems = ShipmentItem.objects.filter(shipment=shipmentid)
+        shipmentItems = ShipmentItem.objects.filter(shipment=shipmentid).select_related('item')
         context['shipmentItems'] = shipmentItems
         return context
 
@@ -308,6 +434,52 @@ class ShipmentReceiveView(UpdateView):
 
 
 
+class ShipmentBatchShipView(FormView):
+    """
+        The following class allows to ship a company's outbound shipments, or
+        receive its inbound shipments, many at a time (for example, all of
+        the shipments leaving the dock at the end of the day). A summary of
+        the result of each shipment is displayed once the batch completes.
+    """
+    template_name = 'inventory/shipments/shipment_batch_ship.html'
+    form_class = ShipmentBatchShipForm
+
+    def dispatch(self, request, *args, **kwargs):
+        self.company = get_object_or_404(Company, id=self.kwargs['company'])
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_initial(self):
+        initial = super().get_initial()
+        initial['date_shipped'] = timezone.now()
+        initial['direction'] = self.request.GET.get('direction', 'OUT')
+        return initial
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['company'] = self.company
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['company'] = self.company
+        return context
+
+    def form_valid(self, form):
+        shipments = form.cleaned_data['shipments']
+        result = ship_shipments(
+            [shipment.pk for shipment in shipments] if shipments else None,
+            company=self.company,
+            cutoff=form.cleaned_data['cutoff'],
+            direction=form.cleaned_data['direction'],
+            date_shipped=form.cleaned_data['date_shipped'],
+        )
+
+        # A new form, as the shipped shipments are no longer selectable
+        form = self.get_form_class()(initial=self.get_initial(), company=self.company)
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
+
 class ShipmentEditItemView(SingleObjectMixin, FormView):
     """
         The following class allows for multiple ShipmentItems to be both
@@ -326,18 +498,19 @@ class ShipmentEditItemView(SingleObjectMixin, FormView):
         """ This function is used to display inventory levels on the form """
 
         context = super().get_context_data(**kwargs)
-        company_id = context['object'].company
 
-        context['items'] = Item.objects.filter(company=company_id)
+        # The inbound & allocated quantities are the totals stored on each
+        # item, so the table is read with a single query
+        context['items'] = Item.objects.filter(company=self.object.company_id)
 
         return context
 
     def get(self, request, *args, **kwargs):
-        self.object = self.get_object(queryset=Shipment.objects.all())
+        self.object = self.get_object(queryset=Shipment.objects.select_related('company'))
         return super().get(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
-        self.object = self.get_object(queryset=Shipment.objects.all())
+        self.object = self.get_object(queryset=Shipment.objects.select_related('company'))
         return super().post(request, *args, **kwargs)
 
     def get_form(self, form_class=None):
@@ -0,0 +1,147 @@
+"""
+    The following module implements a request-scoped identity map of model
+    instances, used to dereference foreign keys.
+
+    Within a request, the same Company, Shipment or Item is often loaded many
+    times through different foreign keys: each shipment line loads its
+    shipment and its item, each item loads its company, and so on. Django
+    caches a related object on the instance that loaded it, but not across
+    instances, so every line of a shipment loads the shipment again.
+
+    While an identity map is active (see identity_map, and the
+    IdentityMapMiddleware of logitrack/middleware.py), the first access to a
+    foreign key loads the related object as usual, and keeps it in the map.
+    Every following access to a foreign key pointing to the same row, from
+    any instance, returns that same object without a query. Only the models
+    listed in the LOGITRACK_IDENTITY_MAP_MODELS setting are mapped, through
+    the foreign key descriptors replaced by install.
+
+    Objects saved or deleted through the ORM are evicted from the map, but
+    rows changed with queryset.update() or raw SQL are not: the map only
+    lives for a single request, and is opt-in (LOGITRACK_IDENTITY_MAP).
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.db import router
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+from django.db.models.signals import post_delete, post_save
+
+
+_current = ContextVar('identity_map', default=None)
+
+
+class IdentityMap:
+    """
+        The instances loaded through foreign keys during a request, by model,
+        database and primary key, with the number of foreign key accesses
+        served from the map (hits) or from the database (misses), by model.
+    """
+    def __init__(self):
+        self.instances = {}
+        self.hits = Counter()
+        self.misses = Counter()
+
+    @staticmethod
+    def key(model, db, pk):
+        return (model._meta.label, db, pk)
+
+    def get(self, model, db, pk):
+        """ Returns the mapped instance, or None, and counts the hit or miss """
+        instance = self.instances.get(self.key(model, db, pk))
+        if instance is None:
+            self.misses[model._meta.label] += 1
+        else:
+            self.hits[model._meta.label] += 1
+        return instance
+
+    def add(self, instance):
+        self.instances[self.key(type(instance), instance._state.db, instance.pk)] = instance
+
+    def evict(self, instance):
+        self.instances.pop(self.key(type(instance), instance._state.db, instance.pk), None)
+
+    def stats(self):
+        """ Returns the number of hits & misses, in total and by model """
+        return {
+            'hits': sum(self.hits.values()),
+            'misses': sum(self.misses.values()),
+            'models': {
+                label: {'hits': self.hits[label], 'misses': self.misses[label]}
+                for label in sorted(set(self.hits) | set(self.misses))
+            },
+        }
+
+
+def current_identity_map():
+    """ Returns the active IdentityMap, or None """
+    return _current.get()
+
+
+@contextmanager
+def identity_map():
+    """
+        Activates a new identity map for the duration of the block (nested
+        blocks share the outer map), and yields it.
+    """
+    current = _current.get()
+    if current is not None:
+        yield current
+        return
+
+    token = _current.set(IdentityMap())
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+class IdentityMapDescriptor(ForwardManyToOneDescriptor):
+    """
+        The descriptor of a foreign key (e.g. ShipmentItem.item) to a mapped
+        model. When the related object isn't cached on the instance yet, it's
+        looked up in the active identity map before querying the database.
+    """
+    def get_object(self, instance):
+        current = _current.get()
+        if current is None or not self.field.target_field.primary_key:
+            return super().get_object(instance)
+
+        model = self.field.remote_field.model
+        db = router.db_for_read(model, instance=instance)
+        pk = getattr(instance, self.field.attname)
+
+        rel_obj = current.get(model, db, pk)
+        if rel_obj is None:
+            rel_obj = super().get_object(instance)
+            current.add(rel_obj)
+        return rel_obj
+
+
+def evict_instance(sender, instance, **kwargs):
+    """ Drops saved & deleted instances from the active map, which may hold another copy of them """
+    current = _current.get()
+    if current is not None:
+        current.evict(instance)
+
+
+def install(model_labels):
+    """
+        Replaces the descriptors of the foreign keys to the given models
+        ('app_label.ModelName'), of every installed model, with
+        IdentityMapDescriptors. Called once the models are loaded (see
+        InventoryConfig.ready).
+    """
+    mapped = {apps.get_model(label) for label in model_labels}
+
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if field.many_to_one and field.concrete and field.related_model in mapped:
+                if not isinstance(model.__dict__.get(field.name), IdentityMapDescriptor):
+                    setattr(model, field.name, IdentityMapDescriptor(field))
+
+    for model in mapped:
+        post_save.connect(evict_instance, sender=model, dispatch_uid='identity_map_save_%s' % model._meta.label)
+        post_delete.connect(evict_instance, sender=model, dispatch_uid='identity_map_delete_%s' % model._meta.label)
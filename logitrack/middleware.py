@@ -0,0 +1,187 @@
+"""
+    The following module implements the query instrumentation middleware of
+    Logitrack.
+
+    For each request, every query run on any database connection is recorded
+    (through Django's connection.execute_wrapper), so that the number of
+    queries, the time spent in the database and the queries that are run
+    more than once (usually the sign of an N+1 query in a loop) can be
+    reported without attaching a debugger.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from .identity import identity_map
+
+
+logger = logging.getLogger('logitrack.queries')
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+        Returns a short identifier of a query's SQL. Parameters are passed
+        separately from the SQL, so the same query run with different values
+        (such as a lookup by id in a loop) has the same fingerprint.
+    """
+    normalized = WHITESPACE.sub(' ', sql).strip()
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()[:8]
+
+
+class QueryRecorder:
+    """
+        An execute wrapper (see connection.execute_wrapper) that counts and
+        times the queries run through it.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.statements.setdefault(key, sql)
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+    def duplicates(self):
+        """ Returns the (fingerprint, count) pairs of the queries run more than once, most frequent first """
+        return [(key, count) for key, count in self.fingerprints.most_common() if count > 1]
+
+
+@contextmanager
+def record_queries():
+    """
+        Records the queries run on all database connections for the duration
+        of the block, and yields the QueryRecorder.
+    """
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def get_budgets():
+    """ Returns the query count & SQL time (ms) budgets of a request. None disables a budget. """
+    return (
+        getattr(settings, 'LOGITRACK_QUERY_BUDGET', None),
+        getattr(settings, 'LOGITRACK_SQL_TIME_BUDGET_MS', None),
+    )
+
+
+class QueryInstrumentationMiddleware:
+    """
+        Records the queries of each request, and:
+            - adds them to the response's Server-Timing header, when the
+              LOGITRACK_SERVER_TIMING setting is True,
+            - logs them as a JSON line to the logitrack.queries logger, at
+              INFO level when the LOGITRACK_QUERY_LOG setting is True,
+            - logs a warning for requests that run more queries than
+              LOGITRACK_QUERY_BUDGET, or spend more time in the database than
+              LOGITRACK_SQL_TIME_BUDGET_MS.
+
+        The body of a streaming response is generated after the middleware
+        has returned, so the queries run while streaming it aren't recorded.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        query_budget, time_budget = get_budgets()
+        over_budget = (
+            (query_budget is not None and recorder.count > query_budget) or
+            (time_budget is not None and recorder.duration_ms > time_budget)
+        )
+
+        if getattr(settings, 'LOGITRACK_SERVER_TIMING', False):
+            response['Server-Timing'] = self.server_timing(request, recorder, total_ms, over_budget)
+
+        log_queries = getattr(settings, 'LOGITRACK_QUERY_LOG', False)
+        if over_budget or log_queries:
+            record = self.log_record(request, response, recorder, total_ms, over_budget)
+            level = logging.WARNING if over_budget else logging.INFO
+            logger.log(level, json.dumps(record))
+
+        return response
+
+    def server_timing(self, request, recorder, total_ms, over_budget):
+        metrics = [
+            'db;dur=%.1f;desc="%s queries"' % (recorder.duration_ms, recorder.count),
+            'dup;desc="%s duplicated queries"' % sum(count - 1 for key, count in recorder.duplicates()),
+            'total;dur=%.1f' % total_ms,
+        ]
+        request_map = getattr(request, 'identity_map', None)
+        if request_map is not None:
+            stats = request_map.stats()
+            metrics.append('idmap;desc="%s hits, %s misses"' % (stats['hits'], stats['misses']))
+        page_cache = getattr(request, 'page_cache', None)
+        if page_cache is not None:
+            metrics.append('cache;desc="%s"' % page_cache)
+        if over_budget:
+            metrics.append('budget;desc="over budget"')
+        return ', '.join(metrics)
+
+    def log_record(self, request, response, recorder, total_ms, over_budget):
+        resolver_match = getattr(request, 'resolver_match', None)
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': resolver_match.view_name if resolver_match else None,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'sql_ms': round(recorder.duration_ms, 3),
+            'total_ms': round(total_ms, 3),
+            'duplicates': [
+                {'fingerprint': key, 'count': count, 'sql': recorder.statements[key]}
+                for key, count in recorder.duplicates()
+            ],
+            'identity_map': request.identity_map.stats() if getattr(request, 'identity_map', None) else None,
+            'page_cache': getattr(request, 'page_cache', None),
+            'over_budget': over_budget,
+        }
+
+
+class IdentityMapMiddleware:
+    """
+        Activates an identity map (see logitrack/identity.py) for each
+        request when the LOGITRACK_IDENTITY_MAP setting is True, so that
+        repeated foreign key accesses to the same Company, Shipment or Item
+        within the request run a single query. The map is cleared at the end
+        of the request, and kept as request.identity_map for the query
+        instrumentation middleware, which reports its hits & misses.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'LOGITRACK_IDENTITY_MAP', False):
+            return self.get_response(request)
+
+        with identity_map() as request_map:
+            request.identity_map = request_map
+            return self.get_response(request)
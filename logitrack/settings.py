@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'logitrack.middleware.QueryInstrumentationMiddleware',
+    'logitrack.middleware.IdentityMapMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +84,30 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+#
+# The pages cache keeps the rendered item, company & shipment lists (see
+# inventory/caching.py). Local memory is per process: in production, use a
+# cache shared by the processes, e.g. files:
+#     'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#     'LOCATION': '/var/tmp/logitrack_pages',
+# or a Redis server (which needs the redis package):
+#     'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#     'LOCATION': 'redis://127.0.0.1:6379/1',
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'logitrack-pages',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -122,3 +148,67 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Logitrack settings
+
+# The default & maximum number of rows displayed per page in the item and
+# shipment lists. Users can pick a page size with the page_size query parameter.
+LOGITRACK_PAGE_SIZE = 50
+LOGITRACK_MAX_PAGE_SIZE = 500
+
+# The maximum number of shipment lines (or shipments) that can be sent in a
+# single request to the API's batch endpoints
+LOGITRACK_API_MAX_BATCH_SIZE = 1000
+
+# The query instrumentation middleware (see logitrack/middleware.py) logs a
+# warning for requests that run more queries, or spend more time in the
+# database (in milliseconds) than these budgets. Set a budget to None to
+# disable it.
+LOGITRACK_QUERY_BUDGET = 50
+LOGITRACK_SQL_TIME_BUDGET_MS = 500
+
+# Whether to report each request's queries in a Server-Timing header, which
+# is shown in the network tab of the browser's developer tools
+LOGITRACK_SERVER_TIMING = DEBUG
+
+# Whether to log every request's queries to the logitrack.queries logger,
+# rather than only the requests over budget
+LOGITRACK_QUERY_LOG = False
+
+# Whether each request keeps the companies, shipments & items it loads
+# through foreign keys in an identity map (see logitrack/identity.py), so
+# that loading the same row again through another foreign key runs no query.
+# The map's hits & misses are reported with the request's queries.
+LOGITRACK_IDENTITY_MAP = False
+LOGITRACK_IDENTITY_MAP_MODELS = ['inventory.Company', 'inventory.Shipment', 'inventory.Item']
+
+# The cache (an alias of CACHES) keeping the rendered item list, item pages,
+# company list & shipment lists, or None to disable the page cache, and how
+# long (in seconds) a page is kept. Pages are invalidated when the items,
+# shipments & companies they display change (see inventory/caching.py).
+LOGITRACK_PAGE_CACHE = 'pages'
+LOGITRACK_PAGE_CACHE_TIMEOUT = 5 * 60
+
+# How long (in seconds) the rows of the item & shipment lists are cached, in
+# the page cache (or the default cache, if it's disabled). Rows are keyed on
+# the item's or shipment's date_last_modified, so a changed row gets a new key.
+LOGITRACK_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# The boxes & pallets available to pack outbound shipments (see
+# inventory/packing.py), with their inside dimensions in meters and the
+# maximum weight of their contents in kilograms
+LOGITRACK_PACKING_CONTAINERS = [
+    {'name': 'Small box', 'dimensions': (0.3, 0.3, 0.3), 'max_weight': 20},
+    {'name': 'Medium box', 'dimensions': (0.6, 0.4, 0.4), 'max_weight': 30},
+    {'name': 'Large box', 'dimensions': (0.8, 0.6, 0.6), 'max_weight': 40},
+    {'name': 'Pallet', 'dimensions': (1.2, 1.0, 1.5), 'max_weight': 1000},
+]
+
+# How long (in seconds) packing plans are cached. Plans are cached by the
+# contents of the shipment, so a changed shipment gets a new plan.
+LOGITRACK_PACKING_CACHE_TIMEOUT = 60 * 60
+
+# The most units a shipment may have to get a packing plan. Plans are
+# computed during the request, which takes a few seconds past this size.
+LOGITRACK_PACKING_MAX_UNITS = 2000
@@ -0,0 +1,46 @@
+"""
+    Test helpers shared by Logitrack's test suites.
+"""
+from django.test import override_settings
+
+from .middleware import record_queries
+
+
+class QueryBudgetMixin:
+    """
+        A TestCase mixin to assert how many queries a page runs, so that N+1
+        queries introduced in a view fail the tests. Duplicated queries (the
+        same SQL run more than once) are listed in the failure message.
+    """
+
+    def assertQueryBudget(self, url, max_queries, max_duplicates=None, method='get', data=None):
+        """
+            Requests url with the test client, and fails if the request runs
+            more than max_queries queries, or if any query is run more than
+            max_duplicates + 1 times. Returns the response. The page is
+            rendered, rather than read from the page cache.
+        """
+        with override_settings(LOGITRACK_PAGE_CACHE=None), record_queries() as recorder:
+            response = getattr(self.client, method)(url, data=data)
+            # Queries of a streaming response are run as it is read
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+        duplicates = recorder.duplicates()
+        details = '\n'.join(
+            "  %sx %s" % (count, recorder.statements[key]) for key, count in duplicates
+        )
+
+        if recorder.count > max_queries:
+            self.fail(
+                "%s ran %s queries, over its budget of %s. Duplicated queries:\n%s"
+                % (url, recorder.count, max_queries, details or "  (none)")
+            )
+
+        if max_duplicates is not None and duplicates and duplicates[0][1] - 1 > max_duplicates:
+            self.fail(
+                "%s ran the same query %s times. Duplicated queries:\n%s"
+                % (url, duplicates[0][1], details)
+            )
+
+        return response